@@ -0,0 +1,121 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+CONTENT_VERSION_KEY = 'foodgram:content-version'
+POPULARITY_VERSION_KEY = 'foodgram:popularity-version'
+HITS_KEY = 'foodgram:response-cache:hits'
+MISSES_KEY = 'foodgram:response-cache:misses'
+
+
+def increment(key):
+    # add() ничего не делает, если ключ уже есть, поэтому incr() не упадёт.
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Ключ успели вытеснить между add() и incr().
+        cache.set(key, 1, None)
+        return 1
+
+
+def get_content_version():
+    return cache.get_or_set(CONTENT_VERSION_KEY, 1, None)
+
+
+def bump_content_version():
+    """Делает недействительными все закэшированные ответы разом."""
+    return increment(CONTENT_VERSION_KEY)
+
+
+def get_popularity_version():
+    return cache.get_or_set(POPULARITY_VERSION_KEY, 1, None)
+
+
+def bump_popularity_version():
+    """Меняет ETag и ключи кэша списков, упорядоченных по популярности.
+
+    Счётчики избранного не трогают updated_at и версию контента, а порядок
+    по ним меняют: переход избранного между рецептами сохраняет и число
+    рецептов, и сумму счётчиков.
+    """
+    return increment(POPULARITY_VERSION_KEY)
+
+
+def get_cache_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+        'version': get_content_version(),
+    }
+
+
+def build_cache_key(request, version, etag=''):
+    # Порядок параметров в строке запроса не влияет на ответ.
+    params = sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values
+    )
+    raw = '|'.join([
+        request.build_absolute_uri(request.path),
+        '&'.join(f'{key}={value}' for key, value in params),
+        request.accepted_renderer.format,
+        etag,
+    ])
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f'foodgram:response:{version}:{digest}'
+
+
+class AnonymousResponseCacheMixin:
+    """Кэширует ответы list/retrieve для анонимных GET-запросов.
+
+    Для анонимов ответ зависит только от адреса и строки запроса, поэтому
+    ключ строится из них и глобальной версии контента. Версию повышают
+    сигналы из ``api.signals`` при любом изменении данных, попадающих в ответ.
+
+    Версия хранится в кэше Django, поэтому изменения, сделанные в одном
+    процессе, видны другим, только если кэш общий (REDIS_URL в settings).
+    С LocMemCache по умолчанию кэш корректен лишь при одном процессе:
+    остальные отдавали бы устаревшие ответы до RESPONSE_CACHE_TIMEOUT.
+    """
+
+    def _is_cacheable(self, request):
+        return request.method == 'GET' and not request.user.is_authenticated
+
+    def _cached_response(self, request, handler, *args, **kwargs):
+        if not self._is_cacheable(request):
+            return handler(request, *args, **kwargs)
+
+        # ETag от ConditionalGetMixin (если он стоит раньше в MRO) учитывает
+        # и то, что не повышает версию, например порядок по популярности.
+        key = build_cache_key(
+            request, get_content_version(), getattr(self, 'response_etag', '')
+        )
+        data = cache.get(key)
+        if data is not None:
+            increment(HITS_KEY)
+            response = Response(data)
+            response['X-Cache'] = 'HIT'
+            return response
+
+        increment(MISSES_KEY)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(
+            request, super().retrieve, *args, **kwargs
+        )
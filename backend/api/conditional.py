@@ -0,0 +1,108 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .relations import get_user_relations
+
+
+class ConditionalGetMixin:
+    """ETag / Last-Modified для list и retrieve с ответом 304.
+
+    Валидаторы считаются одним агрегирующим запросом (COUNT и MAX по полю
+    ``updated_at``) по тому же отфильтрованному queryset, что и ответ, —
+    без сериализации страницы. Для авторизованных пользователей в ETag
+    добавляются их связи из ``user_relations`` (избранное, покупки, подписки).
+    Last-Modified отдаётся только для детального ответа анонимам: в списках
+    удаление записи не сдвигает максимум ``updated_at``.
+    """
+
+    last_modified_field = 'updated_at'
+    # Имена множеств UserRelations, от которых зависит ответ.
+    user_relations = ()
+
+    def get_relations_fingerprint(self, request):
+        if not request.user.is_authenticated or not self.user_relations:
+            return ''
+        relations = get_user_relations({'request': request}).load_all()
+        return ';'.join(
+            ','.join(map(str, sorted(getattr(relations, name))))
+            for name in self.user_relations
+        )
+
+    def get_etag_parts(self):
+        """Версии данных вне updated_at, от которых зависит ответ."""
+        return []
+
+    def get_validators(self, request, queryset):
+        stats = queryset.order_by().aggregate(
+            count=Count('pk'),
+            last_modified=Max(self.last_modified_field),
+        )
+        last_modified = stats['last_modified']
+        raw = '|'.join([
+            str(stats['count']),
+            *map(str, self.get_etag_parts()),
+            last_modified.isoformat() if last_modified else '',
+            request.accepted_renderer.format,
+            str(request.user.pk or ''),
+            self.get_relations_fingerprint(request),
+        ])
+        etag = f'W/"{hashlib.md5(raw.encode()).hexdigest()}"'
+        return etag, stats['count'], last_modified
+
+    def _conditional_response(
+        self, request, queryset, detail, handler, *args, **kwargs
+    ):
+        etag, count, last_modified = self.get_validators(request, queryset)
+        self.response_etag = etag
+        if not detail:
+            self.known_count = count
+        if detail and not count:
+            # Пусть обработчик сам вернёт 404.
+            return handler(request, *args, **kwargs)
+
+        use_last_modified = (
+            detail and last_modified is not None
+            and not request.user.is_authenticated
+        )
+        timestamp = (
+            int(last_modified.timestamp()) if use_last_modified else None
+        )
+        not_modified = get_conditional_response(
+            request._request, etag=etag, last_modified=timestamp
+        )
+        if not_modified is not None:
+            return not_modified
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        # Пагинатор возьмёт готовое число записей вместо повторного COUNT.
+        self.known_count = None
+        cursor_param = getattr(self.paginator, 'cursor_query_param', None)
+        if cursor_param in request.query_params:
+            # Курсорные страницы не считают COUNT по всей выборке.
+            return super().list(request, *args, **kwargs)
+        return self._conditional_response(
+            request, queryset, False, super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: kwargs[lookup_url_kwarg]}
+            )
+        except (TypeError, ValueError):
+            return super().retrieve(request, *args, **kwargs)
+        return self._conditional_response(
+            request, queryset, True, super().retrieve, *args, **kwargs
+        )
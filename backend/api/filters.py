@@ -0,0 +1,23 @@
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.settings import api_settings
+
+from food.search import search_recipes
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    """Полнотекстовый поиск рецептов по ?search= с ранжированием.
+
+    Без явного ?ordering= результаты сортируются по релевантности.
+    """
+
+    search_param = api_settings.SEARCH_PARAM
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        queryset = search_recipes(queryset, query)
+        ranked = 'search_rank' in queryset.query.annotations
+        if ranked and 'ordering' not in request.query_params:
+            queryset = queryset.order_by('search_rank', 'name', 'id')
+        return queryset
@@ -0,0 +1,90 @@
+import hashlib
+from array import array
+from bisect import bisect_left, bisect_right
+
+from food.models import Ingredient
+
+
+class IngredientIndex:
+    """Компактный индекс названий ингредиентов в памяти процесса.
+
+    Названия в нижнем регистре отсортированы и склеены в одну строку:
+    префиксный поиск — два бинарных поиска, поиск подстроки — str.find
+    по склеенной строке, без обращения к базе.
+    """
+
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda row: (row[1].lower(), row[0]))
+        self.ids = array('q', (row[0] for row in rows))
+        self.names = [row[1] for row in rows]
+        self.units = [row[2] for row in rows]
+        self.keys = [name.lower() for name in self.names]
+        self.blob = '\n'.join(self.keys)
+        self.offsets = array('q')
+        position = 0
+        for key in self.keys:
+            self.offsets.append(position)
+            position += len(key) + 1
+        self.positions = {
+            ingredient_id: index
+            for index, ingredient_id in enumerate(self.ids)
+        }
+        # Одинаковая у всех процессов с одинаковыми данными, идёт в ETag.
+        self.signature = hashlib.md5(
+            '\n'.join(
+                f'{row[0]}\t{row[1]}\t{row[2]}' for row in rows
+            ).encode()
+        ).hexdigest()
+
+    @classmethod
+    def load(cls):
+        rows = Ingredient.objects.values_list('id', 'name', 'measurement_unit')
+        return cls(rows.iterator())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, ingredient_id):
+        return ingredient_id in self.positions
+
+    def lookup(self, ingredient_id):
+        """(название, единица измерения) или None, если id неизвестен."""
+        index = self.positions.get(ingredient_id)
+        if index is None:
+            return None
+        return self.names[index], self.units[index]
+
+    def row(self, index):
+        return {
+            'id': self.ids[index],
+            'name': self.names[index],
+            'measurement_unit': self.units[index],
+        }
+
+    def search(self, query, limit=None):
+        """Сначала совпадения по началу названия, затем по подстроке.
+
+        Внутри каждой группы — по алфавиту.
+        """
+        limit = len(self) if limit is None else limit
+        query = query.replace('\n', ' ').strip().lower()
+        if not query:
+            return [self.row(index) for index in range(min(limit, len(self)))]
+
+        low = bisect_left(self.keys, query)
+        high = bisect_left(self.keys, query + '\uffff', low)
+        found = list(range(low, min(high, low + limit)))
+
+        position = 0
+        while len(found) < limit:
+            position = self.blob.find(query, position)
+            if position < 0:
+                break
+            index = bisect_right(self.offsets, position) - 1
+            if not low <= index < high:
+                found.append(index)
+            # Следующее совпадение ищем уже в следующем названии.
+            if index + 1 >= len(self.offsets):
+                break
+            position = self.offsets[index + 1]
+        return [self.row(index) for index in found]
@@ -1,11 +1,189 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldError, ValidationError
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPaginationMixin:
+    """Необязательный режим курсорной (keyset) пагинации.
+
+    Включается параметром ``?cursor=`` (пустое значение — первая страница).
+    Страница выбирается условием ``(поля сортировки) > (последняя позиция)``
+    вместо ``OFFSET``, без ``COUNT(*)``, поэтому N-я страница стоит столько же,
+    сколько первая, и не «съезжает» при вставке новых записей.
+    Без параметра ``cursor`` работает обычная постраничная пагинация.
+    """
+
+    cursor_query_param = 'cursor'
+    # Порядок по умолчанию, если у queryset нет своей сортировки.
+    keyset_ordering = ('id',)
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def django_paginator_class(self, object_list, per_page):
+        paginator = DjangoPaginator(object_list, per_page)
+        if self.known_count is not None:
+            # Число записей уже посчитано вместе с валидаторами ETag.
+            paginator.count = self.known_count
+        return paginator
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset_mode = self.cursor_query_param in request.query_params
+        if not self.keyset_mode:
+            self.known_count = getattr(view, 'known_count', None)
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_keyset_ordering(queryset)
+        position, reverse = self.decode_cursor(request)
+        if position is not None:
+            position = self.parse_position(queryset, position)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [self.invert(field) for field in ordering]
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(ordering, position))
+
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.page = results
+        if reverse:
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        return results
+
+    def get_keyset_ordering(self, queryset):
+        ordering = list(queryset.query.order_by) or list(self.keyset_ordering)
+        # Последним полем должен быть уникальный ключ,
+        # иначе позиция неоднозначна.
+        if ordering[-1].lstrip('-') not in ('id', 'pk'):
+            ordering.append('id')
+        return ordering
+
+    @staticmethod
+    def invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def keyset_filter(ordering, position):
+        # Лексикографическое сравнение кортежа полей:
+        # (a > x) OR (a = x AND b > y) OR ...
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def get_position(self, item):
+        return [getattr(item, field.lstrip('-')) for field in self.ordering]
 
-class RecipePagination(PageNumberPagination):
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            position, reverse = data['p'], bool(data.get('r'))
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if (
+            not isinstance(position, list)
+            or len(position) != len(self.ordering)
+        ):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def parse_position(self, queryset, position):
+        """Приводит позицию из курсора к типам полей сортировки.
+
+        Курсор приходит от клиента: значение не того типа (строка вместо id)
+        иначе упало бы в filter() ошибкой 500, а не 404.
+        """
+        query = queryset.query.chain()
+        parsed = []
+        for field, value in zip(self.ordering, position):
+            try:
+                ref = query.resolve_ref(field.lstrip('-'))
+                value = ref.output_field.to_python(value)
+            except (FieldError, ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            parsed.append(value)
+        return parsed
+
+    def encode_cursor(self, position, reverse):
+        data = {'p': position}
+        if reverse:
+            data['r'] = 1
+        encoded = base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.keyset_mode:
+            return super().get_next_link()
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), False)
+
+    def get_previous_link(self):
+        if not self.keyset_mode:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[0]), True)
+
+    def get_paginated_response(self, data):
+        if not self.keyset_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class RecipePagination(KeysetPaginationMixin, PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
     max_page_size = 100
+    keyset_ordering = ('name', 'id')
 
-class SubscriptionPagination(PageNumberPagination):
+
+class SubscriptionPagination(KeysetPaginationMixin, PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
     max_page_size = 100
+    keyset_ordering = ('id',)
+
+
+class FeedPagination(KeysetPaginationMixin, PageNumberPagination):
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    # feed_id уникален в ленте (см. food/feeds.py), id добавлять не нужно.
+    keyset_ordering = ('-feed_id',)
+
+    def get_keyset_ordering(self, queryset):
+        return list(self.keyset_ordering)
@@ -0,0 +1,302 @@
+"""Поиск «что приготовить из того, что есть» (?have=).
+
+Инвертированный индекс в памяти процесса: ингредиент -> множество
+рецептов с ним. Редкие ингредиенты хранятся отсортированным массивом id,
+частые — битовой маской (целое число, бит = id рецепта): так меньше
+памяти и быстрее слияние. Покрытие рецепта — сколько его ингредиентов
+есть в запросе — считается побитовым сложением масок запрошенных
+ингредиентов (счётчик хранится по разрядам, ``slices[i]`` — i-й бит),
+без SQL и без цикла по рецептам. Затем рецепты выбираются уровнями
+(покрыто c из s ингредиентов) в порядке убывания доли c / s: пересечение
+маски «покрыто ровно c» с маской рецептов из s ингредиентов.
+
+Индекс загружается один раз и дальше обновляется по рецептам, у которых
+изменился updated_at: при смене версии кэша ответов (то есть после любой
+записи через API или админку) и не реже раза в SYNC_INTERVAL секунд.
+Обновляется копия индекса, которая затем подменяет прежний целиком:
+запросы в других потоках дочитывают свой снимок без блокировки.
+Удаление рецепта повышает счётчик удалений в кэше; заметив его,
+синхронизация убирает из индекса рецепты, которых больше нет в базе,
+чтобы они не занимали места среди MAX_RESULTS лучших.
+"""
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import timedelta
+from functools import reduce
+from itertools import groupby
+from operator import or_
+
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.utils import timezone
+
+from food.models import Recipe, RecipeIngredient
+from .cache import get_content_version, increment
+
+# Сколько рецептов с лучшим покрытием участвует в выдаче.
+MAX_RESULTS = 1000
+# Изменённые рецепты ищутся с запасом: updated_at выставляется до коммита.
+SYNC_OVERLAP = timedelta(seconds=60)
+SYNC_INTERVAL = 60
+# Массив id занимает 8 байт на рецепт, маска — бит на каждый id вообще:
+# маска выгоднее, когда ингредиент есть больше чем в 1/64 рецептов.
+BITSET_DENSITY = 64
+DELETIONS_KEY = 'foodgram:pantry:deletions'
+
+NONZERO_BYTE = re.compile(rb'[^\x00]')
+
+
+def to_bitset(recipe_ids):
+    if not len(recipe_ids):
+        return 0
+    buffer = bytearray((max(recipe_ids) >> 3) + 1)
+    for recipe_id in recipe_ids:
+        buffer[recipe_id >> 3] |= 1 << (recipe_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def first_bits(bitset, limit):
+    """Номера первых limit установленных битов, по возрастанию."""
+    data = bitset.to_bytes((bitset.bit_length() + 7) >> 3, 'little')
+    found = []
+    for match in NONZERO_BYTE.finditer(data):
+        base = match.start() << 3
+        value = data[match.start()]
+        found.extend(base + bit for bit in range(8) if value >> bit & 1)
+        if len(found) >= limit:
+            break
+    return found[:limit]
+
+
+class PantryIndex:
+
+    def __init__(self, rows):
+        """rows — пары (id рецепта, id ингредиента) по возрастанию рецепта."""
+        postings = {}
+        sizes = {}
+        self.sizes = array('H')
+        for recipe_id, group in groupby(rows, key=lambda row: row[0]):
+            size = 0
+            for _, ingredient_id in group:
+                posting = postings.setdefault(ingredient_id, array('q'))
+                posting.append(recipe_id)
+                size += 1
+            self.set_size(recipe_id, size)
+            sizes.setdefault(size, array('q')).append(recipe_id)
+        threshold = len(self.sizes) // BITSET_DENSITY
+        self.postings = {
+            ingredient_id: (
+                to_bitset(posting) if len(posting) > threshold else posting
+            )
+            for ingredient_id, posting in postings.items()
+        }
+        # Число ингредиентов -> маска рецептов с таким числом.
+        self.by_size = {size: to_bitset(ids) for size, ids in sizes.items()}
+
+    @classmethod
+    def load(cls):
+        rows = (
+            RecipeIngredient.objects.order_by('recipe_id', 'ingredient_id')
+            .values_list('recipe_id', 'ingredient_id')
+            .iterator(chunk_size=5000)
+        )
+        return cls(rows)
+
+    def copy(self):
+        """Копия для обновления; replace() не меняет общие с ней массивы."""
+        clone = PantryIndex.__new__(PantryIndex)
+        clone.postings = dict(self.postings)
+        clone.by_size = dict(self.by_size)
+        clone.sizes = array('H', self.sizes)
+        return clone
+
+    def recipe_ids(self):
+        """Маска всех рецептов индекса."""
+        return reduce(or_, self.by_size.values(), 0)
+
+    def set_size(self, recipe_id, size):
+        missing = recipe_id + 1 - len(self.sizes)
+        if missing > 0:
+            self.sizes.frombytes(bytes(self.sizes.itemsize * missing))
+        self.sizes[recipe_id] = size
+
+    def replace(self, recipe_id, ingredient_ids):
+        """Новый состав рецепта; пустой — рецепт убирается из индекса."""
+        ingredient_ids = set(ingredient_ids)
+        bit = 1 << recipe_id
+        for ingredient_id, posting in self.postings.items():
+            wanted = ingredient_id in ingredient_ids
+            if isinstance(posting, int):
+                posting = posting | bit if wanted else posting & ~bit
+                self.postings[ingredient_id] = posting
+                continue
+            # Массив не правится на месте: он общий с прежним снимком,
+            # который могут читать другие потоки.
+            position = bisect_left(posting, recipe_id)
+            present = (
+                position < len(posting) and posting[position] == recipe_id
+            )
+            if present and not wanted:
+                self.postings[ingredient_id] = (
+                    posting[:position] + posting[position + 1:]
+                )
+            elif wanted and not present:
+                self.postings[ingredient_id] = (
+                    posting[:position] + array('q', [recipe_id])
+                    + posting[position:]
+                )
+        for ingredient_id in ingredient_ids - self.postings.keys():
+            self.postings[ingredient_id] = array('q', [recipe_id])
+
+        old_size = self.sizes[recipe_id] if recipe_id < len(self.sizes) else 0
+        if old_size:
+            self.by_size[old_size] &= ~bit
+        if ingredient_ids:
+            size = len(ingredient_ids)
+            self.by_size[size] = self.by_size.get(size, 0) | bit
+        self.set_size(recipe_id, len(ingredient_ids))
+
+    def covered(self, have):
+        """Разряды счётчика покрытия: slices[i] — рецепты с i-м битом."""
+        slices = []
+        for ingredient_id in set(have):
+            posting = self.postings.get(ingredient_id)
+            if posting is None:
+                continue
+            carry = posting if isinstance(posting, int) else to_bitset(posting)
+            # Прибавляем единицу всем рецептам из carry, с переносом.
+            for position, current in enumerate(slices):
+                slices[position], carry = current ^ carry, current & carry
+                if not carry:
+                    break
+            if carry:
+                slices.append(carry)
+        return slices
+
+    @staticmethod
+    def level_key(level):
+        covered, size = level
+        return -covered / size, size - covered
+
+    def rank(self, have, max_missing=None, limit=MAX_RESULTS):
+        """id рецептов, лучше всего покрытых ингредиентами have.
+
+        Порядок: доля имеющихся ингредиентов, затем меньше недостающих,
+        затем id. max_missing — сколько ингредиентов может не хватать.
+        """
+        slices = self.covered(have)
+        if not slices:
+            return []
+        any_covered = reduce(or_, slices)
+        most = (1 << len(slices)) - 1
+        levels = sorted(
+            (
+                (covered, size) for size in self.by_size
+                for covered in range(1, min(size, most) + 1)
+                if max_missing is None or size - covered <= max_missing
+            ),
+            key=self.level_key,
+        )
+        exactly = {}
+        found = []
+        # Уровни с одинаковыми долей и недостачей (1 из 1, 2 из 2, ...)
+        # объединяются, чтобы внутри них порядок был по id.
+        for _, group in groupby(levels, key=self.level_key):
+            matched = 0
+            for covered, size in group:
+                if covered not in exactly:
+                    mask = any_covered
+                    for position, current in enumerate(slices):
+                        bit = covered >> position & 1
+                        mask &= current if bit else ~current
+                    exactly[covered] = mask
+                matched |= exactly[covered] & self.by_size[size]
+            if matched:
+                found.extend(first_bits(matched, limit - len(found)))
+                if len(found) >= limit:
+                    break
+        return found
+
+
+class PantrySearch:
+    """Индекс процесса и его досинхронизация с базой."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._version = None
+        self._synced_at = 0.0
+        self._watermark = None
+        self._deletions = None
+
+    def _changed_recipes(self):
+        watermark = timezone.now() - SYNC_OVERLAP
+        changed = list(
+            Recipe.objects.filter(updated_at__gte=self._watermark)
+            .values_list('id', flat=True)
+        )
+        contents = {recipe_id: [] for recipe_id in changed}
+        rows = (
+            RecipeIngredient.objects.filter(recipe_id__in=changed)
+            .values_list('recipe_id', 'ingredient_id')
+        )
+        for recipe_id, ingredient_id in rows:
+            contents[recipe_id].append(ingredient_id)
+        self._watermark = watermark
+        return contents
+
+    def _deleted_recipes(self, index):
+        existing = list(
+            Recipe.objects.values_list('id', flat=True)
+            .iterator(chunk_size=5000)
+        )
+        stale = index.recipe_ids() & ~to_bitset(existing)
+        return first_bits(stale, bin(stale).count('1'))
+
+    def get(self):
+        version = get_content_version()
+        index = self._index
+        fresh = time.monotonic() - self._synced_at < SYNC_INTERVAL
+        if index is not None and self._version == version and fresh:
+            return index
+        with self._lock:
+            if self._index is None:
+                self._watermark = timezone.now() - SYNC_OVERLAP
+                self._deletions = cache.get(DELETIONS_KEY, 0)
+                self._index = PantryIndex.load()
+            elif self._index is index:
+                updated = index.copy()
+                changed = self._changed_recipes()
+                for recipe_id, ingredient_ids in changed.items():
+                    updated.replace(recipe_id, ingredient_ids)
+                deletions = cache.get(DELETIONS_KEY, 0)
+                if deletions != self._deletions:
+                    for recipe_id in self._deleted_recipes(updated):
+                        updated.replace(recipe_id, [])
+                    self._deletions = deletions
+                self._index = updated
+            self._version = version
+            self._synced_at = time.monotonic()
+            return self._index
+
+    def warm_up(self):
+        try:
+            self.get()
+        except DatabaseError:
+            pass
+
+
+pantry = PantrySearch()
+
+
+def recipes_deleted():
+    """Отмечает удаление рецептов для индексов всех процессов."""
+    increment(DELETIONS_KEY)
+
+
+def parse_have(value):
+    """Список id из ?have=1,2,3; нечисловые значения пропускаются."""
+    return [int(part) for part in value.split(',') if part.strip().isdigit()]
@@ -0,0 +1,120 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import DatabaseError
+
+from food.models import Tag
+from .ingredient_index import IngredientIndex
+
+TagRow = namedtuple('TagRow', ['id', 'name', 'slug', 'bit'])
+
+
+class Snapshot:
+    """Справочник, загруженный в память процесса целиком.
+
+    Версия — случайная метка в общем кэше: сигналы меняют её при изменении
+    таблицы, и каждый процесс перечитывает справочник при следующем
+    обращении. Даже без сигнала (другой процесс с LocMemCache, загрузка
+    в обход ORM) данные перечитываются не реже чем раз в ``max_age`` секунд.
+    """
+
+    def __init__(self, version_key, loader, max_age=300):
+        self.version_key = version_key
+        self.loader = loader
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._value = None
+        self._version = None
+        self._loaded_at = 0.0
+
+    def version(self):
+        # Случайная метка, а не счётчик: после очистки или вытеснения из кэша
+        # она не совпадёт с той, под которой собран снимок.
+        return cache.get_or_set(self.version_key, uuid.uuid4().hex, None)
+
+    def invalidate(self):
+        cache.set(self.version_key, uuid.uuid4().hex, None)
+
+    def get(self):
+        version = self.version()
+        value = self._value
+        fresh = time.monotonic() - self._loaded_at < self.max_age
+        if value is not None and self._version == version and fresh:
+            return value
+        with self._lock:
+            if self._value is value:
+                self._value = self.loader()
+                self._version = version
+                self._loaded_at = time.monotonic()
+            return self._value
+
+
+class TagCatalog:
+    """Все теги: по id, по slug, по биту в Recipe.tags_mask."""
+
+    def __init__(self, rows):
+        self.rows = sorted(TagRow(*row) for row in rows)
+        self.by_id = {row.id: row for row in self.rows}
+        self.by_bit = {
+            row.bit: row for row in self.rows if row.bit is not None
+        }
+        # slug -> бит, как ждёт food.tag_masks.filter_by_tags
+        self.bits = {row.slug: row.bit for row in self.rows}
+        # Если бит есть у всех тегов, теги рецепта восстанавливаются по маске.
+        self.fully_masked = len(self.by_bit) == len(self.rows)
+        self.signature = hashlib.md5(repr(self.rows).encode()).hexdigest()
+
+    @classmethod
+    def load(cls):
+        return cls(Tag.objects.values_list('id', 'name', 'slug', 'bit'))
+
+    def __contains__(self, tag_id):
+        return tag_id in self.by_id
+
+    def instance(self, tag_id):
+        # Как будто загружен из базы: годится для tags.set() и сравнения.
+        return Tag.from_db('default', TagRow._fields, self.by_id[tag_id])
+
+    @staticmethod
+    def represent(row):
+        return {'id': row.id, 'name': row.name, 'slug': row.slug}
+
+    def represent_all(self):
+        return [self.represent(row) for row in self.rows]
+
+    def represent_mask(self, mask):
+        return [
+            self.represent(row) for row in self.rows
+            if row.bit is not None and mask >> row.bit & 1
+        ]
+
+
+tag_catalog = Snapshot('foodgram:tags-version', TagCatalog.load)
+ingredient_catalog = Snapshot(
+    'foodgram:ingredients-version', IngredientIndex.load
+)
+
+
+def get_catalogs(context):
+    """Справочники для сериализатора, один раз на корневой сериализатор."""
+    catalogs = context.get('reference_catalogs')
+    if catalogs is None:
+        catalogs = context['reference_catalogs'] = (
+            tag_catalog.get(), ingredient_catalog.get()
+        )
+    return catalogs
+
+
+def warm_up():
+    """Загружает справочники при старте процесса: первый запрос не ждёт."""
+    try:
+        tag_catalog.get()
+        ingredient_catalog.get()
+    except DatabaseError:
+        # База ещё не готова (например, миграции не применены) —
+        # справочники загрузятся при первом запросе.
+        pass
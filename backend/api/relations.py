@@ -0,0 +1,113 @@
+from django.db.models import IntegerField, Value
+
+from food.models import Favorite, ShoppingCart, Subscription
+
+# Порядок совпадает с порядком запросов в UNION из load_all().
+RELATION_SOURCES = (
+    ('_favorite_ids', Favorite, 'author', 'recipe_id'),
+    ('_cart_ids', ShoppingCart, 'author', 'recipe_id'),
+    ('_subscription_ids', Subscription, 'user', 'author_id'),
+)
+
+
+class UserRelations:
+    """Связи текущего пользователя в рамках одного запроса.
+
+    Множества id избранных рецептов, рецептов в списке покупок и авторов,
+    на которых подписан пользователь, загружаются лениво, одним запросом
+    каждое, и дальше проверяются в памяти. Если у рецепта уже есть
+    аннотации из ``RecipeViewSet.get_queryset``, берём значение из них.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._favorite_ids = None
+        self._cart_ids = None
+        self._subscription_ids = None
+
+    @property
+    def is_authenticated(self):
+        return self.user is not None and self.user.is_authenticated
+
+    def load_all(self):
+        """Загружает все три множества одним запросом (UNION ALL)."""
+        if all(getattr(self, attribute) is not None
+               for attribute, *_ in RELATION_SOURCES):
+            return self
+        sets = [set() for _ in RELATION_SOURCES]
+        if self.is_authenticated:
+            queries = [
+                model.objects.filter(**{user_field: self.user})
+                .annotate(kind=Value(index, output_field=IntegerField()))
+                .values_list('kind', value_field)
+                for index, (_, model, user_field, value_field)
+                in enumerate(RELATION_SOURCES)
+            ]
+            for kind, value in queries[0].union(*queries[1:], all=True):
+                sets[kind].add(value)
+        for (attribute, *_), values in zip(RELATION_SOURCES, sets):
+            setattr(self, attribute, frozenset(values))
+        return self
+
+    def _load(self, model, user_field, value_field):
+        if not self.is_authenticated:
+            return frozenset()
+        return frozenset(
+            model.objects.filter(**{user_field: self.user})
+            .values_list(value_field, flat=True)
+        )
+
+    @property
+    def favorite_ids(self):
+        if self._favorite_ids is None:
+            self._favorite_ids = self._load(Favorite, 'author', 'recipe_id')
+        return self._favorite_ids
+
+    @property
+    def cart_ids(self):
+        if self._cart_ids is None:
+            self._cart_ids = self._load(ShoppingCart, 'author', 'recipe_id')
+        return self._cart_ids
+
+    @property
+    def subscription_ids(self):
+        if self._subscription_ids is None:
+            self._subscription_ids = self._load(
+                Subscription, 'user', 'author_id'
+            )
+        return self._subscription_ids
+
+    def assume_subscribed(self, author_ids):
+        """Подписки уже известны (страница подписок) — без запроса к базе.
+
+        Достаточно, если дальше проверяются только эти авторы.
+        """
+        if self._subscription_ids is None:
+            self._subscription_ids = frozenset(author_ids)
+
+    def is_favorited(self, recipe):
+        annotated = getattr(recipe, 'is_recipe_favorited', None)
+        if annotated is not None:
+            return bool(annotated)
+        return recipe.pk in self.favorite_ids
+
+    def is_in_shopping_cart(self, recipe):
+        annotated = getattr(recipe, 'is_in_user_shopping_cart', None)
+        if annotated is not None:
+            return bool(annotated)
+        return recipe.pk in self.cart_ids
+
+    def is_subscribed(self, author):
+        return author.pk in self.subscription_ids
+
+
+def get_user_relations(context):
+    """Возвращает UserRelations, общий для всех сериализаторов запроса."""
+    request = context.get('request')
+    if request is None:
+        return UserRelations(None)
+    relations = getattr(request, '_user_relations', None)
+    if relations is None:
+        relations = UserRelations(getattr(request, 'user', None))
+        request._user_relations = relations
+    return relations
@@ -2,10 +2,50 @@ import base64
 
 from rest_framework import serializers, status
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from rest_framework.exceptions import PermissionDenied
 from food.models import Ingredient, Tag, Recipe, Subscription, Favorite, ShoppingCart, RecipeIngredient, RecipeTag
+from food.author_stats import get_stats
+from food.images import FORMATS, RENDITIONS
+from food.signals import deferred_recipe_refresh, recipe_ingredients_changed
+from food.tag_masks import mask_of
 from users.models import User
 from rest_framework.response import Response
+from .relations import get_user_relations
+from .reference import get_catalogs, tag_catalog
+from .signals import invalidate_response_cache
+from .subscriptions import get_recipes_limit
+
+
+def rendition_urls(request, recipe):
+    """Ссылки на копии фотографии рецепта; None, пока копии не построены."""
+    renditions = recipe.image_renditions
+    if not renditions or renditions.get('source') != recipe.image.name:
+        return None
+    urls = {'lqip': renditions['lqip']}
+    for name in RENDITIONS:
+        entry = renditions[name]
+        urls[name] = {'width': entry['width'], 'height': entry['height']}
+        for fmt in FORMATS:
+            urls[name][fmt] = request.build_absolute_uri(
+                default_storage.url(entry[fmt])
+            )
+    return urls
+
+
+def card_image_url(request, recipe):
+    """Фотография для карточки рецепта: копия card, пока её нет — оригинал."""
+    if not recipe.image:
+        return None
+    renditions = recipe.image_renditions
+    if renditions and renditions.get('source') == recipe.image.name:
+        return request.build_absolute_uri(
+            default_storage.url(renditions['card']['jpeg'])
+        )
+    return request.build_absolute_uri(recipe.image.url)
+
 
 class Base64ImageField(serializers.ImageField):
 
@@ -38,6 +78,20 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'slug']
 
 
+class CachedTagField(serializers.PrimaryKeyRelatedField):
+    """Тег по id из справочника в памяти; в базу — только при промахе."""
+
+    def to_internal_value(self, data):
+        catalog = tag_catalog.get()
+        try:
+            tag_id = int(data)
+        except (TypeError, ValueError):
+            return super().to_internal_value(data)
+        if tag_id not in catalog:
+            return super().to_internal_value(data)
+        return catalog.instance(tag_id)
+
+
 class RecipeIngredientSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(source='ingredient.id')
 
@@ -45,10 +99,18 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         model = RecipeIngredient
         fields = ['id', 'amount']
 
+    def to_representation(self, instance):
+        # Без обращения к instance.ingredient: id уже есть в строке.
+        return {'id': instance.ingredient_id, 'amount': instance.amount}
+
 
 class RecipeSerializer(serializers.ModelSerializer):
-    ingredients = RecipeIngredientSerializer(many=True, source='recipe_ingredients')
-    tags = serializers.PrimaryKeyRelatedField(many=True, queryset=Tag.objects.all(), write_only=True)
+    ingredients = RecipeIngredientSerializer(
+        many=True, source='recipe_ingredients'
+    )
+    tags = CachedTagField(
+        many=True, queryset=Tag.objects.all(), write_only=True
+    )
     image = Base64ImageField(required=True)  # Поле image обязательно
     author = serializers.ReadOnlyField(source='author.username')
     is_favorited = serializers.SerializerMethodField()
@@ -67,31 +129,57 @@ class RecipeSerializer(serializers.ModelSerializer):
             return {
                 'id': instance.id,
                 'name': instance.name,
-                'image': request.build_absolute_uri(instance.image.url) if instance.image else None,
+                'image': card_image_url(request, instance),
                 'cooking_time': instance.cooking_time,
             }
 
-        # Для остальных запросов возвращаем полное представление
+        # Для остальных запросов возвращаем полное представление.
+        # Строки ингредиентов нужны дважды (поле и список ниже):
+        # читаем их один раз.
+        prefetch_related_objects([instance], 'recipe_ingredients')
         representation = super().to_representation(instance)
-        representation['tags'] = TagSerializer(instance.tags.all(), many=True).data
+        tags, ingredients = get_catalogs(self.context)
+        prefetched = getattr(instance, '_prefetched_objects_cache', {})
+        if 'tags' not in prefetched and tags.fully_masked:
+            # Теги восстанавливаются по tags_mask, без запроса к recipe_tags.
+            representation['tags'] = tags.represent_mask(instance.tags_mask)
+        else:
+            representation['tags'] = TagSerializer(
+                instance.tags.all(), many=True
+            ).data
         representation['author'] = {
             'id': instance.author.id,
             'username': instance.author.username,
             'first_name': instance.author.first_name,
             'last_name': instance.author.last_name,
             'email': instance.author.email,
-            'is_subscribed': instance.author.is_subscribed,
+            'is_subscribed': get_user_relations(self.context).is_subscribed(
+                instance.author
+            ),
             'avatar': instance.author.avatar.url if instance.author.avatar else None,
         }
-        representation['ingredients'] = [
-            {
-                'id': ingredient.ingredient.id,
-                'name': ingredient.ingredient.name,
-                'measurement_unit': ingredient.ingredient.measurement_unit,
+        representation['ingredients'] = []
+        for ingredient in instance.recipe_ingredients.all():
+            # Название и единица — из справочника, при промахе — из базы.
+            found = ingredients.lookup(ingredient.ingredient_id)
+            if found is None:
+                found = (
+                    ingredient.ingredient.name,
+                    ingredient.ingredient.measurement_unit,
+                )
+            representation['ingredients'].append({
+                'id': ingredient.ingredient_id,
+                'name': found[0],
+                'measurement_unit': found[1],
                 'amount': ingredient.amount,
-            }
-            for ingredient in instance.recipe_ingredients.all()
-        ]
+            })
+
+        # Копии фотографии; в списке image — лёгкая копия для карточки.
+        if request:
+            representation['images'] = rendition_urls(request, instance)
+            view = self.context.get('view')
+            if getattr(view, 'action', None) in ('list', 'feed', 'similar'):
+                representation['image'] = card_image_url(request, instance)
 
         return representation
 
@@ -100,20 +188,31 @@ class RecipeSerializer(serializers.ModelSerializer):
         if not ingredients:
             raise serializers.ValidationError("Поле ingredients не может быть пустым.")
         
-        ingredient_ids = []
-        for ingredient_data in ingredients:
-            if ingredient_data['amount'] < 1:
-                raise serializers.ValidationError("Количество ингредиента должно быть больше 0.")
-            if ingredient_data['ingredient']['id'] in ingredient_ids:
-                raise serializers.ValidationError("Ингредиенты не должны повторяться.")
-            ingredient_ids.append(ingredient_data['ingredient']['id'])
-
-            # Проверка существования ингредиента
-            try:
-                Ingredient.objects.get(id=ingredient_data['ingredient']['id'])
-            except Ingredient.DoesNotExist:
-                raise serializers.ValidationError(f"Ингредиент с ID {ingredient_data['ingredient']['id']} не найден.")
-        
+        if any(item['amount'] < 1 for item in ingredients):
+            raise serializers.ValidationError(
+                "Количество ингредиента должно быть больше 0."
+            )
+        ingredient_ids = [item['ingredient']['id'] for item in ingredients]
+        if len(set(ingredient_ids)) != len(ingredient_ids):
+            raise serializers.ValidationError(
+                "Ингредиенты не должны повторяться."
+            )
+
+        # Проверка существования ингредиентов: по справочнику в памяти,
+        # неизвестные ему id (например, только что добавленные) — одним
+        # запросом id__in.
+        catalog = get_catalogs(self.context)[1]
+        unknown = {pk for pk in ingredient_ids if pk not in catalog}
+        if unknown:
+            unknown -= set(
+                Ingredient.objects.filter(id__in=unknown)
+                .values_list('id', flat=True)
+            )
+        if unknown:
+            raise serializers.ValidationError(
+                f"Ингредиент с ID {min(unknown)} не найден."
+            )
+
         return ingredients
 
     def validate_tags(self, tags):
@@ -128,20 +227,81 @@ class RecipeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Время готовки должно быть больше 0.")
         return cooking_time
 
+    @staticmethod
+    def create_ingredients(recipe, ingredients_data):
+        # bulk_create не отправляет post_save, поэтому индекс поиска
+        # и updated_at обновляем сами, один раз на рецепт.
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient_data['ingredient']['id'],
+                amount=ingredient_data['amount'],
+            )
+            for ingredient_data in ingredients_data
+        ])
+        # Нового рецепта ещё нет ни в одной корзине: списки покупок не трогаем.
+        recipe_ingredients_changed([recipe.pk])
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('recipe_ingredients')
         tags_data = validated_data.pop('tags', [])
         recipe = Recipe.objects.create(**validated_data)
-
-        for ingredient_data in ingredients_data:
-            ingredient_id = ingredient_data['ingredient']['id']
-            ingredient_amount = ingredient_data['amount']
-            ingredient_instance = Ingredient.objects.get(id=ingredient_id)
-            RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient_instance, amount=ingredient_amount)
-
-        recipe.tags.set(tags_data)
+        self.create_ingredients(recipe, ingredients_data)
+
+        # Рецепт новый, сравнивать с текущими тегами (как делает set) незачем.
+        recipe.tags.add(*tags_data)
+        # Маску в базе пересчитывает сигнал, здесь — копия для ответа.
+        recipe.tags_mask = mask_of(
+            tag.bit for tag in tags_data if tag.bit is not None
+        )
         return recipe
 
+    def update_ingredients(self, recipe, ingredients_data):
+        """Приводит ингредиенты рецепта к ingredients_data по разнице.
+
+        Изменённые количества — одним bulk_update, новые строки — одним
+        bulk_create, лишние — одним DELETE; совпадающие не трогаются.
+        Возвращает True, если что-то изменилось.
+        """
+        prefetch_related_objects([recipe], 'recipe_ingredients')
+        current = {
+            row.ingredient_id: row for row in recipe.recipe_ingredients.all()
+        }
+        wanted = {
+            ingredient_data['ingredient']['id']: ingredient_data['amount']
+            for ingredient_data in ingredients_data
+        }
+        removed = [row.pk for pk, row in current.items() if pk not in wanted]
+        changed = []
+        for pk, row in current.items():
+            if pk in wanted and row.amount != wanted[pk]:
+                row.amount = wanted[pk]
+                changed.append(row)
+        added = [
+            RecipeIngredient(recipe=recipe, ingredient_id=pk, amount=amount)
+            for pk, amount in wanted.items() if pk not in current
+        ]
+        if not (removed or changed or added):
+            return False
+
+        with deferred_recipe_refresh():
+            if removed:
+                RecipeIngredient.objects.filter(pk__in=removed).delete()
+            if changed:
+                RecipeIngredient.objects.bulk_update(changed, ['amount'])
+            if added:
+                RecipeIngredient.objects.bulk_create(added)
+            recipe_ingredients_changed(
+                [recipe.pk],
+                [row.ingredient_id for row in changed + added]
+                + [pk for pk, row in current.items() if pk not in wanted],
+            )
+        # Ответ должен показать новый состав.
+        recipe._prefetched_objects_cache.pop('recipe_ingredients', None)
+        return True
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('recipe_ingredients', [])
         tags_data = validated_data.pop('tags', [])
@@ -151,39 +311,39 @@ class RecipeSerializer(serializers.ModelSerializer):
         if not tags_data:
             raise serializers.ValidationError("Поле tags не может быть пустым.")
 
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get('cooking_time', instance.cooking_time)
-        instance.image = validated_data.get('image', instance.image)
-        instance.save()
-
-        if ingredients_data:
-            RecipeIngredient.objects.filter(recipe=instance).delete()
-            for ingredient_data in ingredients_data:
-                ingredient_id = ingredient_data['ingredient']['id']
-                ingredient_amount = ingredient_data['amount']
-                RecipeIngredient.objects.create(
-                    recipe=instance,
-                    ingredient_id=ingredient_id,
-                    amount=ingredient_amount
-                )
-
-        if tags_data:
-            instance.tags.set(tags_data)
+        # Сохраняем только изменившиеся поля; если их нет — рецепт не пишем.
+        changed_fields = [
+            field for field in ('name', 'text', 'cooking_time', 'image')
+            if field in validated_data
+            and (
+                field == 'image'
+                or getattr(instance, field) != validated_data[field]
+            )
+        ]
+        for field in changed_fields:
+            setattr(instance, field, validated_data[field])
+        if changed_fields:
+            instance.save(update_fields=[*changed_fields, 'updated_at'])
+
+        if self.update_ingredients(instance, ingredients_data):
+            # bulk-операции не отправляют сигналов, на которые подписан
+            # кэш ответов, поэтому сбрасываем его сами.
+            invalidate_response_cache()
+
+        # set() сам сравнивает с текущими тегами
+        # и ничего не пишет без изменений.
+        instance.tags.set(tags_data)
+        instance.tags_mask = mask_of(
+            tag.bit for tag in tags_data if tag.bit is not None
+        )
 
         return instance
 
     def get_is_favorited(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Favorite.objects.filter(author=request.user, recipe=obj).exists()
-        return False
+        return get_user_relations(self.context).is_favorited(obj)
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return ShoppingCart.objects.filter(author=request.user, recipe=obj).exists()
-        return False
+        return get_user_relations(self.context).is_in_shopping_cart(obj)
 
 
     def validate(self, data):
@@ -196,16 +356,25 @@ class RecipeSerializer(serializers.ModelSerializer):
 class UserSerializer(serializers.ModelSerializer):
     avatar = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField()
+    # Счётчики берутся из AuthorStats, рецепты и подписки не пересчитываются.
+    recipes_count = serializers.SerializerMethodField()
+    subscribers_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
-        fields = ['email', 'id', 'username', 'first_name', 'last_name', 'is_subscribed', 'avatar']
+        fields = [
+            'email', 'id', 'username', 'first_name', 'last_name',
+            'is_subscribed', 'avatar', 'recipes_count', 'subscribers_count',
+        ]
+
+    def get_recipes_count(self, obj):
+        return get_stats(obj).recipes_count
+
+    def get_subscribers_count(self, obj):
+        return get_stats(obj).subscribers_count
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Subscription.objects.filter(user=request.user, author=obj).exists()
-        return False
+        return get_user_relations(self.context).is_subscribed(obj)
 
     def get_avatar(self, obj):
         request = self.context.get('request')
@@ -221,26 +390,23 @@ class UserSerializer(serializers.ModelSerializer):
 
 
         if request and ('subscriptions' in request.path or 'subscribe' in request.path):
-            # Добавляем рецепты и их количество только для подписок
-            recipes = Recipe.objects.filter(author=instance)
-            recipes_limit = request.query_params.get('recipes_limit', None)
-            if recipes_limit is not None:
-                try:
-                    recipes_limit = int(recipes_limit)
-                    recipes = recipes[:recipes_limit]  # Ограничиваем количество рецептов
-                except ValueError:
-                    # Если не удалось преобразовать в int, используем все рецепты
-                    pass
+            # Добавляем рецепты и их количество только для подписок.
+            # Страница подписок выбирает их заранее (api/subscriptions.py).
+            recipes = getattr(instance, 'recipes_preview', None)
+            if recipes is None:
+                recipes = Recipe.objects.filter(author=instance).order_by('id')
+                recipes_limit = get_recipes_limit(request)
+                if recipes_limit is not None:
+                    recipes = recipes[:recipes_limit]
             representation['recipes'] = [
                 {
                     'id': recipe.id,
                     'name': recipe.name,
-                    'image': request.build_absolute_uri(recipe.image.url) if recipe.image else None,
+                    'image': card_image_url(request, recipe),
                     'cooking_time': recipe.cooking_time,
                 }
                 for recipe in recipes
             ]
-            representation['recipes_count'] = recipes.count()
 
         return representation
 
@@ -249,12 +415,12 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
-    recipes = RecipeSerializer(many=True)
     user = serializers.StringRelatedField()
+    author = serializers.StringRelatedField()
 
     class Meta:
         model = Subscription
-        fields = ['user', 'recipes', 'recipe_count']
+        fields = ['user', 'author']
 
 class FavoriteSerializer(serializers.ModelSerializer):
     recipe = serializers.PrimaryKeyRelatedField(read_only=True)
@@ -0,0 +1,124 @@
+"""Список покупок: выдача материализованных итогов потоком."""
+import csv
+import json
+
+from django.http import StreamingHttpResponse
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import BaseRenderer
+
+from food.models import ShoppingListItem
+
+TEXT_HEADER = 'Ваш список покупок:\n'
+CSV_HEADER = ('name', 'amount', 'measurement_unit')
+# Сколько строк результата читается из курсора за раз.
+CHUNK_SIZE = 500
+
+
+def shopping_list_rows(user):
+    """Строки списка покупок пользователя из материализованных итогов.
+
+    Итоги по каждому ингредиенту поддерживает food/shopping_lists.py,
+    здесь — только выборка строк пользователя по индексу.
+    """
+    return (
+        ShoppingListItem.objects
+        .filter(user=user, amount__gt=0)
+        .order_by('ingredient__name', 'ingredient_id')
+        .values_list(
+            'ingredient__name', 'amount', 'ingredient__measurement_unit'
+        )
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+
+class Echo:
+    """Файлоподобный объект для csv.writer: возвращает строку, не копит."""
+
+    def write(self, value):
+        return value
+
+
+def render_text(rows):
+    yield TEXT_HEADER
+    for name, amount, unit in rows:
+        yield f'{name}: {amount} {unit}\n'
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def render_json(rows):
+    separator = '['
+    for name, amount, unit in rows:
+        item = {'name': name, 'amount': amount, 'measurement_unit': unit}
+        yield separator + json.dumps(item, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Нужен, чтобы DRF принял ?format=; сам файл отдаётся потоком.
+
+    Через renderer проходят только ответы с ошибками.
+    """
+
+    charset = 'utf-8'
+    generate = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict) and 'detail' in data:
+            data = data['detail']
+        return str(data).encode(self.charset)
+
+
+class ShoppingListTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    generate = staticmethod(render_text)
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    generate = staticmethod(render_csv)
+
+
+class ShoppingListJSONRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    generate = staticmethod(render_json)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+class ShoppingListNegotiation(DefaultContentNegotiation):
+    """Формат выбирается только параметром ?format=, без него — текст."""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        format_query_param = self.settings.URL_FORMAT_OVERRIDE
+        if format_suffix or request.query_params.get(format_query_param):
+            return super().select_renderer(request, renderers, format_suffix)
+        return renderers[0], renderers[0].media_type
+
+
+SHOPPING_LIST_RENDERERS = (
+    ShoppingListTextRenderer,
+    ShoppingListCSVRenderer,
+    ShoppingListJSONRenderer,
+)
+
+
+def shopping_list_response(user, renderer):
+    response = StreamingHttpResponse(
+        renderer.generate(shopping_list_rows(user)),
+        content_type=f'{renderer.media_type}; charset={renderer.charset}',
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_list.{renderer.format}"'
+    )
+    return response
@@ -0,0 +1,121 @@
+"""Короткие ссылки на рецепты.
+
+Код — id рецепта в base62, его не нужно ни генерировать, ни хранить.
+Старые ссылки из таблицы ShortLink (случайные коды ровно из шести
+символов) продолжают работать. Чтобы новые коды с ними не пересекались,
+коды из шести знаков дополняются ведущим нулём до семи.
+
+Переходы по ссылкам обслуживает LRU-кэш в памяти процесса: повторный
+переход по той же ссылке не обращается к базе. Удаление рецепта меняет
+версию в общем кэше, и процессы очищают свой LRU при следующем переходе.
+"""
+import string
+import threading
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from food.models import Recipe, ShortLink
+
+ALPHABET = string.digits + string.ascii_letters
+BASE = len(ALPHABET)
+DIGITS = {char: value for value, char in enumerate(ALPHABET)}
+LEGACY_CODE_LENGTH = 6
+# Длиннее кодов не бывает: id рецепта — BigAutoField.
+MAX_CODE_LENGTH = 12
+VERSION_KEY = 'foodgram:short-links-version'
+
+
+def encode(recipe_id):
+    """Короткий код рецепта."""
+    code = ''
+    while True:
+        recipe_id, digit = divmod(recipe_id, BASE)
+        code = ALPHABET[digit] + code
+        if not recipe_id:
+            break
+    if len(code) == LEGACY_CODE_LENGTH:
+        code = ALPHABET[0] + code
+    return code
+
+
+def decode(code):
+    """id рецепта по коду; None, если код не в новом формате."""
+    if not 0 < len(code) <= MAX_CODE_LENGTH or len(code) == LEGACY_CODE_LENGTH:
+        return None
+    value = 0
+    for char in code:
+        digit = DIGITS.get(char)
+        if digit is None:
+            return None
+        value = value * BASE + digit
+    return value
+
+
+class LinkResolver:
+    """Код ссылки -> id рецепта, с ограниченным LRU-кэшем.
+
+    Неизвестные коды не кэшируются, чтобы перебор кодов не вытеснял
+    настоящие ссылки.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def version(self):
+        return cache.get_or_set(VERSION_KEY, uuid.uuid4().hex, None)
+
+    def invalidate(self):
+        cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def resolve(self, code):
+        version = self.version()
+        with self._lock:
+            if self._version != version:
+                self._entries.clear()
+                self._version = version
+            recipe_id = self._entries.get(code)
+            if recipe_id is not None:
+                self._entries.move_to_end(code)
+                self.hits += 1
+                return recipe_id
+            self.misses += 1
+
+        recipe_id = self.lookup(code)
+        if recipe_id is None:
+            return None
+        with self._lock:
+            if self._version == version:
+                self._entries[code] = recipe_id
+                self._entries.move_to_end(code)
+                if len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return recipe_id
+
+    @staticmethod
+    def lookup(code):
+        recipe_id = decode(code)
+        if recipe_id is not None:
+            exists = Recipe.objects.filter(pk=recipe_id).exists()
+            return recipe_id if exists else None
+        return (
+            ShortLink.objects.filter(short_code=code)
+            .values_list('recipe_id', flat=True).first()
+        )
+
+
+resolver = LinkResolver(settings.SHORT_LINK_CACHE_SIZE)
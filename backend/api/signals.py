@@ -0,0 +1,91 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from food.images import renditions_ready
+from food.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShortLink, Tag
+)
+from food.signals import USER_PUBLIC_FIELDS
+from users.models import User
+from .pantry import recipes_deleted
+from .reference import ingredient_catalog, tag_catalog
+from .short_links import resolver
+from .cache import bump_content_version, bump_popularity_version
+
+
+def invalidate_response_cache():
+    # Повышаем версию только после коммита, иначе параллельный запрос может
+    # прочитать ещё старые данные и сохранить их под новой версией.
+    transaction.on_commit(bump_content_version)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def content_changed(sender, **kwargs):
+    invalidate_response_cache()
+
+
+@receiver(renditions_ready)
+def recipe_renditions_ready(sender, **kwargs):
+    invalidate_response_cache()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_response_cache()
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def favorites_changed(sender, **kwargs):
+    transaction.on_commit(bump_popularity_version)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    # Новый пользователь ещё не автор, а вход обновляет только last_login.
+    if created:
+        return
+    if (
+        update_fields is not None
+        and not USER_PUBLIC_FIELDS & set(update_fields)
+    ):
+        return
+    invalidate_response_cache()
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, **kwargs):
+    invalidate_response_cache()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    transaction.on_commit(ingredient_catalog.invalidate)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    transaction.on_commit(tag_catalog.invalidate)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, **kwargs):
+    transaction.on_commit(recipes_deleted)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=ShortLink)
+@receiver(post_delete, sender=ShortLink)
+def short_links_changed(sender, **kwargs):
+    transaction.on_commit(resolver.invalidate)
@@ -0,0 +1,50 @@
+"""Рецепты авторов для страницы подписок, одним запросом на страницу."""
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from food.models import Recipe
+
+PREVIEW_FIELDS = (
+    'id', 'author_id', 'name', 'image', 'image_renditions', 'cooking_time'
+)
+
+
+def get_recipes_limit(request):
+    """Значение ?recipes_limit=; None — без ограничения."""
+    try:
+        return max(int(request.query_params['recipes_limit']), 0)
+    except (KeyError, ValueError):
+        return None
+
+
+def attach_recipe_previews(authors, limit=None):
+    """Кладёт в author.recipes_preview первые limit рецептов каждого автора.
+
+    Первые рецепты всех авторов выбираются одним запросом с ROW_NUMBER()
+    OVER (PARTITION BY author), так что число запросов не зависит от
+    размера страницы. Количество рецептов берётся из AuthorStats.
+    """
+    previews = {author.pk: [] for author in authors}
+    if not previews or limit == 0:
+        for author in authors:
+            author.recipes_preview = previews.get(author.pk, [])
+        return authors
+    recipes = (
+        Recipe.objects
+        .filter(author_id__in=previews)
+        .only(*PREVIEW_FIELDS)
+        .order_by('author_id', 'id')
+    )
+    if limit is not None:
+        recipes = recipes.annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=F('author_id'),
+                order_by=F('id').asc(),
+            )
+        ).filter(position__lte=limit)
+    for recipe in recipes:
+        previews[recipe.author_id].append(recipe)
+    for author in authors:
+        author.recipes_preview = previews[author.pk]
+    return authors
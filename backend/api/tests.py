@@ -1,3 +1,1476 @@
-from django.test import TestCase
+import base64
+import json
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from food.models import (
+    FeedEntry, Ingredient, Tag, Recipe, RecipeIngredient, Favorite,
+    ShoppingCart, ShortLink, Subscription,
+)
+from tests.helpers import create_recipe, create_user, create_users
+from .cache import get_cache_stats, get_content_version
+from .pantry import pantry
+from .reference import warm_up
+from .short_links import decode, encode, resolver
+
+
+class RecipeQueryCountTests(TestCase):
+    """Количество SQL-запросов на списке и карточке рецепта."""
+
+    recipes_count = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tags = [
+            Tag.objects.create(name='Завтрак', slug='breakfast'),
+            Tag.objects.create(name='Обед', slug='lunch'),
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(3)
+        ]
+        for i in range(cls.recipes_count):
+            create_recipe(
+                cls.author, f'Рецепт {i:02d}', tags=cls.tags,
+                ingredients={
+                    ingredient: i + 1 for ingredient in cls.ingredients
+                },
+            )
+
+    def setUp(self):
+        cache.clear()
+        # Справочники, как в воркере, загружены при старте.
+        warm_up()
+        self.client = APIClient()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response
+
+    def test_list_query_count_does_not_depend_on_page_size(self):
+        small, _ = self.count_queries('/api/recipes/?limit=1')
+        large, response = self.count_queries(
+            f'/api/recipes/?limit={self.recipes_count}'
+        )
+        self.assertEqual(len(response.data['results']), self.recipes_count)
+        self.assertEqual(small, large)
+
+    def test_list_query_count(self):
+        # COUNT вместе с валидаторами ETag, страница рецептов с автором,
+        # ингредиенты; теги и названия ингредиентов — из справочников.
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                f'/api/recipes/?limit={self.recipes_count}'
+            )
+        recipe = response.data['results'][0]
+        self.assertEqual(len(recipe['tags']), len(self.tags))
+        self.assertEqual(len(recipe['ingredients']), len(self.ingredients))
+        self.assertEqual(recipe['author']['username'], self.author.username)
+
+    def test_tag_filtered_list_query_count(self):
+        # Биты тегов берутся из справочника; JOIN и DISTINCT не нужны.
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                '/api/recipes/?tags=breakfast&tags=lunch&limit=100'
+            )
+        self.assertEqual(response.data['count'], self.recipes_count)
+
+    def test_detail_query_count(self):
+        recipe = Recipe.objects.first()
+        # Валидаторы ETag, рецепт с автором, ингредиенты.
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            len(response.data['ingredients']), len(self.ingredients)
+        )
+
+    def test_authenticated_list_query_count(self):
+        reader = create_user('reader')
+        recipes = list(Recipe.objects.order_by('name')[:2])
+        Favorite.objects.create(author=reader, recipe=recipes[0])
+        ShoppingCart.objects.create(author=reader, recipe=recipes[1])
+        Subscription.objects.create(user=reader, author=self.author)
+        self.client.force_authenticate(reader)
+
+        small, _ = self.count_queries('/api/recipes/?limit=1')
+        large, response = self.count_queries(
+            f'/api/recipes/?limit={self.recipes_count}'
+        )
+        self.assertEqual(small, large)
+        # К анонимному плану добавляется только загрузка связей пользователя.
+        self.assertEqual(large, 4)
+
+        results = response.data['results']
+        self.assertTrue(results[0]['is_favorited'])
+        self.assertFalse(results[0]['is_in_shopping_cart'])
+        self.assertFalse(results[1]['is_favorited'])
+        self.assertTrue(results[1]['is_in_shopping_cart'])
+        self.assertTrue(
+            all(recipe['author']['is_subscribed'] for recipe in results)
+        )
+
+    def test_is_favorited_filter(self):
+        reader = create_user('reader')
+        favorite = Recipe.objects.order_by('name').first()
+        Favorite.objects.create(author=reader, recipe=favorite)
+        self.client.force_authenticate(reader)
+        limit = f'&limit={self.recipes_count}'
+
+        for value in ('1', 'true'):
+            response = self.client.get(
+                f'/api/recipes/?is_favorited={value}{limit}'
+            )
+            self.assertEqual(
+                [recipe['id'] for recipe in response.data['results']],
+                [favorite.id],
+            )
+        response = self.client.get(f'/api/recipes/?is_favorited=false{limit}')
+        self.assertEqual(response.data['count'], self.recipes_count - 1)
+        self.assertNotIn(
+            favorite.id, [recipe['id'] for recipe in response.data['results']]
+        )
+
+
+class RecipeKeysetPaginationTests(TestCase):
+    """Курсорная пагинация рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        # Одинаковые названия проверяют разрешение ничьих по id.
+        for i in range(10):
+            create_recipe(cls.author, f'Рецепт {i // 2}')
+
+    def setUp(self):
+        cache.clear()
+        # Справочники, как в воркере, загружены при старте.
+        warm_up()
+        self.client = APIClient()
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_cursor_pages_match_page_number_order(self):
+        expected = list(
+            Recipe.objects.order_by('name', 'id').values_list('id', flat=True)
+        )
+        self.assertEqual(self.walk('/api/recipes/?cursor=&limit=3'), expected)
+
+    def test_page_number_contract_is_kept(self):
+        response = self.client.get('/api/recipes/?page=2&limit=3')
+        self.assertEqual(response.data['count'], 10)
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_deep_page_costs_the_same_as_first(self):
+        with CaptureQueriesContext(connection) as first_page:
+            first = self.client.get('/api/recipes/?cursor=&limit=3')
+        with CaptureQueriesContext(connection) as next_page:
+            self.client.get(first.data['next'])
+        self.assertEqual(len(first_page), len(next_page))
+        for query in next_page.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'])
+            self.assertNotIn('OFFSET', query['sql'])
+
+    def test_inserts_do_not_shift_pages(self):
+        first = self.client.get('/api/recipes/?cursor=&limit=4')
+        seen = [recipe['id'] for recipe in first.data['results']]
+        create_recipe(self.author, 'А первый')
+        rest = self.walk(first.data['next'])
+        expected = list(
+            Recipe.objects.filter(name__gte='Рецепт')
+            .order_by('name', 'id').values_list('id', flat=True)
+        )
+        self.assertEqual(seen + rest, expected)
+
+    def test_previous_link(self):
+        first = self.client.get('/api/recipes/?cursor=&limit=3')
+        self.assertIsNone(first.data['previous'])
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_with_wrong_typed_position(self):
+        positions = (
+            ['Рецепт 1', 'abc'], ['Рецепт 1', None], ['Рецепт 1', [1]]
+        )
+        for position in positions:
+            cursor = base64.urlsafe_b64encode(
+                json.dumps({'p': position}).encode()
+            ).decode()
+            response = self.client.get(f'/api/recipes/?cursor={cursor}')
+            self.assertEqual(response.status_code, 404, position)
+        cursor = base64.urlsafe_b64encode(
+            json.dumps({'p': ['Рецепт 1', '3']}).encode()
+        ).decode()
+        response = self.client.get(f'/api/recipes/?cursor={cursor}')
+        self.assertEqual(response.status_code, 200)
+
+    def test_subscriptions_cursor(self):
+        reader = create_user('reader')
+        authors = [self.author] + create_users('author', 4)
+        for author in authors:
+            Subscription.objects.create(user=reader, author=author)
+        self.client.force_authenticate(reader)
+
+        ids = []
+        url = '/api/users/subscriptions/?cursor=&limit=2'
+        while url:
+            response = self.client.get(url)
+            self.assertNotIn('count', response.data)
+            ids.extend(user['id'] for user in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(ids, [author.id for author in authors])
+
+
+class AnonymousResponseCacheTests(TestCase):
+    """Кэш ответов для анонимных запросов и его инвалидация."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.recipe = create_recipe(cls.author, tags=[cls.tag])
+
+    def setUp(self):
+        cache.clear()
+        # Справочники, как в воркере, загружены при старте.
+        warm_up()
+        self.client = APIClient()
+
+    def test_repeated_request_is_served_from_cache(self):
+        first = self.client.get('/api/recipes/?limit=5&tags=breakfast')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        # Порядок параметров не важен; остаются только валидаторы ETag.
+        with self.assertNumQueries(1):
+            second = self.client.get('/api/recipes/?tags=breakfast&limit=5')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(get_cache_stats()['hits'], 1)
+        self.assertEqual(get_cache_stats()['misses'], 1)
+
+    def test_authenticated_requests_bypass_cache(self):
+        self.client.force_authenticate(self.author)
+        self.client.get('/api/recipes/')
+        response = self.client.get('/api/recipes/')
+        self.assertNotIn('X-Cache', response)
+
+    def test_recipe_change_invalidates_cache(self):
+        self.client.get(f'/api/recipes/{self.recipe.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = 'Новое название'
+            self.recipe.save()
+        response = self.client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['name'], 'Новое название')
+
+    def test_tag_m2m_change_invalidates_cache(self):
+        self.client.get('/api/recipes/?tags=breakfast')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.tags.clear()
+        response = self.client.get('/api/recipes/?tags=breakfast')
+        self.assertEqual(response.data['count'], 0)
+
+    def test_author_rename_invalidates_cache(self):
+        self.client.get('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Пётр'
+            self.author.save(update_fields=['first_name'])
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(
+            response.data['results'][0]['author']['first_name'], 'Пётр'
+        )
+
+    def test_login_does_not_invalidate_cache(self):
+        version = get_content_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.save(update_fields=['last_login'])
+        self.assertEqual(get_content_version(), version)
+
+
+class ConditionalGetTests(TestCase):
+    """ETag / Last-Modified и ответы 304."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        cls.recipe = create_recipe(cls.author, tags=[cls.tag])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_list_not_modified(self):
+        etag = self.client.get('/api/recipes/')['ETag']
+        # Только запрос валидаторов, без страницы и сериализации.
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                '/api/recipes/', HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_last_modified(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_ingredient_change_changes_etag(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.create(
+                recipe=self.recipe, ingredient=self.ingredient, amount=5
+            )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['ingredients']), 1)
+
+    def test_favorite_changes_etag_for_user(self):
+        self.client.force_authenticate(self.author)
+        etag = self.client.get('/api/recipes/')['ETag']
+        Favorite.objects.create(author=self.author, recipe=self.recipe)
+        response = self.client.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['results'][0]['is_favorited'])
+        self.assertNotIn('Last-Modified', response)
+
+    def test_tags_and_ingredients_not_modified(self):
+        for url in ('/api/tags/', '/api/ingredients/?name=Со'):
+            etag = self.client.get(url)['ETag']
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+
+class RecipePopularityTests(TestCase):
+    """Сортировка рецептов по количеству добавлений в избранное."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = create_users('user', 3)
+        cls.recipes = [
+            create_recipe(cls.users[0], f'Рецепт {i}')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def favorite(self, user, recipe, method='post'):
+        self.client.force_authenticate(user)
+        # Версия популярности повышается после коммита.
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(
+                f'/api/recipes/{recipe.id}/favorite/'
+            )
+        expected = 201 if method == 'post' else 204
+        self.assertEqual(response.status_code, expected)
+        self.client.force_authenticate(None)
+
+    def ids(self, response):
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_ordering_by_favorites_count(self):
+        self.favorite(self.users[0], self.recipes[2])
+        self.favorite(self.users[1], self.recipes[2])
+        self.favorite(self.users[0], self.recipes[1])
+
+        response = self.client.get('/api/recipes/?ordering=-favorites_count')
+        self.assertEqual(
+            self.ids(response),
+            [self.recipes[2].id, self.recipes[1].id, self.recipes[0].id],
+        )
+        etag = response['ETag']
+
+        # Популярность меняет порядок, поэтому и ETag.
+        self.favorite(self.users[2], self.recipes[0])
+        self.favorite(self.users[1], self.recipes[0])
+        response = self.client.get(
+            '/api/recipes/?ordering=-favorites_count',
+            HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ids(response)[0], self.recipes[0].id)
+
+    def test_moved_favorite_changes_etag_and_cache(self):
+        first, second = self.recipes[0], self.recipes[1]
+        self.favorite(self.users[0], first)
+        path = '/api/recipes/?ordering=-favorites_count'
+        response = self.client.get(path)
+        self.assertEqual(self.ids(response)[:2], [first.id, second.id])
+        etag = response['ETag']
+
+        # Число рецептов и сумма счётчиков те же, порядок — другой.
+        self.favorite(self.users[0], first, 'delete')
+        self.favorite(self.users[0], second)
+
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(self.ids(response)[:2], [second.id, first.id])
+
+
+class RecipeTagFilterTests(TestCase):
+    """Фильтрация по маске тегов совпадает с фильтрацией через связь."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', slug=f'tag{i}')
+            for i in range(3)
+        ]
+        # Все восемь сочетаний трёх тегов.
+        for combination in range(8):
+            create_recipe(author, f'Рецепт {combination}', tags=[
+                tag for i, tag in enumerate(cls.tags) if combination >> i & 1
+            ])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def names(self, query):
+        response = self.client.get(f'/api/recipes/?limit=100&{query}')
+        self.assertEqual(response.status_code, 200)
+        return {recipe['name'] for recipe in response.data['results']}
+
+    def expected(self, slugs, match_all):
+        recipes = Recipe.objects.all()
+        if match_all:
+            for slug in slugs:
+                recipes = recipes.filter(tags__slug=slug)
+        else:
+            recipes = recipes.filter(tags__slug__in=slugs)
+        return set(recipes.values_list('name', flat=True))
+
+    def test_any_of(self):
+        self.assertEqual(
+            self.names('tags=tag0&tags=tag2'),
+            self.expected(['tag0', 'tag2'], False),
+        )
+
+    def test_all_of(self):
+        self.assertEqual(
+            self.names('tags=tag0&tags=tag2&tags_mode=all'),
+            self.expected(['tag0', 'tag2'], True),
+        )
+
+    def test_unknown_tag(self):
+        self.assertEqual(self.names('tags=missing'), set())
+        self.assertEqual(
+            self.names('tags=tag1&tags=missing'),
+            self.expected(['tag1'], False),
+        )
+        self.assertEqual(
+            self.names('tags=tag1&tags=missing&tags_mode=all'), set()
+        )
+
+    def test_no_join_or_distinct(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/recipes/?tags=tag0&tags=tag1')
+        recipe_queries = [
+            query['sql'] for query in context.captured_queries
+            if 'FROM "food_recipe"' in query['sql']
+        ]
+        self.assertTrue(recipe_queries)
+        for sql in recipe_queries:
+            self.assertNotIn('DISTINCT', sql)
+            self.assertNotIn('food_recipe_tags', sql)
+
+
+class RecipeSearchTests(TestCase):
+    """Полнотекстовый поиск по ?search=."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.potato = Ingredient.objects.create(
+            name='Картофель', measurement_unit='г'
+        )
+        cls.borscht = create_recipe(
+            cls.author, 'Борщ', text='Свекла, капуста и картошка.'
+        )
+        cls.pancakes = create_recipe(
+            cls.author, 'Блины', text='Подавать с борщом не принято.'
+        )
+        cls.mash = create_recipe(
+            cls.author, 'Пюре', text='Отварить и размять.',
+            ingredients={cls.potato: 500},
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def search(self, query):
+        response = self.client.get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_name_match_ranks_above_text_match(self):
+        self.assertEqual(self.search('борщ'), ['Борщ', 'Блины'])
+
+    def test_ingredient_names_and_prefix(self):
+        self.assertEqual(self.search('картоф'), ['Пюре'])
+
+    def test_all_terms_required(self):
+        self.assertEqual(self.search('свекла капуста'), ['Борщ'])
+        self.assertEqual(self.search('свекла размять'), [])
+
+    def test_index_follows_changes(self):
+        self.mash.name = 'Картофельное пюре'
+        self.mash.save()
+        self.assertEqual(self.search('картофельное'), ['Картофельное пюре'])
+        self.mash.recipe_ingredients.all().delete()
+        self.mash.name = 'Пюре'
+        self.mash.save()
+        self.assertEqual(self.search('картоф'), [])
+        self.borscht.delete()
+        self.assertEqual(self.search('борщ'), ['Блины'])
+
+    def test_search_with_cursor(self):
+        response = self.client.get(
+            '/api/recipes/', {'search': 'борщ', 'cursor': '', 'limit': 1}
+        )
+        first = response.data['results'][0]['name']
+        response = self.client.get(response.data['next'])
+        self.assertEqual(
+            [first, response.data['results'][0]['name']], ['Борщ', 'Блины']
+        )
+
+
+class IngredientAutocompleteTests(TestCase):
+    """Поиск ингредиентов по индексу в памяти."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('Соль', 'Сахар', 'Морская соль', 'Соевый соус', 'Фасоль'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def names(self, query):
+        response = self.client.get(f'/api/ingredients/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_prefix_matches_first(self):
+        self.assertEqual(
+            self.names('name=сол'), ['Соль', 'Морская соль', 'Фасоль']
+        )
+        self.assertEqual(
+            self.names('name=со&limit=2'), ['Соевый соус', 'Соль']
+        )
+
+    def test_without_name_returns_everything_sorted(self):
+        self.assertEqual(len(self.names('')), 5)
+        self.assertEqual(self.names('')[0], 'Морская соль')
+
+    def test_served_without_database(self):
+        self.client.get('/api/ingredients/?name=с')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/ingredients/?name=соль')
+        self.assertEqual(
+            response.data[0],
+            {
+                'id': Ingredient.objects.get(name='Соль').id,
+                'name': 'Соль',
+                'measurement_unit': 'г',
+            },
+        )
+
+    def test_index_is_rebuilt_after_change(self):
+        self.assertEqual(self.names('name=перец'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='Перец', measurement_unit='г')
+        self.assertEqual(self.names('name=перец'), ['Перец'])
+
+    def test_retrieve_ignores_search_parameters(self):
+        salt = Ingredient.objects.get(name='Соль')
+        response = self.client.get(f'/api/ingredients/{salt.id}/?name=сахар')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Соль')
+
+
+# Прозрачный PNG 1x1.
+PNG_IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='
+)
+
+
+def use_temporary_media(test):
+    """Загруженные в тесте картинки пишутся во временный каталог."""
+    media_root = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+    media = override_settings(MEDIA_ROOT=media_root)
+    media.enable()
+    test.addCleanup(media.disable)
+
+
+class ReferenceCatalogTests(TestCase):
+    """Справочники тегов и ингредиентов в памяти процесса."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tags = [
+            Tag.objects.create(name='Завтрак', slug='breakfast'),
+            Tag.objects.create(name='Обед', slug='lunch'),
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        warm_up()
+        self.client = APIClient()
+        use_temporary_media(self)
+
+    def recipe_payload(self, **extra):
+        payload = {
+            'name': 'Омлет',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': PNG_IMAGE,
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10}
+                for ingredient in self.ingredients
+            ],
+        }
+        payload.update(extra)
+        return payload
+
+    def test_tags_list_served_without_database(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tags/')
+        self.assertEqual(
+            response.data,
+            [
+                {'id': tag.id, 'name': tag.name, 'slug': tag.slug}
+                for tag in self.tags
+            ],
+        )
+
+    def test_tag_list_refreshed_after_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(name='Ужин', slug='dinner')
+        response = self.client.get('/api/tags/')
+        self.assertIn(tag.slug, [item['slug'] for item in response.data])
+
+    def test_create_recipe_validates_from_catalogs(self):
+        self.client.force_authenticate(self.author)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                '/api/recipes/', self.recipe_payload(), format='json'
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        sql = [query['sql'] for query in context.captured_queries]
+        # Ни одного SELECT по справочникам ингредиентов и тегов.
+        self.assertFalse([
+            query for query in sql
+            if query.startswith('SELECT') and (
+                'FROM "food_ingredient"' in query or 'FROM "food_tag"' in query
+            )
+        ])
+        self.assertEqual(
+            [tag['slug'] for tag in response.data['tags']],
+            ['breakfast', 'lunch'],
+        )
+        self.assertEqual(
+            response.data['ingredients'][0]['name'], 'Ингредиент 0'
+        )
+
+    def test_unknown_ingredient_is_rejected(self):
+        self.client.force_authenticate(self.author)
+        payload = self.recipe_payload(ingredients=[{'id': 999, 'amount': 1}])
+        response = self.client.post('/api/recipes/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_ingredient_missing_from_catalog_falls_back_to_database(self):
+        # Ингредиент создан в другом процессе: сигнал сюда не дошёл.
+        ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        self.client.force_authenticate(self.author)
+        payload = self.recipe_payload(
+            ingredients=[{'id': ingredient.id, 'amount': 1}]
+        )
+        response = self.client.post('/api/recipes/', payload, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['ingredients'][0]['name'], 'Соль')
+
+
+class RecipeWriteTests(TestCase):
+    """Создание рецепта: число запросов и атомарность."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(20)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        warm_up()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        use_temporary_media(self)
+
+    def post_recipe(self, ingredients):
+        return self.client.post('/api/recipes/', {
+            'name': 'Омлет',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': PNG_IMAGE,
+            'tags': [self.tag.id],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10}
+                for ingredient in ingredients
+            ],
+        }, format='json')
+
+    def count_create_queries(self, ingredients):
+        with CaptureQueriesContext(connection) as context:
+            response = self.post_recipe(ingredients)
+        self.assertEqual(response.status_code, 201, response.data)
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_depend_on_ingredients(self):
+        one = self.count_create_queries(self.ingredients[:1])
+        many = self.count_create_queries(self.ingredients)
+        self.assertEqual(one, many)
+        recipe = Recipe.objects.latest('id')
+        self.assertEqual(
+            recipe.recipe_ingredients.count(), len(self.ingredients)
+        )
+
+    def test_search_index_sees_bulk_created_ingredients(self):
+        self.post_recipe(self.ingredients[:2])
+        response = self.client.get('/api/recipes/?search=ингредиент')
+        self.assertEqual(response.data['count'], 1)
+
+    def test_failure_leaves_no_recipe(self):
+        with mock.patch.object(
+            RecipeIngredient.objects, 'bulk_create',
+            side_effect=IntegrityError('сбой'),
+        ):
+            with self.assertRaises(IntegrityError):
+                self.post_recipe(self.ingredients[:3])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_duplicate_and_unknown_ingredients_are_rejected(self):
+        response = self.post_recipe([self.ingredients[0], self.ingredients[0]])
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/recipes/', {
+            'name': 'Омлет',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': PNG_IMAGE,
+            'tags': [self.tag.id],
+            'ingredients': [{'id': 10_000, 'amount': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Recipe.objects.exists())
+
+
+class RecipeUpdateTests(TestCase):
+    """PATCH рецепта меняет только то, что действительно изменилось."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tags = [
+            Tag.objects.create(name='Завтрак', slug='breakfast'),
+            Tag.objects.create(name='Обед', slug='lunch'),
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(20)
+        ]
+        cls.recipe = create_recipe(cls.author, 'Омлет', tags=cls.tags[:1])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=cls.recipe, ingredient=ingredient, amount=10
+            )
+            for ingredient in cls.ingredients[:10]
+        ])
+
+    def setUp(self):
+        cache.clear()
+        warm_up()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def patch(self, ingredients, tags=None, **fields):
+        payload = {
+            'tags': [tag.id for tag in tags or self.tags[:1]],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in ingredients
+            ],
+            **fields,
+        }
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.id}/', payload, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        return response, [query['sql'] for query in context.captured_queries]
+
+    def current(self):
+        return dict(
+            self.recipe.recipe_ingredients
+            .values_list('ingredient_id', 'amount')
+        )
+
+    def test_noop_update_writes_nothing(self):
+        updated_at = Recipe.objects.get(pk=self.recipe.pk).updated_at
+        response, sql = self.patch(
+            [(ingredient, 10) for ingredient in self.ingredients[:10]],
+            name='Омлет',
+        )
+        # Рецепт, его ингредиенты и теги для сравнения, ответ; без записи.
+        self.assertEqual(len(sql), 7)
+        self.assertFalse([
+            query for query in sql
+            if query.startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ])
+        self.assertEqual(
+            Recipe.objects.get(pk=self.recipe.pk).updated_at, updated_at
+        )
+        self.assertEqual(len(response.data['ingredients']), 10)
+
+    def test_small_edit(self):
+        ids = [row.id for row in self.recipe.recipe_ingredients.order_by('id')]
+        ingredients = [(ingredient, 10) for ingredient in self.ingredients[:9]]
+        ingredients[0] = (self.ingredients[0], 25)
+        ingredients.append((self.ingredients[15], 5))
+        response, sql = self.patch(ingredients)
+        # Одна строка удалена, одна изменена, одна добавлена — по запросу
+        # на каждое действие, затем updated_at, поисковый документ,
+        # поиск корзин с этим рецептом для списков покупок и три запроса
+        # на LSH-корзины похожих рецептов.
+        self.assertEqual(len(sql), 20)
+        expected = {
+            ingredient.id: amount for ingredient, amount in ingredients
+        }
+        self.assertEqual(self.current(), expected)
+        # Нетронутые строки сохранили свои id.
+        kept = set(self.recipe.recipe_ingredients.values_list('id', flat=True))
+        self.assertTrue(set(ids[1:9]) <= kept)
+
+    def test_full_replace(self):
+        ingredients = [(ingredient, 3) for ingredient in self.ingredients[10:]]
+        response, sql = self.patch(ingredients, tags=self.tags[1:])
+        # Столько же запросов при любом числе ингредиентов:
+        # DELETE и INSERT пачкой плюс замена тега.
+        self.assertEqual(len(sql), 28)
+        self.assertEqual(
+            self.current(), {ingredient.id: 3 for ingredient, _ in ingredients}
+        )
+        self.assertEqual(
+            [tag['slug'] for tag in response.data['tags']], ['lunch']
+        )
+
+
+@override_settings(IMAGE_RENDITION_WORKERS=0)
+class RecipeImageRenditionTests(TestCase):
+    """Ссылки на копии фотографии в ответах API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        use_temporary_media(self)
+
+    def create_recipe(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', {
+                'name': 'Омлет',
+                'text': 'Описание',
+                'cooking_time': 10,
+                'image': PNG_IMAGE,
+                'tags': [self.tag.id],
+                'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response
+
+    def test_renditions_are_pending_right_after_create(self):
+        response = self.client.post('/api/recipes/', {
+            'name': 'Омлет',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': PNG_IMAGE,
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+        }, format='json')
+        self.assertIsNone(response.data['images'])
+        self.assertIn('/media/recipes/images/', response.data['image'])
+
+    def test_list_uses_card_rendition(self):
+        recipe_id = self.create_recipe().data['id']
+        listed = self.client.get('/api/recipes/').data['results'][0]
+        self.assertTrue(listed['image'].endswith('/card.jpg'))
+        self.assertTrue(
+            listed['images']['detail']['webp'].endswith('/detail.webp')
+        )
+        self.assertTrue(listed['images']['lqip'].startswith('data:image/webp'))
+        detail = self.client.get(f'/api/recipes/{recipe_id}/').data
+        self.assertIn('/media/recipes/images/', detail['image'])
+        self.assertEqual(detail['images'], listed['images'])
+
+
+class ShoppingListDownloadTests(TestCase):
+    """Скачивание списка покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+        cls.salt = Ingredient.objects.create(name='Соль', measurement_unit='г')
+        cls.eggs = Ingredient.objects.create(
+            name='Яйца', measurement_unit='шт'
+        )
+        # Одно название, разные единицы — разные строки списка.
+        cls.salt_spoons = Ingredient.objects.create(
+            name='Соль', measurement_unit='ч. л.'
+        )
+        cls.recipes = [
+            create_recipe(
+                cls.user, f'Рецепт {i}', ingredients={cls.salt: 5, cls.eggs: 2}
+            )
+            for i in range(5)
+        ]
+        RecipeIngredient.objects.create(
+            recipe=cls.recipes[0], ingredient=cls.salt_spoons, amount=1
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def fill_cart(self, count):
+        for recipe in self.recipes[:count]:
+            ShoppingCart.objects.get_or_create(author=self.user, recipe=recipe)
+
+    def download(self, query=''):
+        response = self.client.get(
+            f'/api/recipes/download_shopping_cart/{query}'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_text_is_default(self):
+        self.fill_cart(5)
+        response, content = self.download()
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertIn('shopping_list.txt', response['Content-Disposition'])
+        self.assertEqual(content, (
+            'Ваш список покупок:\n'
+            'Соль: 25 г\n'
+            'Соль: 1 ч. л.\n'
+            'Яйца: 10 шт\n'
+        ))
+
+    def test_csv_and_json(self):
+        self.fill_cart(2)
+        _, content = self.download('?format=csv')
+        self.assertEqual(content.splitlines(), [
+            'name,amount,measurement_unit',
+            'Соль,10,г',
+            'Соль,1,ч. л.',
+            'Яйца,4,шт',
+        ])
+        response, content = self.download('?format=json')
+        self.assertEqual(
+            response['Content-Type'], 'application/json; charset=utf-8'
+        )
+        self.assertEqual(json.loads(content)[2], {
+            'name': 'Яйца', 'amount': 4, 'measurement_unit': 'шт',
+        })
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        self.fill_cart(1)
+        with self.assertNumQueries(2):
+            self.download()
+        self.fill_cart(5)
+        with self.assertNumQueries(2):
+            self.download()
+
+    def test_recipe_edit_is_reflected(self):
+        self.fill_cart(2)
+        tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        response = self.client.patch(f'/api/recipes/{self.recipes[1].id}/', {
+            'tags': [tag.id],
+            'ingredients': [
+                {'id': self.salt.id, 'amount': 7},
+                {'id': self.salt_spoons.id, 'amount': 2},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        _, content = self.download()
+        self.assertEqual(content, (
+            'Ваш список покупок:\n'
+            'Соль: 12 г\n'
+            'Соль: 3 ч. л.\n'
+            'Яйца: 2 шт\n'
+        ))
+
+    def test_empty_cart_and_anonymous(self):
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 401)
+
+
+class SubscriptionListTests(TestCase):
+    """Страница подписок: рецепты авторов без запроса на каждого автора."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+        cls.authors = []
+        for i in range(8):
+            author = create_user(f'author{i}')
+            for j in range(i % 4):
+                create_recipe(author, f'Рецепт {i}.{j}')
+            Subscription.objects.create(user=cls.user, author=author)
+            cls.authors.append(author)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, query):
+        response = self.client.get(f'/api/users/subscriptions/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_recipes_limit_and_count(self):
+        results = self.get('?limit=8&recipes_limit=2')
+        self.assertEqual(
+            [item['id'] for item in results], [a.id for a in self.authors]
+        )
+        for i, item in enumerate(results):
+            expected = (
+                Recipe.objects.filter(author=self.authors[i]).order_by('id')
+            )
+            self.assertEqual(item['recipes_count'], i % 4)
+            self.assertEqual(
+                [recipe['id'] for recipe in item['recipes']],
+                [recipe.id for recipe in expected[:2]],
+            )
+            self.assertTrue(item['is_subscribed'])
+
+    def test_without_recipes_limit(self):
+        results = self.get('?limit=4')
+        self.assertEqual(
+            [len(item['recipes']) for item in results], [0, 1, 2, 3]
+        )
+        results = self.get('?limit=4&recipes_limit=0')
+        self.assertEqual([item['recipes'] for item in results], [[]] * 4)
+        self.assertEqual(
+            [item['recipes_count'] for item in results], [0, 1, 2, 3]
+        )
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        with self.assertNumQueries(3):
+            self.get('?limit=2&recipes_limit=1')
+        with self.assertNumQueries(3):
+            self.get('?limit=8&recipes_limit=3')
+
+    def test_counts_come_from_author_stats(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = self.get('?limit=8&recipes_limit=1')
+            response = self.client.get(f'/api/users/{self.authors[3].id}/')
+        self.assertEqual(
+            [item['recipes_count'] for item in results][:4], [0, 1, 2, 3]
+        )
+        self.assertEqual(response.data['recipes_count'], 3)
+        self.assertEqual(response.data['subscribers_count'], 1)
+        # COUNT только у пагинатора, по таблице подписок.
+        counted = [
+            q['sql'] for q in queries.captured_queries if 'COUNT(' in q['sql']
+        ]
+        self.assertFalse([sql for sql in counted if 'food_recipe' in sql])
+
+    def test_subscribe_response_counts_all_recipes(self):
+        Subscription.objects.filter(
+            user=self.user, author=self.authors[3]
+        ).delete()
+        response = self.client.post(
+            f'/api/users/{self.authors[3].id}/subscribe/?recipes_limit=1'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['recipes']), 1)
+        self.assertEqual(response.data['recipes_count'], 3)
+
+
+class ShortLinkTests(TestCase):
+    """Короткие ссылки: коды из id рецепта и переходы через LRU."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.recipe = create_recipe(cls.author)
+
+    def setUp(self):
+        cache.clear()
+        resolver.clear()
+        self.client = APIClient()
+
+    def test_codes(self):
+        for recipe_id in (
+            0, 1, 61, 62, 62 ** 5 - 1, 62 ** 5, 62 ** 6, 2 ** 63 - 1
+        ):
+            code = encode(recipe_id)
+            # Шесть символов — только у старых случайных кодов.
+            self.assertNotEqual(len(code), 6)
+            self.assertEqual(decode(code), recipe_id)
+        self.assertIsNone(decode('abcdef'))
+        self.assertIsNone(decode('a-b'))
+
+    def test_get_link_writes_nothing(self):
+        response = self.client.get(f'/api/recipes/{self.recipe.id}/get-link/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data['short-link'],
+            f'https://localhost/s/{encode(self.recipe.id)}',
+        )
+        self.assertFalse(ShortLink.objects.exists())
+
+    def test_redirect_is_cached(self):
+        url = f'/api/s/{encode(self.recipe.id)}/'
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertRedirects(
+            response, f'/api/recipes/{self.recipe.id}/',
+            fetch_redirect_response=False,
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_legacy_code(self):
+        ShortLink.objects.create(recipe=self.recipe, short_code='aB3dE9')
+        response = self.client.get('/api/s/aB3dE9/')
+        self.assertRedirects(
+            response, f'/api/recipes/{self.recipe.id}/',
+            fetch_redirect_response=False,
+        )
+
+    def test_unknown_and_deleted(self):
+        self.assertEqual(self.client.get('/api/s/zzzz/').status_code, 404)
+        url = f'/api/s/{encode(self.recipe.id)}/'
+        self.assertEqual(self.client.get(url).status_code, 302)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_lru_is_bounded(self):
+        small = type(resolver)(maxsize=2)
+        recipes = [self.recipe] + [
+            create_recipe(self.author, f'Рецепт {i}')
+            for i in range(2)
+        ]
+        for recipe in recipes:
+            self.assertEqual(small.resolve(encode(recipe.id)), recipe.id)
+        self.assertEqual(len(small), 2)
+        self.assertEqual(small.misses, 3)
+        small.resolve(encode(recipes[0].id))
+        self.assertEqual(small.misses, 4)
+
+
+class FeedTests(TestCase):
+    """Лента рецептов авторов, на которых подписан пользователь."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.other, *cls.authors = create_users('user', 5)
+
+    def setUp(self):
+        cache.clear()
+        warm_up()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def feed(self, query=''):
+        response = self.client.get(f'/api/recipes/feed/{query}')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_published_recipes_reach_followers(self):
+        old = create_recipe(self.authors[0])
+        Subscription.objects.create(user=self.reader, author=self.authors[0])
+        Subscription.objects.create(user=self.reader, author=self.authors[1])
+        Subscription.objects.create(user=self.other, author=self.authors[1])
+        first = create_recipe(self.authors[1])
+        second = create_recipe(self.authors[0])
+        create_recipe(self.authors[2])
+        # Рецепт, опубликованный до подписки, тоже в ленте.
+        self.assertEqual(self.feed(), [second.id, first.id, old.id])
+        self.assertEqual(FeedEntry.objects.filter(recipe=first).count(), 2)
+
+    def test_unsubscribe_and_delete_clean_up(self):
+        Subscription.objects.create(user=self.reader, author=self.authors[0])
+        Subscription.objects.create(user=self.reader, author=self.authors[1])
+        kept = create_recipe(self.authors[0])
+        deleted = create_recipe(self.authors[0])
+        create_recipe(self.authors[1])
+        Subscription.objects.filter(
+            user=self.reader, author=self.authors[1]
+        ).delete()
+        deleted.delete()
+        self.assertEqual(self.feed(), [kept.id])
+        self.assertEqual(FeedEntry.objects.count(), 1)
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_popular_authors_are_read_on_demand(self):
+        Subscription.objects.create(user=self.reader, author=self.authors[0])
+        Subscription.objects.create(user=self.other, author=self.authors[0])
+        Subscription.objects.create(user=self.reader, author=self.authors[1])
+        popular = create_recipe(self.authors[0])
+        regular = create_recipe(self.authors[1])
+        self.assertFalse(FeedEntry.objects.filter(recipe=popular).exists())
+        self.assertEqual(self.feed(), [regular.id, popular.id])
+
+    def test_keyset_pages(self):
+        Subscription.objects.create(user=self.reader, author=self.authors[0])
+        recipes = [
+            create_recipe(self.authors[0], f'Рецепт {i}') for i in range(5)
+        ]
+        response = self.client.get('/api/recipes/feed/?cursor=&limit=3')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipe.id for recipe in recipes[:1:-1]],
+        )
+        response = self.client.get(response.data['next'])
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [recipes[1].id, recipes[0].id],
+        )
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        Subscription.objects.create(user=self.reader, author=self.authors[0])
+        for i in range(8):
+            create_recipe(self.authors[0], f'Рецепт {i}')
+        # Подписки на популярных авторов, страница ленты, ингредиенты,
+        # связи пользователя.
+        with self.assertNumQueries(4):
+            self.feed('?cursor=&limit=2')
+        with self.assertNumQueries(4):
+            self.feed('?cursor=&limit=8')
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, 401)
+
+
+class SimilarRecipesTests(TestCase):
+    """Похожие рецепты по наборам ингредиентов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(12)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        warm_up()
+        self.client = APIClient()
+
+    def create(self, name, indexes):
+        return create_recipe(self.author, name, ingredients={
+            self.ingredients[index]: 1 for index in indexes
+        })
+
+    def similar(self, recipe, query=''):
+        response = self.client.get(f'/api/recipes/{recipe.id}/similar/{query}')
+        self.assertEqual(response.status_code, 200)
+        return [(item['id'], item['similarity']) for item in response.data]
+
+    def test_ranked_by_jaccard(self):
+        base = self.create('Основа', range(6))
+        same = self.create('Тот же набор', range(6))
+        close = self.create('Почти тот же', [0, 1, 2, 3, 4, 6])
+        self.create('Другой', range(6, 12))
+        self.assertEqual(
+            self.similar(base), [(same.id, 1.0), (close.id, 0.714)]
+        )
+        self.assertEqual(self.similar(base, '?limit=1'), [(same.id, 1.0)])
+
+    def test_follows_ingredient_changes(self):
+        base = self.create('Основа', range(6))
+        other = self.create('Другой', range(6, 12))
+        self.assertEqual(self.similar(base), [])
+        other.recipe_ingredients.all().delete()
+        for index in range(6):
+            RecipeIngredient.objects.create(
+                recipe=other, ingredient=self.ingredients[index], amount=2
+            )
+        self.assertEqual(self.similar(base), [(other.id, 1.0)])
+        other.delete()
+        self.assertEqual(self.similar(base), [])
+
+    def test_unknown_recipe(self):
+        response = self.client.get('/api/recipes/999999/similar/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_malformed_recipe_id(self):
+        response = self.client.get('/api/recipes/abc/similar/')
+        self.assertEqual(response.status_code, 404)
+
+
+class PantrySearchTests(TestCase):
+    """Поиск рецептов по имеющимся ингредиентам (?have=)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(6)
+        ]
+        cls.omelette = cls.create('Омлет', [0, 1])
+        cls.pancakes = cls.create('Блины', [0, 1, 2])
+        cls.soup = cls.create('Суп', [2, 3, 4, 5])
+        cls.salad = cls.create('Салат', [3])
+
+    @classmethod
+    def create(cls, name, indexes):
+        return create_recipe(cls.author, name, ingredients={
+            cls.ingredients[index]: 1 for index in indexes
+        })
+
+    def setUp(self):
+        cache.clear()
+        warm_up()
+        # Индекс живёт в процессе и пережил бы откат данных других тестов.
+        pantry._index = None
+        self.client = APIClient()
+
+    def have(self, indexes, query=''):
+        ids = ','.join(str(self.ingredients[index].id) for index in indexes)
+        response = self.client.get(f'/api/recipes/?have={ids}{query}')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.data['results']]
+
+    def test_ranked_by_coverage(self):
+        # Омлет покрыт полностью, блины на 2/3, суп на 1/4.
+        self.assertEqual(self.have([0, 1, 5]), ['Омлет', 'Блины', 'Суп'])
+        self.assertEqual(self.have([0, 1], '&missing=1'), ['Омлет', 'Блины'])
+        self.assertEqual(self.have([0, 1], '&missing=0'), ['Омлет'])
+        self.assertEqual(self.have([3]), ['Салат', 'Суп'])
+
+    def test_cursor_pages_keep_rank(self):
+        response = self.client.get(
+            '/api/recipes/?have='
+            f'{self.ingredients[0].id},{self.ingredients[1].id},'
+            f'{self.ingredients[3].id}&cursor=&limit=2'
+        )
+        self.assertEqual(
+            [recipe['name'] for recipe in response.data['results']],
+            ['Омлет', 'Салат'],
+        )
+        response = self.client.get(response.data['next'])
+        self.assertEqual(
+            [recipe['name'] for recipe in response.data['results']],
+            ['Блины', 'Суп'],
+        )
+
+    def test_index_follows_writes(self):
+        self.assertEqual(self.have([4]), ['Суп'])
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.create(
+                recipe=self.salad, ingredient=self.ingredients[4], amount=1
+            )
+        self.assertEqual(self.have([4]), ['Салат', 'Суп'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.salad.delete()
+        self.assertEqual(self.have([4]), ['Суп'])
+
+    def test_deleted_recipes_leave_the_index(self):
+        salad_id = self.salad.id
+        self.assertIn(salad_id, pantry.get().rank([self.ingredients[3].id]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.salad.delete()
+        index = pantry.get()
+        self.assertNotIn(salad_id, index.rank([self.ingredients[3].id]))
+        self.assertFalse(index.recipe_ids() >> salad_id & 1)
+
+    def test_sync_does_not_change_published_index(self):
+        index = pantry.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.create(
+                recipe=self.salad, ingredient=self.ingredients[4], amount=1
+            )
+        updated = pantry.get()
+        self.assertIsNot(updated, index)
+        have = [self.ingredients[4].id]
+        self.assertEqual(index.rank(have), [self.soup.id])
+        self.assertEqual(updated.rank(have), [self.salad.id, self.soup.id])
+
+    def test_invalid_values_are_ignored(self):
+        response = self.client.get('/api/recipes/?have=abc,&missing=x')
+        self.assertEqual(response.data['count'], 4)
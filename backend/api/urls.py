@@ -1,6 +1,6 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
-from .views import redirect_to_recipe
+from .views import redirect_to_recipe, cache_stats
 from .views import UserViewSet, RecipeViewSet, IngredientViewSet, TagViewSet, FavoriteViewSet, ShoppingCartViewSet
 
 api_v1 = DefaultRouter()
@@ -16,6 +16,7 @@ urlpatterns = [
     path('', include(api_v1.urls)),
     # path('recipes/<int:id>/shopping_cart/', ShoppingCartViewSet.as_view({'post': 'create', 'delete': 'create'}), name='recipe-shopping_cart'),
     path('s/<str:short_code>/', redirect_to_recipe, name='short-link'),
+    path('cache-stats/', cache_stats, name='cache-stats'),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 ]
@@ -1,29 +1,54 @@
 from django.shortcuts import render
 from djoser import views as djoser_views
-from rest_framework import status, viewsets, permissions
+from rest_framework import generics, status, viewsets, permissions
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied
-from rest_framework import viewsets, filters
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 
-from food.models import Ingredient, Tag, Recipe, Subscription, Favorite, ShoppingCart
+from food.models import (
+    Ingredient, Tag, Recipe, Subscription, Favorite, ShoppingCart
+)
 from users.models import User
-from .serializers import IngredientSerializer, TagSerializer, RecipeSerializer, FavoriteSerializer, UserSerializer, ShoppingCartSerializer
-from rest_framework.decorators import action
-from .pagination import RecipePagination, SubscriptionPagination
-from django.http import HttpResponse
+from .serializers import (
+    IngredientSerializer, TagSerializer, RecipeSerializer, FavoriteSerializer,
+    UserSerializer, card_image_url,
+)
+from rest_framework.decorators import action, api_view, permission_classes
+from .pagination import (
+    FeedPagination, RecipePagination, SubscriptionPagination
+)
+from .cache import (
+    AnonymousResponseCacheMixin, get_cache_stats, get_popularity_version
+)
+from .conditional import ConditionalGetMixin
+from .filters import RecipeSearchFilter
+from .reference import ingredient_catalog, tag_catalog
+from .relations import get_user_relations
+from .pantry import pantry, parse_have
+from .short_links import (
+    encode as encode_short_code, resolver as short_link_resolver
+)
+from .subscriptions import attach_recipe_previews, get_recipes_limit
+from .shopping_list import (
+    SHOPPING_LIST_RENDERERS, ShoppingListNegotiation, shopping_list_response,
+)
+from django.utils.cache import get_conditional_response
+import hashlib
+from django.http import Http404
 from django.conf import settings
-import random
-import string
-from food.models import ShortLink
+from food.feeds import feed_recipes
+from food.similarity import similar_recipes
+from food.tag_masks import filter_by_tags
+from django.utils.functional import cached_property
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
 from django.core.files.base import ContentFile
 import base64
-from django.db.models import Exists, OuterRef
+from django.db.models import Case, Count, Exists, IntegerField, OuterRef, When
+from django.db import transaction
 
 class UserViewSet(djoser_views.UserViewSet):
-    queryset = User.objects.all()
+    queryset = User.objects.select_related('stats')
     serializer_class = UserSerializer 
     permission_classes = [AllowAny]
     http_method_names = ['get', 'post', 'put', 'delete']
@@ -59,9 +84,9 @@ class UserViewSet(djoser_views.UserViewSet):
                 # Создаем файл аватара
                 avatar_file = ContentFile(base64.b64decode(imgstr), name=f'avatar_{user.id}.{ext}')
 
-                # Сохраняем файл в поле аватара пользователя
+                # Сохраняем файл в поле аватара пользователя (save() внутри;
+                # хранилище не пишет файл, если такая картинка уже есть)
                 user.avatar.save(avatar_file.name, avatar_file)
-                user.save()
 
                 # Формируем полный URL для ответа
                 avatar_url = request.build_absolute_uri(user.avatar.url)
@@ -105,76 +130,145 @@ class UserViewSet(djoser_views.UserViewSet):
 
     @action(detail=False, methods=['get'], pagination_class=SubscriptionPagination)
     def subscriptions(self, request):
-        subscriptions = Subscription.objects.filter(user=request.user).order_by('id')
+        subscriptions = (
+            Subscription.objects.filter(user=request.user)
+            .select_related('author__stats')
+            .order_by('id')
+        )
         page = self.paginate_queryset(subscriptions)
-
+        authors = self.get_subscribed_authors(
+            subscriptions if page is None else page
+        )
+        serializer = UserSerializer(
+            authors, many=True, context={'request': request}
+        )
         if page is not None:
-            serializer = UserSerializer(
-                [subscription.author for subscription in page],
-                many=True,
-                context={'request': request}
-            )
             return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
 
-        serializer = UserSerializer(
-            [subscription.author for subscription in subscriptions],
-            many=True,
-            context={'request': request}
+    def get_subscribed_authors(self, subscriptions):
+        """Авторы страницы подписок с рецептами и их количеством."""
+        authors = [subscription.author for subscription in subscriptions]
+        attach_recipe_previews(authors, get_recipes_limit(self.request))
+        # Все авторы страницы — подписки пользователя, проверять их не нужно.
+        get_user_relations({'request': self.request}).assume_subscribed(
+            author.pk for author in authors
         )
-        return Response(serializer.data)
+        return authors
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     http_method_names = ['get',]
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ['name']
+    # Поиск по ?name= (и ?search=) обслуживает индекс в памяти в list(),
+    # поэтому фильтров queryset нет: retrieve ищет ингредиент только по id.
 
+    # Сколько ингредиентов отдавать при поиске по названию
+    search_limit = 50
+    max_search_limit = 500
 
-    def get_queryset(self):
-        queryset = Ingredient.objects.all()
-        name = self.request.query_params.get('name', None)
-        if name:
-            queryset = queryset.filter(name__icontains=name)  # Фильтрация по имени
-        return queryset
+    def get_search_limit(self, name):
+        try:
+            limit = int(self.request.query_params['limit'])
+        except (KeyError, ValueError):
+            # Без поиска по названию по-прежнему отдаём весь справочник
+            return self.search_limit if name else None
+        return max(1, min(limit, self.max_search_limit))
 
-class TagViewSet(viewsets.ModelViewSet):
+    def list(self, request, *args, **kwargs):
+        # Автодополнение обслуживается индексом в памяти процесса, без базы:
+        # сначала совпадения по началу названия, затем по подстроке.
+        index = ingredient_catalog.get()
+        params = request.query_params
+        name = params.get('name') or params.get('search', '')
+        limit = self.get_search_limit(name)
+
+        etag = 'W/"{}"'.format(hashlib.md5('|'.join([
+            index.signature, name.strip().lower(), str(limit),
+            request.accepted_renderer.format,
+        ]).encode()).hexdigest())
+        not_modified = get_conditional_response(request._request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        response = Response(index.search(name, limit))
+        response['ETag'] = etag
+        return response
+
+
+class TagViewSet(
+    ConditionalGetMixin, AnonymousResponseCacheMixin, viewsets.ModelViewSet
+):
     queryset = Tag.objects.all().order_by('id')
     serializer_class = TagSerializer
     permission_classes = [AllowAny]
     pagination_class = None
     http_method_names = ['get',]
 
+    def list(self, request, *args, **kwargs):
+        # Список тегов отдаётся из справочника в памяти, без базы.
+        catalog = tag_catalog.get()
+        etag = 'W/"{}"'.format(hashlib.md5('|'.join([
+            catalog.signature, request.accepted_renderer.format,
+        ]).encode()).hexdigest())
+        not_modified = get_conditional_response(request._request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        response = Response(catalog.represent_all())
+        response['ETag'] = etag
+        return response
+
 
 def redirect_to_recipe(request, short_code):
-    # Получаем ссылку по короткому коду
-    short_link = get_object_or_404(ShortLink, short_code=short_code)
-    
-    # Получаем полную ссылку на рецепт
-    recipe_url = reverse('recipes-detail', kwargs={'pk': short_link.recipe.id})
-    
+    # id рецепта по коду; повторные переходы обходятся без базы
+    recipe_id = short_link_resolver.resolve(short_code)
+    if recipe_id is None:
+        raise Http404('Короткая ссылка не найдена.')
+
     # Перенаправляем пользователя на полную версию
-    return redirect(recipe_url)
+    return redirect(reverse('recipes-detail', kwargs={'pk': recipe_id}))
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    # Счётчики попаданий и промахов кэша ответов для анонимных запросов
+    return Response(get_cache_stats())
 
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter
 from django.db.models import Exists, OuterRef
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from django.db.models import Value
 from django.db.models.functions import Coalesce
 from django.db import models
-class RecipeViewSet(viewsets.ModelViewSet):
+# Сколько похожих рецептов отдаёт /recipes/{id}/similar/:
+# по умолчанию и максимум.
+SIMILAR_LIMIT = 6
+SIMILAR_MAX_LIMIT = 50
+
+
+class RecipeViewSet(
+    ConditionalGetMixin, AnonymousResponseCacheMixin, viewsets.ModelViewSet
+):
     queryset = Recipe.objects.all().order_by('name')
     serializer_class = RecipeSerializer
     pagination_class = RecipePagination
     permission_classes = [IsAuthenticatedOrReadOnly]
     http_method_names = ['get', 'post', 'patch', 'delete']
-    filter_backends = (DjangoFilterBackend, SearchFilter)
+    filter_backends = (DjangoFilterBackend, RecipeSearchFilter)
     filterset_fields = ['author']  # Добавляем фильтрацию по автору
+    user_relations = ('favorite_ids', 'cart_ids', 'subscription_ids')
+    # Допустимые значения ?ordering=; сортировка по популярности идёт
+    # по индексу recipe_popularity_idx без GROUP BY по избранному.
+    orderings = {
+        'name': ('name', 'id'),
+        '-favorites_count': ('-favorites_count', 'name', 'id'),
+    }
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -183,7 +277,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('author')
+
+        # Для списка и детального просмотра сериализатор обходит теги и
+        # ингредиенты каждого рецепта, поэтому подгружаем их заранее:
+        # по одному запросу на связь независимо от размера страницы.
+        # Названия тегов и ингредиентов берутся из справочников в памяти
+        # (api/reference.py), теги — по tags_mask, если бит есть у всех.
+        if self.action in ('list', 'retrieve', 'feed', 'similar'):
+            queryset = queryset.prefetch_related('recipe_ingredients')
+            if not self.tag_catalog.fully_masked:
+                queryset = queryset.prefetch_related('tags')
 
         # Аннотация для избранного (без конфликта с полем модели)
         if user.is_authenticated:
@@ -199,27 +303,73 @@ class RecipeViewSet(viewsets.ModelViewSet):
             )
 
         # Фильтрация по параметрам
-        is_favorited = self.request.query_params.get('is_favorited', None)
-        if is_favorited is not None:
-            if user.is_authenticated:
-                if is_favorited.lower() == 'true':
-                    # Получаем рецепты, добавленные в избранное пользователем
-                    queryset = queryset.filter(favorites__author=user)
-                elif is_favorited.lower() == 'false':
-                    # Получаем рецепты, которые не добавлены в избранное пользователем
-                    queryset = queryset.exclude(favorites__author=user)
-        if self.request.query_params.get('is_favorited') in ['1', 'true']:
+        # Фильтр по той же аннотации, что и поле is_favorited в ответе.
+        is_favorited = (
+            self.request.query_params.get('is_favorited', '').lower()
+        )
+        if is_favorited in ['1', 'true']:
             queryset = queryset.filter(is_recipe_favorited=True)
+        elif is_favorited == 'false' and user.is_authenticated:
+            queryset = queryset.filter(is_recipe_favorited=False)
 
         if self.request.query_params.get('is_in_shopping_cart') in ['1', 'true']:
             queryset = queryset.filter(is_in_user_shopping_cart=True)
 
-        # Фильтрация по тегам
+        # Фильтрация по тегам: любой из тегов, с ?tags_mode=all — все сразу.
+        # Проверяется маска tags_mask без JOIN и DISTINCT.
         tag_slugs = self.request.query_params.getlist('tags')
         if tag_slugs:
-            queryset = queryset.filter(tags__slug__in=tag_slugs).distinct()
+            match_all = self.request.query_params.get('tags_mode') == 'all'
+            filtered = filter_by_tags(
+                queryset, tag_slugs, self.tag_catalog.bits, match_all
+            )
+            if filtered is None:
+                # У части тегов нет бита в маске — фильтруем через связь.
+                filtered = queryset.filter(tags__slug__in=tag_slugs)
+                if match_all:
+                    filtered = filtered.annotate(
+                        matched_tags=Count('tags', distinct=True)
+                    ).filter(matched_tags=len(set(tag_slugs)))
+                filtered = filtered.distinct()
+            queryset = filtered
+
+        # ?have=1,2,3: рецепты, которые лучше всего покрываются этими
+        # ингредиентами (api/pantry.py), ?missing=k — не хватает не больше k.
+        have = parse_have(self.request.query_params.get('have', ''))
+        if have:
+            try:
+                max_missing = max(int(self.request.query_params['missing']), 0)
+            except (KeyError, ValueError):
+                max_missing = None
+            ranked = pantry.get().rank(have, max_missing)
+            queryset = queryset.filter(pk__in=ranked).annotate(
+                pantry_rank=Case(
+                    *[When(pk=recipe_id, then=position)
+                      for position, recipe_id in enumerate(ranked)],
+                    default=len(ranked),
+                    output_field=IntegerField(),
+                )
+            ).order_by('pantry_rank', 'id')
+
+        ordering = self.orderings.get(
+            self.request.query_params.get('ordering')
+        )
+        if ordering:
+            queryset = queryset.order_by(*ordering)
 
         return queryset
+
+    @cached_property
+    def tag_catalog(self):
+        # Один снимок справочника на запрос: get_queryset вызывается дважды
+        # (валидаторы ETag и ответ).
+        return tag_catalog.get()
+
+    def get_etag_parts(self):
+        # Порядок по популярности меняется без изменения updated_at.
+        if self.request.query_params.get('ordering') == '-favorites_count':
+            return [get_popularity_version()]
+        return []
     
 
     def destroy(self, request, pk=None):
@@ -245,24 +395,52 @@ class RecipeViewSet(viewsets.ModelViewSet):
     #     context['request'] = self.request
     #     return context
 
-
-    def generate_short_code(self):
-        return ''.join(random.choices(string.ascii_letters + string.digits, k=6))
+    @action(
+        detail=False, methods=['get'], permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination,
+    )
+    def feed(self, request):
+        # Рецепты авторов из подписок, новые первыми; фильтры списка
+        # (теги, избранное, корзина) работают и здесь.
+        queryset = feed_recipes(
+            self.filter_queryset(self.get_queryset()), request.user
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        # Рецепты с самыми похожими наборами ингредиентов (food/similarity.py)
+        # Версия из DRF: нечисловой pk даёт 404, а не ValueError.
+        recipe = generics.get_object_or_404(Recipe.objects.only('pk'), pk=pk)
+        try:
+            limit = int(request.query_params.get('limit', SIMILAR_LIMIT))
+            limit = min(max(limit, 1), SIMILAR_MAX_LIMIT)
+        except ValueError:
+            limit = SIMILAR_LIMIT
+        ranked = similar_recipes(recipe.pk, limit)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in ranked]
+        )
+        found = [
+            (recipes[recipe_id], score)
+            for recipe_id, score in ranked if recipe_id in recipes
+        ]
+        data = self.get_serializer([item for item, _ in found], many=True).data
+        for representation, (_, score) in zip(data, found):
+            representation['similarity'] = round(score, 3)
+        return Response(data)
 
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_recipe_link(self, request, pk=None):
         recipe = self.get_object()
 
-        # Проверяем, есть ли уже короткая ссылка для этого рецепта
-        short_link, created = ShortLink.objects.get_or_create(recipe=recipe)
-
-        if created:
-            # Генерируем короткий код, если создаем новую ссылку
-            short_link.short_code = self.generate_short_code()
-            short_link.save()
+        # Код вычисляется из id рецепта, в базу ничего не пишется
+        short_code = encode_short_code(recipe.pk)
 
         # Формируем полную короткую ссылку
-        short_url = f"https://{settings.SITE_DOMAIN}/s/{short_link.short_code}"
+        short_url = f"https://{settings.SITE_DOMAIN}/s/{short_code}"
         
         return Response({"short-link": short_url}, status=status.HTTP_200_OK)
 
@@ -286,7 +464,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 return Response({"detail": "Рецепт не добавлен в избранное."}, status=status.HTTP_400_BAD_REQUEST)
 
             # Если рецепт в избранном, удаляем его
-            favorite.delete()
+            with transaction.atomic():
+                favorite.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         # Обработка POST для добавления в избранное
@@ -295,60 +474,26 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return Response({"detail": "Рецепт уже в избранном."}, status=status.HTTP_400_BAD_REQUEST)
 
         # Если рецепт не в избранном, добавляем его
-        Favorite.objects.create(author=user, recipe=recipe)
+        with transaction.atomic():
+            Favorite.objects.create(author=user, recipe=recipe)
         serializer = RecipeSerializer(recipe, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-
-
-
-
-
-
-
-
-
-
-    @action(detail=False, methods=['get'], url_path='download_shopping_cart')
+    @action(
+        detail=False, methods=['get'], url_path='download_shopping_cart',
+        permission_classes=[IsAuthenticated],
+        renderer_classes=SHOPPING_LIST_RENDERERS,
+        content_negotiation_class=ShoppingListNegotiation,
+    )
     def download_shopping_cart(self, request):
-        # Получаем все рецепты, добавленные в корзину пользователя
-        shopping_cart = ShoppingCart.objects.filter(author=request.user)
-        
-        if not shopping_cart.exists():
+        # Формат файла: ?format=txt (по умолчанию), csv или json.
+        if not ShoppingCart.objects.filter(author=request.user).exists():
             return Response({"detail": "Shopping cart is empty."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Словарь для хранения суммированных ингредиентов
-        ingredients_summary = {}
-
-        # Проходим по всем рецептам в корзине
-        for item in shopping_cart:
-            # Получаем все ингредиенты рецепта
-            recipe_ingredients = item.recipe.recipe_ingredients.all()
-
-            for ingredient in recipe_ingredients:
-                ingredient_name = ingredient.ingredient.name
-                ingredient_unit = ingredient.ingredient.measurement_unit
-                ingredient_amount = ingredient.amount
-
-                # Если ингредиент уже есть в списке, суммируем его количество
-                if ingredient_name in ingredients_summary:
-                    ingredients_summary[ingredient_name]['amount'] += ingredient_amount
-                else:
-                    ingredients_summary[ingredient_name] = {
-                        'amount': ingredient_amount,
-                        'unit': ingredient_unit,
-                    }
-
-        # Формируем текст для файла
-        content = "Ваш список покупок:\n"
-        for ingredient, data in ingredients_summary.items():
-            content += f"{ingredient}: {data['amount']} {data['unit']}\n"
-
-        # Создаем текстовый файл
-        response = HttpResponse(content, content_type='text/plain')
-        response['Content-Disposition'] = 'attachment; filename="shopping_list.txt"'
-        return response
-    
+        # Суммирование — один GROUP BY в базе, файл отдаётся потоком
+        # по мере чтения строк, без сборки целиком в памяти.
+        return shopping_list_response(request.user, request.accepted_renderer)
+
     @action(detail=True, methods=['post', 'delete'], permission_classes=[IsAuthenticated])
     def shopping_cart(self, request, pk=None):
         recipe = self.get_object()
@@ -361,11 +506,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
             if ShoppingCart.objects.filter(author=user, recipe=recipe).exists():
                 return Response({'detail': 'Этот рецепт уже в списке покупок.'}, status=status.HTTP_400_BAD_REQUEST)
             
-            ShoppingCart.objects.create(author=user, recipe=recipe)
+            with transaction.atomic():
+                ShoppingCart.objects.create(author=user, recipe=recipe)
             response_data = {
                 "id": recipe.id,
                 "name": recipe.name,
-                "image": request.build_absolute_uri(recipe.image.url),
+                "image": card_image_url(request, recipe),
                 "cooking_time": recipe.cooking_time
             }
             return Response(response_data, status=status.HTTP_201_CREATED)
@@ -375,7 +521,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
             if not shopping_cart_item:
                 return Response({'detail': 'Этот рецепт не был в списке покупок.'}, status=status.HTTP_400_BAD_REQUEST)
             
-            shopping_cart_item.delete()
+            with transaction.atomic():
+                shopping_cart_item.delete()
             return Response({'detail': 'Рецепт удален из списка покупок.'}, status=status.HTTP_204_NO_CONTENT)
         
 
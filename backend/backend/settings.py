@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -111,6 +112,30 @@ REST_FRAMEWORK = {
 }
 SITE_DOMAIN = 'localhost'
 
+# Кэш должен быть общим для всех процессов: в нём версия контента для
+# кэша ответов (api/cache.py), версии справочников (api/reference.py)
+# и коротких ссылок, по которым процессы узнают о чужих изменениях.
+# LocMemCache у каждого процесса свой, поэтому годится только для
+# одного процесса (runserver, тесты); с несколькими воркерами задайте
+# REDIS_URL (например, redis://redis:6379/0).
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'foodgram',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+# Время жизни закэшированных ответов для анонимных запросов (секунды).
+RESPONSE_CACHE_TIMEOUT = 300
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -146,11 +171,20 @@ USE_TZ = True
 
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/3.2/howto/static-files/
-import os
-
 STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
+# Процессов для построения копий фотографий рецептов (food/images.py);
+# 0 — строить сразу после коммита в том же процессе.
+IMAGE_RENDITION_WORKERS = int(os.getenv('IMAGE_RENDITION_WORKERS', 2))
+# Сколько коротких ссылок держит в памяти каждый процесс (api/short_links.py).
+SHORT_LINK_CACHE_SIZE = int(os.getenv('SHORT_LINK_CACHE_SIZE', 10000))
+# Лента подписок (food/feeds.py): рецепты авторов, у которых подписчиков
+# больше FEED_FANOUT_LIMIT, не раскладываются по лентам, а добираются
+# при чтении; при подписке в ленту попадают FEED_BACKFILL_SIZE последних
+# рецептов автора.
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 5000))
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 100))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
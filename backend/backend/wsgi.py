@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Справочники тегов и ингредиентов и индекс поиска по имеющимся
+# ингредиентам загружаются при старте воркера.
+from api.pantry import pantry  # noqa: E402
+from api.reference import warm_up  # noqa: E402
+
+warm_up()
+pantry.warm_up()
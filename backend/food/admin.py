@@ -1,7 +1,7 @@
 from django.contrib import admin
-from django.db.models import Count
 from users.models import User
 from food.models import *
+from food.models import AuthorStats
 
 admin.site.register(
     (
@@ -21,19 +21,22 @@ class RecipeIngredientInline(admin.TabularInline):
     extra = 1  # Указываем количество пустых строк для добавления новых ингредиентов
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'favorite_count')
+    # Счётчики денормализованы в Recipe, GROUP BY по избранному не нужен
+    list_display = ('name', 'author', 'favorites_count', 'in_carts_count')
+    readonly_fields = ('favorites_count', 'in_carts_count')
     search_fields = ['name', 'author__username']
     list_filter = ('tags',)
+    list_select_related = ('author',)
     inlines = [RecipeIngredientInline]  # Добавляем Inline для ингредиентов
 
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        qs = qs.annotate(favorite_count=Count('favorited_by'))
-        return qs
 
-    def favorite_count(self, obj):
-        return obj.favorite_count
-    favorite_count.short_description = 'Количество в избранном'
+class AuthorStatsAdmin(admin.ModelAdmin):
+    # Счётчики поддерживаются сигналами, править их руками незачем
+    list_display = ('author', 'recipes_count', 'subscribers_count')
+    readonly_fields = ('author', 'recipes_count', 'subscribers_count')
+    list_select_related = ('author',)
+    search_fields = ['author__username']
+
 
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
@@ -47,3 +50,4 @@ admin.site.register(User, UserAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Tag, TagAdmin)
+admin.site.register(AuthorStats, AuthorStatsAdmin)
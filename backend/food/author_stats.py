@@ -0,0 +1,98 @@
+"""Счётчики авторов (AuthorStats): число рецептов и подписчиков.
+
+Создание и удаление рецепта или подписки меняют счётчик на единицу одним
+UPDATE в той же транзакции. Строка заводится при регистрации пользователя;
+у пользователей, созданных в обход save() (bulk_create), её досчитывает
+первое же увеличение счётчика.
+"""
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import User
+from .models import AuthorStats, Recipe, Subscription
+
+COUNTERS = ('recipes_count', 'subscribers_count')
+# Сколько строк пишется в базу за один INSERT.
+BATCH_SIZE = 500
+
+
+def get_stats(user):
+    """Счётчики пользователя; нулевые, если строки ещё нет."""
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        return AuthorStats(author=user)
+
+
+def change(author_id, field, delta):
+    queryset = AuthorStats.objects.filter(pk=author_id)
+    if delta < 0:
+        # В минус не уходим; рассинхрон исправляет rebuild_author_stats.
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    if queryset.update(**{field: F(field) + delta}) or delta < 0:
+        # Уменьшения без строки бывают при каскадном удалении автора:
+        # заводить строку заново нельзя.
+        return
+    if not AuthorStats.objects.filter(pk=author_id).exists():
+        rebuild([author_id])
+
+
+def _count(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by().values(field)
+            .annotate(total=Count('pk')).values('total')
+        ),
+        0
+    )
+
+
+def actual_counts(author_ids=None):
+    """Пользователи с настоящими значениями счётчиков в аннотациях."""
+    users = User.objects.all() if author_ids is None else User.objects.filter(
+        pk__in=author_ids
+    )
+    return users.annotate(
+        actual_recipes=_count(Recipe, 'author'),
+        actual_subscribers=_count(Subscription, 'author'),
+    )
+
+
+def rebuild(author_ids=None, only_wrong=False):
+    """Пересчитывает счётчики авторов (всех, если author_ids не задан).
+
+    С only_wrong пишет только разошедшиеся и недостающие строки.
+    Возвращает число записанных строк.
+    """
+    users = actual_counts(author_ids)
+    if only_wrong:
+        users = users.filter(
+            Q(stats=None)
+            | ~Q(stats__recipes_count=F('actual_recipes'))
+            | ~Q(stats__subscribers_count=F('actual_subscribers'))
+        )
+    written, last = 0, 0
+    # Страницами по pk: все авторы в памяти разом не держатся, а запись
+    # не идёт поверх открытого курсора чтения.
+    while page := list(
+        users.filter(pk__gt=last).order_by('pk').values_list(
+            'pk', 'actual_recipes', 'actual_subscribers'
+        )[:BATCH_SIZE]
+    ):
+        AuthorStats.objects.bulk_create(
+            [
+                AuthorStats(
+                    author_id=user_id,
+                    recipes_count=recipes,
+                    subscribers_count=subscribers,
+                )
+                for user_id, recipes, subscribers in page
+            ],
+            update_conflicts=True,
+            unique_fields=['author'],
+            update_fields=list(COUNTERS),
+        )
+        written += len(page)
+        last = page[-1][0]
+    return written
@@ -0,0 +1,132 @@
+"""Ленты подписок (FeedEntry): раскладка при записи, досборка при чтении.
+
+Новый рецепт раскладывается по лентам всех подписчиков автора пачками
+в той же транзакции. У авторов, чьих подписчиков больше
+FEED_FANOUT_LIMIT, раскладка слишком дорогая: их рецепты лента берёт
+из таблицы рецептов при чтении. Для обычного пользователя страница
+ленты — один просмотр диапазона по индексу (user, recipe).
+
+Автор, чьё число подписчиков опустилось ниже порога, уже раскладывается
+при записи, но рецептов, опубликованных до этого, в лентах нет — их
+добавляет команда rebuild_feeds.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+
+from .models import AuthorStats, FeedEntry, Recipe, Subscription
+
+# Сколько строк ленты пишется за один INSERT.
+BATCH_SIZE = 1000
+
+
+def is_pulled(author_id):
+    """Рецепты автора добираются при чтении, а не раскладываются."""
+    return AuthorStats.objects.filter(
+        pk=author_id, subscribers_count__gt=settings.FEED_FANOUT_LIMIT
+    ).exists()
+
+
+def _write(entries):
+    FeedEntry.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+
+
+def fan_out(recipe):
+    """Рецепт опубликован: кладём его в ленты подписчиков автора."""
+    if is_pulled(recipe.author_id):
+        return
+    followers = (
+        Subscription.objects.filter(author_id=recipe.author_id)
+        .values_list('user_id', flat=True)
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    batch = []
+    for user_id in followers:
+        batch.append(FeedEntry(
+            user_id=user_id, recipe_id=recipe.pk, author_id=recipe.author_id
+        ))
+        if len(batch) >= BATCH_SIZE:
+            _write(batch)
+            batch = []
+    if batch:
+        _write(batch)
+
+
+def backfill(user_id, author_id, limit=None):
+    """Кладёт в ленту рецепты автора: при подписке — последние limit."""
+    if is_pulled(author_id):
+        return
+    recipe_ids = (
+        Recipe.objects.filter(author_id=author_id)
+        .order_by('-id')
+        .values_list('id', flat=True)
+    )
+    if limit is not None:
+        recipe_ids = recipe_ids[:limit]
+    _write([
+        FeedEntry(user_id=user_id, recipe_id=recipe_id, author_id=author_id)
+        for recipe_id in recipe_ids
+    ])
+
+
+def unfollow(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def pulled_authors(user):
+    """Авторы из подписок пользователя, которых лента добирает при чтении."""
+    return list(
+        Subscription.objects.filter(
+            user=user,
+            author__stats__subscribers_count__gt=settings.FEED_FANOUT_LIMIT,
+        ).values_list('author_id', flat=True)
+    )
+
+
+def feed_recipes(queryset, user):
+    """Рецепты ленты пользователя из queryset, новые первыми.
+
+    Позиция в ленте — аннотация feed_id (id рецепта): для обычного
+    пользователя сортировка и курсор идут по индексу (user, recipe)
+    таблицы ленты, без сортировки результата.
+    """
+    authors = pulled_authors(user)
+    if not authors:
+        return queryset.filter(feed_entries__user=user).annotate(
+            feed_id=F('feed_entries__recipe_id')
+        ).order_by('-feed_id')
+    return queryset.filter(
+        Q(pk__in=FeedEntry.objects.filter(user=user).values('recipe_id'))
+        | Q(author_id__in=authors)
+    ).annotate(feed_id=F('id')).order_by('-feed_id')
+
+
+def rebuild(user_ids=None):
+    """Собирает ленты заново. Возвращает число строк в собранных лентах.
+
+    Ленты пишутся одним INSERT ... SELECT внутри базы, а не запросом
+    на подписку: миллионы строк не проходят через Python.
+    """
+    entries = FeedEntry.objects.all()
+    subscriptions = Subscription.objects.exclude(
+        author__stats__subscribers_count__gt=settings.FEED_FANOUT_LIMIT
+    )
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+        subscriptions = subscriptions.filter(user_id__in=user_ids)
+    entries.delete()
+    rows = (
+        subscriptions.filter(author__recipes__isnull=False)
+        .order_by()
+        .values_list('user_id', 'author__recipes__id', 'author_id')
+    )
+    sql, params = rows.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {FeedEntry._meta.db_table} '
+            '(user_id, recipe_id, author_id) ' + sql,
+            params,
+        )
+    return entries.count()
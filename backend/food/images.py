@@ -0,0 +1,181 @@
+"""Уменьшенные копии фотографий рецептов.
+
+Для каждой фотографии строятся карточка (списки рецептов) и детальный
+размер, каждый в JPEG и WebP, и крошечное размытое превью (LQIP) в виде
+data URI. Картинки кодируются в пуле процессов уже после коммита, запрос
+сохранения рецепта их не ждёт; пока копий нет, клиенты получают оригинал.
+"""
+import base64
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.dispatch import Signal
+from django.utils import timezone
+from PIL import Image, ImageFilter, ImageOps
+
+from .storage import get_image_storage
+
+logger = logging.getLogger(__name__)
+
+# Имя копии -> прямоугольник, в который вписывается картинка.
+RENDITIONS = {
+    'card': (600, 600),
+    'detail': (1200, 1200),
+}
+# Формат копии -> (формат Pillow, расширение, параметры кодирования).
+FORMATS = {
+    'jpeg': (
+        'JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}
+    ),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+}
+LQIP_SIZE = 16
+LQIP_OPTIONS = {'quality': 30}
+RENDITIONS_DIR = 'recipes/renditions'
+
+# Отправляется, когда у рецепта появились новые копии фотографии.
+renditions_ready = Signal()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def rendition_dir(source):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return f'{RENDITIONS_DIR}/{stem}'
+
+
+def _flatten(image):
+    # У JPEG нет прозрачности: кладём картинку на белый фон.
+    image = image.convert('RGBA')
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def _encode(image, fmt, **options):
+    pillow_format, extension, defaults = FORMATS[fmt]
+    if pillow_format == 'JPEG' and image.mode != 'RGB':
+        image = _flatten(image)
+    buffer = io.BytesIO()
+    image.save(buffer, pillow_format, **{**defaults, **options})
+    return buffer.getvalue(), extension
+
+
+def _open(source, storage):
+    with storage.open(source, 'rb') as file:
+        image = Image.open(file)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    return image
+
+
+def build_renditions(source, storage=None):
+    """Строит все копии фотографии source (имя файла в хранилище).
+
+    Возвращает описание для Recipe.image_renditions.
+    """
+    storage = storage or default_storage
+    original = _open(source, get_image_storage())
+    directory = rendition_dir(source)
+    renditions = {'source': source}
+    for name, size in RENDITIONS.items():
+        image = original.copy()
+        image.thumbnail(size, Image.LANCZOS)
+        entry = {'width': image.width, 'height': image.height}
+        for fmt in FORMATS:
+            data, extension = _encode(image, fmt)
+            path = f'{directory}/{name}.{extension}'
+            # Имя должно остаться тем же, а не получить суффикс от storage.
+            if storage.exists(path):
+                storage.delete(path)
+            entry[fmt] = storage.save(path, ContentFile(data))
+        renditions[name] = entry
+
+    tiny = original.copy()
+    tiny.thumbnail((LQIP_SIZE, LQIP_SIZE))
+    tiny = tiny.filter(ImageFilter.GaussianBlur(1))
+    data, _ = _encode(tiny, 'webp', **LQIP_OPTIONS)
+    renditions['lqip'] = (
+        'data:image/webp;base64,' + base64.b64encode(data).decode()
+    )
+    return renditions
+
+
+def save_renditions(recipe_id, renditions):
+    from .models import Recipe
+
+    # Фотографию могли заменить, пока строились копии: тогда они не нужны.
+    updated = Recipe.objects.filter(
+        pk=recipe_id, image=renditions['source']
+    ).update(image_renditions=renditions, updated_at=timezone.now())
+    if updated:
+        renditions_ready.send(sender=Recipe, recipe_id=recipe_id)
+    return bool(updated)
+
+
+def _init_worker():
+    # При старте процессов через spawn (macOS, Windows) Django не настроен.
+    import django
+    django.setup()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_RENDITION_WORKERS,
+                initializer=_init_worker,
+            )
+    return _executor
+
+
+def _finished(recipe_id, source, submitted_from, future):
+    # Обычно вызывается в служебном потоке пула, у которого своё
+    # соединение с базой; его и закрываем, соединение запроса — нет.
+    try:
+        renditions = future.result()
+    except Exception:
+        logger.warning('Не удалось построить копии %s', source, exc_info=True)
+        return
+    try:
+        save_renditions(recipe_id, renditions)
+    finally:
+        if threading.get_ident() != submitted_from:
+            connection.close()
+
+
+def schedule_renditions(recipe_id, source):
+    """Ставит построение копий в очередь пула. Вызывать после коммита.
+
+    При IMAGE_RENDITION_WORKERS = 0 копии строятся сразу, в этом потоке.
+    """
+    if not get_image_storage().exists(source):
+        # Например, база загружена без каталога media.
+        return
+    if not settings.IMAGE_RENDITION_WORKERS:
+        try:
+            renditions = build_renditions(source)
+        except Exception:
+            logger.warning(
+                'Не удалось построить копии %s', source, exc_info=True
+            )
+            return
+        save_renditions(recipe_id, renditions)
+        return
+    future = get_executor().submit(build_renditions, source)
+    future.add_done_callback(
+        partial(_finished, recipe_id, source, threading.get_ident())
+    )
@@ -0,0 +1,259 @@
+import json
+import random
+import statistics
+import subprocess
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.short_links import encode
+from food.models import (
+    Favorite, Ingredient, Recipe, ShoppingCart, Subscription, Tag
+)
+from users.models import User
+
+PERCENTILES = (50, 95, 99)
+
+
+class Scenario:
+    """Эндпоинт и способ выбрать для него следующий запрос."""
+
+    def __init__(self, name, build, users=None, authenticated=False):
+        self.name = name
+        self.build = build
+        # Пользователи, от имени которых идут запросы; пусто — анонимно.
+        self.users = users or []
+        self.authenticated = authenticated
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет основные эндпоинты API на данных текущей базы (например, '
+        'из generate_synthetic_data) и выводит p50/p95/p99 времени ответа '
+        'и число SQL-запросов. С --output сохраняет результаты в JSON, '
+        'с --compare сравнивает с ранее сохранённым прогоном.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--only', nargs='+', help='имена эндпоинтов')
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='очищать кэш перед каждым запросом',
+        )
+        parser.add_argument('--output', help='файл для результатов в JSON')
+        parser.add_argument('--compare', help='JSON предыдущего прогона')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 2:
+            raise CommandError('Для перцентилей нужно хотя бы 2 запроса.')
+        rng = random.Random(options['seed'])
+        scenarios = self.scenarios(rng)
+        if options['only']:
+            unknown = set(options['only'])
+            unknown -= {scenario.name for scenario in scenarios}
+            if unknown:
+                raise CommandError(
+                    f'Неизвестные эндпоинты: {", ".join(sorted(unknown))}'
+                )
+            scenarios = [s for s in scenarios if s.name in options['only']]
+        for scenario in [
+            s for s in scenarios if s.authenticated and not s.users
+        ]:
+            self.stderr.write(
+                f'{scenario.name}: нет подходящих пользователей, пропущен'
+            )
+            scenarios.remove(scenario)
+
+        results = {}
+        # Тестовый клиент ходит на testserver.
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for scenario in scenarios:
+                results[scenario.name] = self.measure(scenario, rng, options)
+                self.report(scenario.name, results[scenario.name])
+
+        run = {'meta': self.meta(options), 'endpoints': results}
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(run, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты сохранены в {options["output"]}')
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                self.compare(json.load(file), run)
+
+    def scenarios(self, rng):
+        recipe_ids = list(
+            Recipe.objects.order_by('id').values_list('id', flat=True)
+        )
+        if not recipe_ids:
+            raise CommandError(
+                'В базе нет рецептов: сначала generate_synthetic_data.'
+            )
+        tags = list(Tag.objects.values_list('slug', flat=True))
+        names = list(Ingredient.objects.values_list('name', flat=True)[:5000])
+        page_count = max(1, len(recipe_ids) // 6)
+
+        def users_with(model, field='author_id'):
+            ids = model.objects.values_list(field, flat=True).distinct()[:1000]
+            users = User.objects.in_bulk(list(ids))
+            return [users[pk] for pk in sorted(users)]
+
+        any_user = users_with(User, 'id')
+        return [
+            Scenario(
+                'recipes_list',
+                lambda: (
+                    f'/api/recipes/?page={rng.randint(1, min(page_count, 50))}'
+                ),
+            ),
+            Scenario(
+                'recipes_list_tags',
+                lambda: '/api/recipes/?' + '&'.join(
+                    f'tags={slug}'
+                    for slug in rng.sample(tags, min(2, len(tags)))
+                ),
+                any_user, authenticated=True,
+            ),
+            Scenario(
+                'recipes_list_favorited',
+                lambda: '/api/recipes/?is_favorited=1',
+                users_with(Favorite), authenticated=True,
+            ),
+            Scenario(
+                'recipes_list_in_cart',
+                lambda: '/api/recipes/?is_in_shopping_cart=1',
+                users_with(ShoppingCart), authenticated=True,
+            ),
+            Scenario(
+                'recipe_detail',
+                lambda: f'/api/recipes/{rng.choice(recipe_ids)}/',
+                any_user, authenticated=True,
+            ),
+            Scenario(
+                'subscriptions',
+                lambda: '/api/users/subscriptions/?recipes_limit=3',
+                users_with(Subscription, 'user_id'), authenticated=True,
+            ),
+            Scenario(
+                'download_shopping_cart',
+                lambda: '/api/recipes/download_shopping_cart/',
+                users_with(ShoppingCart), authenticated=True,
+            ),
+            Scenario(
+                'ingredient_search',
+                lambda: (
+                    '/api/ingredients/?name='
+                    + rng.choice(names)[:rng.randint(1, 4)]
+                ),
+            ),
+            Scenario(
+                'short_link',
+                lambda: f'/api/s/{encode(rng.choice(recipe_ids))}/',
+            ),
+        ]
+
+    def request(self, client, scenario, rng, cold):
+        if scenario.users:
+            client.force_authenticate(rng.choice(scenario.users))
+        path = scenario.build()
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = client.get(path)
+            # Потоковые ответы (список покупок) формируются при чтении.
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+        return elapsed * 1000, len(queries), response.status_code
+
+    def measure(self, scenario, rng, options):
+        client = APIClient()
+        for _ in range(options['warmup']):
+            self.request(client, scenario, rng, options['cold'])
+        timings, queries, statuses = [], [], Counter()
+        for _ in range(options['requests']):
+            elapsed, count, status = self.request(
+                client, scenario, rng, options['cold']
+            )
+            timings.append(elapsed)
+            queries.append(count)
+            statuses[status] += 1
+        cuts = statistics.quantiles(timings, n=100, method='inclusive')
+        return {
+            'requests': len(timings),
+            **{f'p{p}_ms': round(cuts[p - 1], 2) for p in PERCENTILES},
+            'mean_ms': round(statistics.fmean(timings), 2),
+            'max_ms': round(max(timings), 2),
+            'queries_mean': round(statistics.fmean(queries), 2),
+            'queries_max': max(queries),
+            'statuses': {
+                str(status): total
+                for status, total in sorted(statuses.items())
+            },
+        }
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'requests': options['requests'],
+            'warmup': options['warmup'],
+            'seed': options['seed'],
+            'cold': options['cold'],
+            'data': {
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'favorites': Favorite.objects.count(),
+                'carts': ShoppingCart.objects.count(),
+                'subscriptions': Subscription.objects.count(),
+            },
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:<24} p50 {result["p50_ms"]:8.2f}  '
+            f'p95 {result["p95_ms"]:8.2f}  p99 {result["p99_ms"]:8.2f} мс  '
+            f'запросов {result["queries_mean"]:5.1f} '
+            f'(макс. {result["queries_max"]})  коды {result["statuses"]}'
+        )
+
+    def compare(self, previous, current):
+        self.stdout.write(
+            'Сравнение с '
+            f'{previous["meta"].get("commit") or "предыдущим прогоном"}:'
+        )
+        for name, result in current['endpoints'].items():
+            old = previous['endpoints'].get(name)
+            if old is None:
+                continue
+            changes = '  '.join(
+                f'p{p} {self.delta(old[f"p{p}_ms"], result[f"p{p}_ms"])}'
+                for p in PERCENTILES
+            )
+            self.stdout.write(
+                f'{name:<24} {changes}  запросов {old["queries_mean"]} -> '
+                f'{result["queries_mean"]}'
+            )
+
+    @staticmethod
+    def delta(old, new):
+        if not old:
+            return f'{new:.2f} мс'
+        return f'{(new - old) / old:+.0%}'
@@ -0,0 +1,90 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from api.short_links import encode, resolver
+from api.views import redirect_to_recipe
+from food.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет число переходов по коротким ссылкам в секунду: с пустым '
+        'и с прогретым кэшем. Данные создаются во временной транзакции '
+        'и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=10_000)
+        parser.add_argument('--requests', type=int, default=50_000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            codes = self.seed(options)
+            self.run(codes, options)
+            transaction.set_rollback(True)
+
+    def seed(self, options):
+        author = User.objects.create(
+            email='bench-links@example.org',
+            username='bench-links',
+            first_name='Bench',
+            last_name='Links',
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=author,
+                name=f'Рецепт {i:07d}',
+                text='',
+                cooking_time=10,
+                image='recipes/images/bench.png',
+            )
+            for i in range(options['recipes'])
+        )
+        return [encode(recipe.pk) for recipe in recipes]
+
+    def measure(self, codes):
+        factory = RequestFactory()
+        misses = resolver.misses
+        started = time.perf_counter()
+        for code in codes:
+            response = redirect_to_recipe(factory.get(f'/api/s/{code}/'), code)
+            assert response.status_code == 302
+        elapsed = time.perf_counter() - started
+        # Каждый промах LRU — один запрос к базе.
+        return len(codes) / elapsed, resolver.misses - misses
+
+    def run(self, codes, options):
+        rng = random.Random(options['seed'])
+        codes = rng.sample(codes, len(codes))
+        # Популярные рецепты открывают чаще: распределение с длинным хвостом.
+        clicks = [
+            codes[min(int(rng.paretovariate(0.5)) - 1, len(codes) - 1)]
+            for _ in range(options['requests'])
+        ]
+        maxsize = resolver.maxsize
+        variants = (
+            ('без кэша', 0),
+            ('с пустого кэша', maxsize),
+            ('прогретый кэш', maxsize),
+        )
+        resolver.clear()
+        try:
+            for name, resolver.maxsize in variants:
+                rate, queries = self.measure(clicks)
+                self.stdout.write(
+                    f'{name:<16} {rate:10.0f} переходов/с, '
+                    f'запросов к базе: {queries}'
+                )
+        finally:
+            resolver.maxsize = maxsize
+        lengths = [len(code) for code in codes]
+        self.stdout.write(
+            f'Коды длиной {min(lengths)}–{max(lengths)} символов, '
+            f'записей в LRU: {len(resolver)} из {resolver.maxsize}'
+        )
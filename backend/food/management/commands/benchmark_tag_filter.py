@@ -0,0 +1,108 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from food.models import Recipe, Tag
+from food.tag_masks import filter_by_tags, get_tag_bits
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает фильтрацию рецептов по тегам через JOIN + DISTINCT '
+        'и через tags_mask. Данные создаются во временной транзакции '
+        'и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100_000)
+        parser.add_argument('--tags', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--page-size', type=int, default=6)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            slugs = self.seed(options)
+            self.run(slugs, options)
+            transaction.set_rollback(True)
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        author = User.objects.create(
+            email='bench-tags@example.org',
+            username='bench-tags',
+            first_name='Bench',
+            last_name='Tags',
+        )
+        tags = [
+            Tag.objects.create(name=f'bench-tag-{i}', slug=f'bench-tag-{i}')
+            for i in range(options['tags'])
+        ]
+        started = time.perf_counter()
+        batch_size = 5000
+        through = Recipe.tags.through
+        for start in range(0, options['recipes'], batch_size):
+            size = min(batch_size, options['recipes'] - start)
+            chosen = [
+                [tag for tag in tags if rng.random() < 0.3]
+                for _ in range(size)
+            ]
+            recipes = Recipe.objects.bulk_create([
+                Recipe(
+                    author=author,
+                    name=f'Рецепт {start + i:07d}',
+                    text='',
+                    cooking_time=10,
+                    image='recipes/images/bench.png',
+                    tags_mask=sum(1 << tag.bit for tag in recipe_tags),
+                )
+                for i, recipe_tags in enumerate(chosen)
+            ])
+            through.objects.bulk_create([
+                through(recipe_id=recipe.pk, tag_id=tag.pk)
+                for recipe, recipe_tags in zip(recipes, chosen)
+                for tag in recipe_tags
+            ])
+        self.stdout.write(
+            f'Создано {options["recipes"]} рецептов '
+            f'за {time.perf_counter() - started:.1f} с'
+        )
+        return [tag.slug for tag in tags[:2]]
+
+    def measure(self, build, options):
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            queryset = build().order_by('name', 'id')
+            queryset.count()
+            list(queryset[:options['page_size']])
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def run(self, slugs, options):
+        base = Recipe.objects.all()
+        tag_bits = get_tag_bits()
+        variants = {
+            'any, JOIN + DISTINCT': lambda: (
+                base.filter(tags__slug__in=slugs).distinct()
+            ),
+            'any, tags_mask': lambda: filter_by_tags(base, slugs, tag_bits),
+            'all, JOIN + GROUP BY': lambda: (
+                base.filter(tags__slug__in=slugs)
+                .annotate(matched=Count('tags', distinct=True))
+                .filter(matched=len(slugs))
+            ),
+            'all, tags_mask': lambda: (
+                filter_by_tags(base, slugs, tag_bits, match_all=True)
+            ),
+        }
+        for name, build in variants.items():
+            median = self.measure(build, options)
+            self.stdout.write(
+                f'{name:<24} {median:8.2f} мс (медиана COUNT + страница)'
+            )
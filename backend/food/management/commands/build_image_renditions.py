@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from food.images import build_renditions, save_renditions
+from food.models import Recipe
+from food.storage import get_image_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит копии фотографий рецептов, у которых их нет или они '
+        'устарели. Работает в этом процессе, без пула.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Перестроить копии у всех рецептов.'
+        )
+
+    def handle(self, *args, **options):
+        built = skipped = 0
+        recipes = Recipe.objects.exclude(image='').values_list(
+            'id', 'image', 'image_renditions'
+        )
+        for recipe_id, source, renditions in recipes.iterator():
+            if not options['all'] and renditions.get('source') == source:
+                continue
+            if not get_image_storage().exists(source):
+                skipped += 1
+                continue
+            save_renditions(recipe_id, build_renditions(source))
+            built += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Построены копии для {built} рецептов, '
+            f'без файла фотографии: {skipped}.'
+        ))
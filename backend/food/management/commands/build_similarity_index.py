@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from food import similarity
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает LSH-корзины похожих рецептов для всех рецептов.'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        with transaction.atomic():
+            recipes = similarity.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Корзины построены для {recipes} рецептов '
+            f'за {time.perf_counter() - started:.1f} с.'
+        ))
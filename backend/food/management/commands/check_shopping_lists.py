@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from food import shopping_lists
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет материализованные списки покупок с корзинами. '
+        'С --fix пересчитывает разошедшихся пользователей, '
+        'с --rebuild — все списки целиком.'
+    )
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--fix', action='store_true')
+        group.add_argument('--rebuild', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            with transaction.atomic():
+                shopping_lists.rebuild()
+            self.stdout.write(
+                self.style.SUCCESS('Списки покупок пересчитаны.')
+            )
+            return
+
+        with transaction.atomic():
+            expected = shopping_lists.expected_totals()
+            stored = shopping_lists.stored_totals()
+            wrong = {
+                key for key in expected.keys() | stored.keys()
+                if expected.get(key) != stored.get(key)
+            }
+            users = {user_id for user_id, _ in wrong}
+            if options['fix'] and users:
+                shopping_lists.rebuild(user_ids=users)
+
+        if not wrong:
+            self.stdout.write(self.style.SUCCESS('Списки покупок сходятся.'))
+            return
+        message = (
+            f'Расходится строк: {len(wrong)} у пользователей: {len(users)}.'
+        )
+        if options['fix']:
+            self.stdout.write(self.style.SUCCESS(message + ' Исправлено.'))
+        else:
+            self.stdout.write(self.style.WARNING(message))
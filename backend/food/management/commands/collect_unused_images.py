@@ -0,0 +1,73 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from food.images import RENDITIONS_DIR, rendition_dir
+from food.models import Recipe
+from food.storage import get_image_storage
+from users.models import User
+
+# Каталоги, куда пишут поля Recipe.image и User.avatar.
+IMAGE_DIRS = ('recipes/images', 'users')
+
+
+def walk(storage, directory):
+    """Все файлы каталога хранилища, рекурсивно."""
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield f'{directory}/{name}'
+    for name in directories:
+        yield from walk(storage, f'{directory}/{name}')
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки и копии фотографий, на которые не ссылается '
+        'ни один рецепт или пользователь. Хранилище с именами по '
+        'содержимому само файлы не удаляет: их могут делить записи.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help=(
+                'Не трогать файлы моложе стольких секунд '
+                '(незавершённые загрузки).'
+            ),
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        storage = get_image_storage()
+        used = set(Recipe.objects.values_list('image', flat=True))
+        used |= set(
+            User.objects.exclude(avatar='').exclude(avatar__isnull=True)
+            .values_list('avatar', flat=True)
+        )
+        used_renditions = {rendition_dir(name) for name in used}
+
+        candidates = [
+            (storage.delete_unused, storage, name)
+            for directory in IMAGE_DIRS
+            for name in walk(storage, directory)
+            if name not in used
+        ]
+        candidates += [
+            (default_storage.delete, default_storage, name)
+            for name in walk(default_storage, RENDITIONS_DIR)
+            if name.rsplit('/', 1)[0] not in used_renditions
+        ]
+        deadline = time.time() - options['min_age']
+        removed = 0
+        for delete, owner, name in candidates:
+            if owner.get_modified_time(name).timestamp() > deadline:
+                continue
+            if not options['dry_run']:
+                delete(name)
+            removed += 1
+
+        verb = 'Можно удалить' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(f'{verb} файлов: {removed}.'))
@@ -0,0 +1,38 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from food.models import Recipe
+from food.transfer import CHUNK_SIZE, export_recipes
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает рецепты с авторами, тегами и ингредиентами в JSON Lines '
+        '(по строке на рецепт) для import_recipes. Без пути — в stdout.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-')
+        parser.add_argument('--author', help='email автора')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        queryset = Recipe.objects.all()
+        if options['author']:
+            queryset = queryset.filter(author__email=options['author'])
+        chunk_size = options['chunk_size']
+        started = time.perf_counter()
+        if options['path'] == '-':
+            exported = export_recipes(sys.stdout, queryset, chunk_size)
+            report = self.stderr
+        else:
+            with open(options['path'], 'w', encoding='utf-8') as file:
+                exported = export_recipes(file, queryset, chunk_size)
+            report = self.stdout
+        elapsed = time.perf_counter() - started
+        report.write(self.style.SUCCESS(
+            f'Выгружено {exported} рецептов за {elapsed:.1f} с '
+            f'({exported / max(elapsed, 1e-9):.0f} рецептов/с).'
+        ))
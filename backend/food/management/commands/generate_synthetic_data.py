@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from food.synthetic import Generator
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, рецептами, избранным, '
+        'корзинами и подписками для benchmark_endpoints. Одинаковые параметры '
+        'и --seed дают одинаковые данные; повторный запуск в ту же базу — '
+        'с другим --prefix. Пароль пользователей: synthetic-password.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10_000)
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='в среднем рецептов в избранном у пользователя',
+        )
+        parser.add_argument(
+            '--carts', type=int, default=3,
+            help='в среднем рецептов в корзине у пользователя',
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=10,
+            help='в среднем подписок у пользователя',
+        )
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags', type=int, default=6)
+        parser.add_argument('--prefix', default='synthetic')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        generator = Generator(
+            users=options['users'],
+            recipes=options['recipes'],
+            favorites=options['favorites'],
+            carts=options['carts'],
+            subscriptions=options['subscriptions'],
+            ingredients_per_recipe=options['ingredients_per_recipe'],
+            tags=options['tags'],
+            prefix=options['prefix'],
+            seed=options['seed'],
+            log=self.stdout.write,
+        )
+        with transaction.atomic():
+            created = generator.run()
+        self.stdout.write(self.style.SUCCESS(
+            'Создано: ' + ', '.join(
+                f'{name} {value}' for name, value in created.items()
+            )
+        ))
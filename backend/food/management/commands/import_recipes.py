@@ -0,0 +1,62 @@
+import sys
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cache import bump_content_version
+from api.reference import ingredient_catalog, tag_catalog
+from food.transfer import CHUNK_SIZE, RecipeImporter
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает рецепты из JSON Lines, выгруженных export_recipes. '
+        'Рецепты получают новые id, каждая пачка пишется в своей транзакции. '
+        'Копии фотографий, которых нет в файле, строит build_image_renditions.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument(
+            '--create-authors', action='store_true',
+            help='создавать недостающих авторов без пароля',
+        )
+        parser.add_argument(
+            '--id-map', help='файл для строк «старый id,новый id»',
+        )
+
+    def handle(self, *args, **options):
+        importer = RecipeImporter(create_authors=options['create_authors'])
+        started = time.perf_counter()
+        source = (
+            nullcontext(sys.stdin) if options['path'] == '-'
+            else open(options['path'], encoding='utf-8')
+        )
+        id_map = (
+            open(options['id_map'], 'w', encoding='utf-8') if options['id_map']
+            else nullcontext()
+        )
+        try:
+            with source as lines, id_map as importer.id_map:
+                importer.run(lines, options['chunk_size'])
+        except (KeyError, TypeError, ValueError) as error:
+            raise CommandError(
+                f'Некорректная запись после {importer.imported} рецептов: '
+                f'{error!r}'
+            )
+        finally:
+            # Пачки пишутся в обход сигналов: сбрасываем кэши вручную.
+            if importer.imported:
+                ingredient_catalog.invalidate()
+                tag_catalog.invalidate()
+                bump_content_version()
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено {importer.imported} рецептов за {elapsed:.1f} с '
+            f'({importer.imported / max(elapsed, 1e-9):.0f} рецептов/с), '
+            f'создано авторов: {importer.created_authors}, '
+            f'пропущено рецептов неизвестных авторов: {importer.skipped}.'
+        ))
@@ -0,0 +1,156 @@
+import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.cache import bump_content_version
+from api.reference import ingredient_catalog
+from food.models import Ingredient
+
+DEFAULT_PATH = Path(settings.BASE_DIR).parent / 'data' / 'ingredients.csv'
+NAME_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+# Сколько байт JSON читается за раз.
+READ_SIZE = 1 << 16
+
+
+def read_csv(file):
+    """Строки «название,единица»; заголовок name,measurement_unit пропущен."""
+    for row in csv.reader(file):
+        if not row or row[:2] == ['name', 'measurement_unit']:
+            continue
+        # Строка без единицы измерения будет посчитана как некорректная.
+        yield row[0], row[1] if len(row) > 1 else ''
+
+
+def read_json(file):
+    """Объекты из массива JSON или из JSON Lines, без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        # Разделители между объектами: пробелы, запятые и скобки массива.
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+            position += 1
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                if position < len(buffer):
+                    sample = buffer[position:position + 80]
+                    raise CommandError(f'Некорректный JSON: {sample!r}')
+                return
+            chunk = file.read(READ_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        position = end
+        if not isinstance(item, dict):
+            item = {}
+        yield item.get('name', ''), item.get('measurement_unit', '')
+
+
+def insert(cursor, rows, updated_at):
+    """Вставляет пары (название, единица), пропуская уже существующие.
+
+    Мимо ORM: на миллионе строк bulk_create большую часть времени
+    собирает SQL и готовит значения полей, а не пишет в базу. Строки идут
+    многострочным VALUES — executemany в psycopg2 делает запрос на строку.
+    """
+    max_params = connection.features.max_query_params
+    step = max_params // 3 if max_params else len(rows)
+    for start in range(0, len(rows), step or 1):
+        chunk = rows[start:start + step]
+        cursor.execute(
+            f'INSERT INTO {Ingredient._meta.db_table} '
+            '(name, measurement_unit, updated_at) VALUES '
+            + ', '.join(['(%s, %s, %s)'] * len(chunk))
+            + ' ON CONFLICT (name, measurement_unit) DO NOTHING',
+            [
+                value for name, unit in chunk
+                for value in (name, unit, updated_at)
+            ],
+        )
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+FORMATS = {'.csv': 'csv', '.json': 'json', '.jsonl': 'json', '.ndjson': 'json'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает справочник ингредиентов из CSV (название,единица) или '
+        'JSON (массив или JSON Lines с полями name и measurement_unit). '
+        'Файл читается потоком, строки пишутся пачками; уже существующие '
+        'пары (название, единица) пропускаются, так что повторный запуск '
+        'ничего не дублирует.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=str(DEFAULT_PATH))
+        parser.add_argument('--format', choices=sorted(READERS))
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or FORMATS.get(path.suffix.lower())
+        if file_format is None:
+            raise CommandError(
+                f'Не удалось определить формат файла {path}, укажите --format.'
+            )
+        if not path.is_file():
+            raise CommandError(f'Файл {path} не найден.')
+
+        started = time.perf_counter()
+        before = Ingredient.objects.count()
+        with path.open(encoding='utf-8', newline='') as file:
+            with transaction.atomic():
+                read, skipped = self.load(
+                    READERS[file_format](file), options['batch_size'],
+                    options['verbosity'],
+                )
+                created = Ingredient.objects.count() - before
+                if created:
+                    # Вставка мимо ORM не шлёт post_save:
+                    # сбрасываем кэши вручную.
+                    transaction.on_commit(ingredient_catalog.invalidate)
+                    transaction.on_commit(bump_content_version)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {read} строк за {elapsed:.1f} с '
+            f'({read / max(elapsed, 1e-9):.0f} строк/с): добавлено {created}, '
+            f'уже были {read - skipped - created}, '
+            f'пропущено некорректных {skipped}.'
+        ))
+
+    def load(self, rows, batch_size, verbosity):
+        read = skipped = 0
+        rows = iter(rows)
+        updated_at = connection.ops.adapt_datetimefield_value(timezone.now())
+        with connection.cursor() as cursor:
+            while batch := list(islice(rows, batch_size)):
+                ingredients = []
+                for name, unit in batch:
+                    name, unit = str(name).strip(), str(unit).strip()
+                    if (
+                        0 < len(name) <= NAME_LENGTH
+                        and 0 < len(unit) <= UNIT_LENGTH
+                    ):
+                        ingredients.append((name, unit))
+                    else:
+                        skipped += 1
+                # Конфликт по unique_ingredient_name_unit — строка уже есть.
+                insert(cursor, ingredients, updated_at)
+                read += len(batch)
+                if verbosity > 1:
+                    self.stdout.write(f'  {read} строк')
+        return read, skipped
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from food import author_stats
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает AuthorStats.recipes_count и subscribers_count. '
+        'По умолчанию пишет только разошедшиеся строки, с --all — все.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            written = author_stats.rebuild(only_wrong=not options['all'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики исправлены у {written} авторов.'
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from food import feeds
+
+
+class Command(BaseCommand):
+    help = (
+        'Собирает ленты подписок заново по подпискам и рецептам. '
+        'С --user — только ленты указанных пользователей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            written = feeds.rebuild(options['users'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты собраны, записей: {written}.'
+        ))
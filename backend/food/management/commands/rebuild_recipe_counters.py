@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from api.cache import bump_popularity_version
+from food.models import Favorite, Recipe, ShoppingCart
+
+
+def count_rows(model):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(recipe=OuterRef('pk'))
+            .order_by().values('recipe')
+            .annotate(total=Count('pk')).values('total')
+        ),
+        0
+    )
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает Recipe.favorites_count и Recipe.in_carts_count.'
+
+    def handle(self, *args, **options):
+        favorites = count_rows(Favorite)
+        carts = count_rows(ShoppingCart)
+        with transaction.atomic():
+            # Обновляем только разошедшиеся строки, одним UPDATE.
+            updated = Recipe.objects.filter(
+                ~Q(favorites_count=favorites) | ~Q(in_carts_count=carts)
+            ).update(favorites_count=favorites, in_carts_count=carts)
+            if updated:
+                transaction.on_commit(bump_popularity_version)
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики исправлены у {updated} рецептов.'
+        ))
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.16 on 2026-10-16 22:31
+
+from django.db import migrations, models
+
+MAX_TAG_BITS = 63
+UPDATE_BATCH_SIZE = 500
+
+
+def fill_masks(apps, schema_editor):
+    Tag = apps.get_model('food', 'Tag')
+    Recipe = apps.get_model('food', 'Recipe')
+    for bit, tag in enumerate(Tag.objects.order_by('id')[:MAX_TAG_BITS]):
+        tag.bit = bit
+        tag.save(update_fields=['bit'])
+
+    masks = {}
+    rows = Recipe.tags.through.objects.filter(
+        tag__bit__isnull=False
+    ).values_list('recipe_id', 'tag__bit')
+    for recipe_id, bit in rows.iterator():
+        masks[recipe_id] = masks.get(recipe_id, 0) | 1 << bit
+    groups = {}
+    for recipe_id, mask in masks.items():
+        groups.setdefault(mask, []).append(recipe_id)
+    for mask, ids in groups.items():
+        for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+            Recipe.objects.filter(
+                pk__in=ids[start:start + UPDATE_BATCH_SIZE]
+            ).update(tags_mask=mask)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0004_recipe_favorites_count_in_carts_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='Маска тегов'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True, unique=True, verbose_name='Бит в маске тегов'),
+        ),
+        migrations.RunPython(fill_masks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.16 on 2026-10-16 22:47
+
+from django.db import migrations, models
+import food.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0007_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=food.storage.get_image_storage, upload_to='recipes/images/', verbose_name='Фотография'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.16 on 2026-10-16 22:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    # SQL заморожен здесь, а не взят из food.shopping_lists: миграция
+    # должна работать с таблицами на момент 0009, а не с текущими моделями.
+    ShoppingCart = apps.get_model('food', 'ShoppingCart')
+    RecipeIngredient = apps.get_model('food', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('food', 'ShoppingListItem')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {ShoppingListItem._meta.db_table} '
+            '(user_id, ingredient_id, amount) '
+            'SELECT sc.author_id, ri.ingredient_id, SUM(ri.amount) '
+            f'FROM {ShoppingCart._meta.db_table} sc '
+            f'JOIN {RecipeIngredient._meta.db_table} ri '
+            'ON ri.recipe_id = sc.recipe_id '
+            'GROUP BY sc.author_id, ri.ingredient_id'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('food', '0008_recipe_image_content_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.BigIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='food.ingredient')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Строка списка покупок',
+                'verbose_name_plural': 'Строки списков покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
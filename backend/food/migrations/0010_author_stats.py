@@ -0,0 +1,56 @@
+# Generated by Django 4.2.16 on 2026-10-16 22:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_author_stats(apps, schema_editor):
+    # Замороженная копия food.author_stats.rebuild на исторических моделях.
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Recipe = apps.get_model('food', 'Recipe')
+    Subscription = apps.get_model('food', 'Subscription')
+    AuthorStats = apps.get_model('food', 'AuthorStats')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {AuthorStats._meta.db_table} '
+            '(author_id, recipes_count, subscribers_count) '
+            'SELECT u.id, '
+            f'(SELECT COUNT(*) FROM {Recipe._meta.db_table} r '
+            'WHERE r.author_id = u.id), '
+            f'(SELECT COUNT(*) FROM {Subscription._meta.db_table} s '
+            'WHERE s.author_id = u.id) '
+            f'FROM {User._meta.db_table} u'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_avatar_content_storage'),
+        ('food', '0009_shopping_list_item'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('recipes_count', models.PositiveIntegerField(default=0, verbose_name='Количество рецептов')),
+                ('subscribers_count', models.PositiveIntegerField(default=0, verbose_name='Количество подписчиков')),
+            ],
+            options={
+                'verbose_name': 'Статистика автора',
+                'verbose_name_plural': 'Статистика авторов',
+            },
+        ),
+        migrations.RemoveField(
+            model_name='subscription',
+            name='recipe_count',
+        ),
+        migrations.RemoveField(
+            model_name='subscription',
+            name='recipes',
+        ),
+        migrations.RunPython(fill_author_stats, migrations.RunPython.noop),
+    ]
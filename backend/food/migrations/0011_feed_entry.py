@@ -0,0 +1,56 @@
+# Generated by Django 4.2.16 on 2026-10-16 23:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_feeds(apps, schema_editor):
+    # Замороженная копия food.feeds.rebuild: рецепты авторов из подписок,
+    # кроме авторов, чьи рецепты лента добирает при чтении.
+    Recipe = apps.get_model('food', 'Recipe')
+    Subscription = apps.get_model('food', 'Subscription')
+    AuthorStats = apps.get_model('food', 'AuthorStats')
+    FeedEntry = apps.get_model('food', 'FeedEntry')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {FeedEntry._meta.db_table} '
+            '(user_id, recipe_id, author_id) '
+            'SELECT s.user_id, r.id, s.author_id '
+            f'FROM {Subscription._meta.db_table} s '
+            f'JOIN {Recipe._meta.db_table} r ON r.author_id = s.author_id '
+            f'LEFT JOIN {AuthorStats._meta.db_table} st '
+            'ON st.author_id = s.author_id '
+            'WHERE COALESCE(st.subscribers_count, 0) <= %s',
+            [settings.FEED_FANOUT_LIMIT],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('food', '0010_author_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='food.recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи лент',
+                'indexes': [models.Index(fields=['user', 'author'], name='feed_user_author_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_entry'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
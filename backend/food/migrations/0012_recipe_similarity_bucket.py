@@ -0,0 +1,87 @@
+# Generated by Django 4.2.16 on 2026-10-16 23:03
+
+import random
+from collections import defaultdict
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+# Копия параметров и функций подписи из food.similarity на момент
+# миграции: корзины совпадают с теми, что считает код, а дальнейшие
+# изменения LSH не меняют уже применённую миграцию.
+BANDS = 20
+ROWS = 3
+NUM_HASHES = BANDS * ROWS
+PRIME = (1 << 61) - 1
+SEED = 20241016
+_rng = random.Random(SEED)
+COEFFICIENTS = tuple(
+    (_rng.randrange(1, PRIME), _rng.randrange(PRIME)) for _ in range(NUM_HASHES)
+)
+BUCKET_MULTIPLIER = _rng.randrange(1, PRIME)
+
+
+def signature(ingredient_ids):
+    return [
+        min((a * ingredient_id + b) % PRIME for ingredient_id in set(ingredient_ids))
+        for a, b in COEFFICIENTS
+    ]
+
+
+def band_buckets(signature):
+    buckets = []
+    for band in range(BANDS):
+        value = band
+        for row in signature[band * ROWS:(band + 1) * ROWS]:
+            value = (value * BUCKET_MULTIPLIER + row) % PRIME
+        buckets.append(value)
+    return buckets
+
+
+def fill_buckets(apps, schema_editor):
+    RecipeIngredient = apps.get_model('food', 'RecipeIngredient')
+    RecipeSimilarityBucket = apps.get_model('food', 'RecipeSimilarityBucket')
+    ingredients = defaultdict(set)
+    for recipe_id, ingredient_id in RecipeIngredient.objects.values_list(
+        'recipe_id', 'ingredient_id'
+    ).iterator(chunk_size=BATCH_SIZE):
+        ingredients[recipe_id].add(ingredient_id)
+    RecipeSimilarityBucket.objects.bulk_create(
+        (
+            RecipeSimilarityBucket(recipe_id=recipe_id, band=band, bucket=bucket)
+            for recipe_id, ingredient_ids in ingredients.items()
+            for band, bucket in enumerate(band_buckets(signature(ingredient_ids)))
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0011_feed_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSimilarityBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('band', models.PositiveSmallIntegerField(verbose_name='Полоса')),
+                ('bucket', models.BigIntegerField(verbose_name='Корзина')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarity_buckets', to='food.recipe')),
+            ],
+            options={
+                'verbose_name': 'Корзина похожих рецептов',
+                'verbose_name_plural': 'Корзины похожих рецептов',
+                'indexes': [models.Index(fields=['band', 'bucket'], name='similarity_bucket_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='recipesimilaritybucket',
+            constraint=models.UniqueConstraint(fields=('recipe', 'band'), name='unique_recipe_band'),
+        ),
+        migrations.RunPython(fill_buckets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 4.2.16 on 2026-10-16 23:12
+
+import random
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+# Копия параметров и функций подписи из food.similarity на момент
+# миграции: корзины совпадают с теми, что считает код, а дальнейшие
+# изменения LSH не меняют уже применённую миграцию.
+BANDS = 20
+ROWS = 3
+NUM_HASHES = BANDS * ROWS
+PRIME = (1 << 61) - 1
+SEED = 20241016
+_rng = random.Random(SEED)
+COEFFICIENTS = tuple(
+    (_rng.randrange(1, PRIME), _rng.randrange(PRIME)) for _ in range(NUM_HASHES)
+)
+BUCKET_MULTIPLIER = _rng.randrange(1, PRIME)
+
+
+def signature(ingredient_ids):
+    return [
+        min((a * ingredient_id + b) % PRIME for ingredient_id in set(ingredient_ids))
+        for a, b in COEFFICIENTS
+    ]
+
+
+def band_buckets(signature):
+    buckets = []
+    for band in range(BANDS):
+        value = band
+        for row in signature[band * ROWS:(band + 1) * ROWS]:
+            value = (value * BUCKET_MULTIPLIER + row) % PRIME
+        buckets.append(value)
+    return buckets
+
+
+def merge_duplicates(apps, schema_editor):
+    """Дубли (название, единица) сливаются в ингредиент с меньшим id."""
+    Ingredient = apps.get_model('food', 'Ingredient')
+    RecipeIngredient = apps.get_model('food', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('food', 'ShoppingListItem')
+    groups = list(
+        Ingredient.objects.values('name', 'measurement_unit')
+        .annotate(keep=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+    )
+    recipes = set()
+    for group in groups:
+        duplicates = list(
+            Ingredient.objects.filter(
+                name=group['name'], measurement_unit=group['measurement_unit']
+            ).exclude(pk=group['keep']).values_list('id', flat=True)
+        )
+        recipes.update(
+            RecipeIngredient.objects.filter(ingredient_id__in=duplicates)
+            .values_list('recipe_id', flat=True)
+        )
+        # Строка рецепта или списка покупок с дублем переносится на
+        # оставшийся ингредиент, а если он там уже есть — складывается с ним.
+        for model, owner in ((RecipeIngredient, 'recipe'), (ShoppingListItem, 'user')):
+            for row in model.objects.filter(ingredient_id__in=duplicates):
+                merged = model.objects.filter(
+                    **{owner: getattr(row, f'{owner}_id')}, ingredient_id=group['keep']
+                ).update(amount=F('amount') + row.amount)
+                if merged:
+                    row.delete()
+                else:
+                    row.ingredient_id = group['keep']
+                    row.save(update_fields=['ingredient'])
+        Ingredient.objects.filter(pk__in=duplicates).delete()
+    update_buckets(apps, recipes)
+
+
+def update_buckets(apps, recipe_ids):
+    # Наборы ингредиентов рецептов изменились — пересчёт их корзин.
+    RecipeIngredient = apps.get_model('food', 'RecipeIngredient')
+    RecipeSimilarityBucket = apps.get_model('food', 'RecipeSimilarityBucket')
+    if not recipe_ids:
+        return
+    ingredients = defaultdict(set)
+    for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'ingredient_id'):
+        ingredients[recipe_id].add(ingredient_id)
+    RecipeSimilarityBucket.objects.filter(recipe_id__in=recipe_ids).delete()
+    RecipeSimilarityBucket.objects.bulk_create([
+        RecipeSimilarityBucket(recipe_id=recipe_id, band=band, bucket=bucket)
+        for recipe_id, ingredient_ids in ingredients.items()
+        for band, bucket in enumerate(band_buckets(signature(ingredient_ids)))
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0012_recipe_similarity_bucket'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_name_unit'),
+        ),
+    ]
@@ -1,7 +1,12 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 
 from backend.settings import AUTH_USER_MODEL
 from users.models import User
+from .storage import get_image_storage
+
+# Число битов в Recipe.tags_mask: знаковый BigIntegerField
+# без знакового бита.
+MAX_TAG_BITS = 63
 
 
 class Ingredient(models.Model):
@@ -13,8 +18,19 @@ class Ingredient(models.Model):
         verbose_name='Единица измерения',
         max_length=16
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True
+    )
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_name_unit'
+            )
+        ]
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
 
@@ -33,6 +49,19 @@ class Tag(models.Model):
         max_length=64,
         unique=True
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True
+    )
+    # Номер бита тега в Recipe.tags_mask; пусто, если битов не хватило.
+    bit = models.PositiveSmallIntegerField(
+        verbose_name='Бит в маске тегов',
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False
+    )
 
     class Meta:
         constraints = [
@@ -48,6 +77,32 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    def free_bit(self):
+        used = set(
+            Tag.objects.exclude(bit=None).values_list('bit', flat=True)
+        )
+        return next(
+            (bit for bit in range(MAX_TAG_BITS) if bit not in used), None
+        )
+
+    def save(self, *args, **kwargs):
+        if self.bit is not None:
+            return super().save(*args, **kwargs)
+        # Одновременно создаваемый тег может выбрать тот же свободный бит;
+        # тогда уникальность bit даёт IntegrityError и выбор повторяется.
+        while True:
+            self.bit = self.free_bit()
+            if self.bit is None:
+                return super().save(*args, **kwargs)
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                taken = Tag.objects.filter(bit=self.bit).exclude(pk=self.pk)
+                if not taken.exists():
+                    self.bit = None
+                    raise
+
 
 class Recipe(models.Model):
     author = models.ForeignKey(
@@ -63,7 +118,19 @@ class Recipe(models.Model):
     cooking_time = models.PositiveSmallIntegerField(
         verbose_name='Время приготовления'
     )
-    image = models.ImageField(verbose_name='Фотография', upload_to='recipes/images/')
+    # Имя файла — хэш содержимого, одинаковые картинки хранятся один раз.
+    image = models.ImageField(
+        verbose_name='Фотография',
+        upload_to='recipes/images/',
+        storage=get_image_storage
+    )
+    # Уменьшенные копии фотографии и LQIP, их строит food/images.py.
+    image_renditions = models.JSONField(
+        verbose_name='Копии фотографии',
+        default=dict,
+        blank=True,
+        editable=False
+    )
     ingredients = models.ManyToManyField(
         Ingredient,
         through='RecipeIngredient',
@@ -83,15 +150,46 @@ class Recipe(models.Model):
         verbose_name='В списке покупок'
     )
     favorited_by = models.ManyToManyField(User, related_name='favorited_recipes_list', blank=True)
+    # Битовая маска тегов (Tag.bit), синхронизируется с tags в food/signals.py.
+    tags_mask = models.BigIntegerField(
+        verbose_name='Маска тегов',
+        default=0,
+        db_index=True,
+        editable=False
+    )
+    # Меняется при любом изменении представления рецепта, в том числе его
+    # ингредиентов, тегов и автора (см. food/signals.py).
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+        db_index=True
+    )
+    # Денормализованные счётчики строк Favorite и ShoppingCart, их
+    # поддерживают сигналы в food/signals.py, пересчитывает команда
+    # rebuild_recipe_counters.
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Количество в избранном',
+        default=0
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='Количество в списках покупок',
+        default=0
+    )
 
     class Meta:
+        indexes = [
+            models.Index(
+                fields=['-favorites_count', 'name', 'id'],
+                name='recipe_popularity_idx'
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+
     def __str__(self):
         return self.name
 
 
-
 class Subscription(models.Model):
     user = models.ForeignKey(
         AUTH_USER_MODEL,
@@ -103,8 +201,6 @@ class Subscription(models.Model):
         on_delete=models.CASCADE,
         related_name='subscribers'
     )
-    recipes = models.ManyToManyField('Recipe', related_name='subscribers', blank=True)
-    recipe_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         unique_together = ('user', 'author')  # Обеспечивает уникальность подписок
@@ -114,13 +210,103 @@ class Subscription(models.Model):
     def __str__(self):
         return f"{self.user.username} подписан на {self.author.username}"
 
-    def save(self, *args, **kwargs):
-        # Если подписка сохранена, обновляем количество рецептов
-        if self.pk is not None:
-            self.recipe_count = self.recipes.count()
-        super().save(*args, **kwargs)
+
+class AuthorStats(models.Model):
+    """Счётчики автора для страниц пользователей и подписок.
+
+    Меняются на единицу при создании и удалении рецептов и подписок
+    (food/author_stats.py), сверяются командой rebuild_author_stats.
+    """
+    author = models.OneToOneField(
+        AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0
+    )
+    subscribers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0
+    )
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте «от авторов, на которых я подписан».
+
+    Строки раскладываются при публикации рецепта (food/feeds.py). Рецепты
+    авторов с очень большим числом подписчиков сюда не попадают, лента
+    добирает их при чтении. Автор хранится, чтобы отписка удаляла строки
+    по индексу.
+    """
+    user = models.ForeignKey(
+        AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='feed'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries'
+    )
+    author = models.ForeignKey(
+        AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+
+    class Meta:
+        constraints = [
+            # Он же индекс ленты: WHERE user_id = ? ORDER BY recipe_id DESC.
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'author'], name='feed_user_author_idx'
+            ),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
 
 
+class RecipeSimilarityBucket(models.Model):
+    """LSH-корзина рецепта: хэш одной полосы MinHash-подписи его ингредиентов.
+
+    Рецепты с общей корзиной хотя бы в одной полосе — кандидаты в похожие
+    (food/similarity.py).
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similarity_buckets'
+    )
+    band = models.PositiveSmallIntegerField(verbose_name='Полоса')
+    bucket = models.BigIntegerField(verbose_name='Корзина')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'band'],
+                name='unique_recipe_band'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['band', 'bucket'], name='similarity_bucket_idx'
+            ),
+        ]
+        verbose_name = 'Корзина похожих рецептов'
+        verbose_name_plural = 'Корзины похожих рецептов'
+
 
 class Favorite(models.Model):
     author = models.ForeignKey(
@@ -174,6 +360,37 @@ class ShoppingCart(models.Model):
         verbose_name_plural = 'Списки покупок'
 
 
+class ShoppingListItem(models.Model):
+    """Итог по ингредиенту в списке покупок пользователя.
+
+    Сумма amount по всем рецептам из его корзины; поддерживается
+    food/shopping_lists.py, сверяется командой check_shopping_lists.
+    """
+    user = models.ForeignKey(
+        AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='shopping_list'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    # Без проверки на знак: при изменении на дельту значение
+    # проходит через UPDATE amount = amount - x.
+    amount = models.BigIntegerField(verbose_name='Количество')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Строки списков покупок'
+
+
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='recipe_ingredients')
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
@@ -210,7 +427,7 @@ class RecipeTag(models.Model):
 
     def __str__(self):
         return f"{self.recipe.name} - {self.tag.name}"
-    
+
 
 class ShortLink(models.Model):
     recipe = models.ForeignKey('Recipe', on_delete=models.CASCADE)
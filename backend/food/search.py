@@ -0,0 +1,187 @@
+"""Полнотекстовый индекс рецептов.
+
+Индекс хранится в отдельной таблице ``food_recipe_search`` той же базы:
+FTS5 на SQLite и tsvector с GIN-индексом на PostgreSQL. В документ входят
+название, описание и названия ингредиентов рецепта. Индекс обновляется
+в той же транзакции, что и сам рецепт (см. food/signals.py), поэтому
+откат транзакции откатывает и его. На других СУБД поиск работает через
+``icontains`` по названию.
+"""
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'food_recipe_search'
+# Конфигурация PostgreSQL для разбора текста.
+PG_CONFIG = 'russian'
+# Веса полей при ранжировании: название, описание, ингредиенты.
+SQLITE_WEIGHTS = (10.0, 1.0, 4.0)
+# Не больше стольких слов из строки поиска идут в запрос.
+MAX_TERMS = 8
+# Сколько рецептов переиндексируется за один проход (лимит параметров SQL).
+REINDEX_BATCH_SIZE = 500
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+SQLITE_CREATE = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    "name, text, ingredients, tokenize = 'unicode61 remove_diacritics 2')"
+)
+PG_CREATE = (
+    f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+    'recipe_id bigint PRIMARY KEY REFERENCES food_recipe (id) '
+    'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+    'document tsvector NOT NULL)',
+    f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx '
+    f'ON {SEARCH_TABLE} USING GIN (document)',
+)
+
+
+def is_supported(vendor=None):
+    return (vendor or connection.vendor) in ('sqlite', 'postgresql')
+
+
+def create_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(SQLITE_CREATE)
+    elif vendor == 'postgresql':
+        for statement in PG_CREATE:
+            schema_editor.execute(statement)
+
+
+def drop_index(schema_editor):
+    if is_supported(schema_editor.connection.vendor):
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+def _documents(cursor, recipe_ids=None):
+    """(id, название, описание, ингредиенты) для рецептов, чистым SQL."""
+    where, params = '', []
+    if recipe_ids is not None:
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        where = f' WHERE {{column}} IN ({placeholders})'
+        params = list(recipe_ids)
+    cursor.execute(
+        'SELECT id, name, text FROM food_recipe' + where.format(column='id'),
+        params,
+    )
+    recipes = {row[0]: (row[1], row[2], []) for row in cursor.fetchall()}
+    cursor.execute(
+        'SELECT ri.recipe_id, i.name FROM food_recipeingredient ri '
+        'JOIN food_ingredient i ON i.id = ri.ingredient_id'
+        + where.format(column='ri.recipe_id'),
+        params,
+    )
+    for recipe_id, ingredient in cursor.fetchall():
+        if recipe_id in recipes:
+            recipes[recipe_id][2].append(ingredient)
+    return [
+        (recipe_id, name, text, ' '.join(ingredients))
+        for recipe_id, (name, text, ingredients) in recipes.items()
+    ]
+
+
+def _write(cursor, vendor, recipe_ids, documents):
+    if vendor == 'sqlite':
+        if recipe_ids is not None:
+            placeholders = ', '.join(['%s'] * len(recipe_ids))
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})',
+                list(recipe_ids),
+            )
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, text, ingredients) '
+            'VALUES (%s, %s, %s, %s)',
+            documents,
+        )
+    else:
+        if recipe_ids is not None:
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE recipe_id = ANY(%s)',
+                [list(recipe_ids)],
+            )
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (recipe_id, document) VALUES (%s, '
+            f"setweight(to_tsvector('{PG_CONFIG}', %s), 'A') || "
+            f"setweight(to_tsvector('{PG_CONFIG}', %s), 'B') || "
+            f"setweight(to_tsvector('{PG_CONFIG}', %s), 'C'))",
+            documents,
+        )
+
+
+def reindex_recipes(recipe_ids, using=None):
+    """Пересобирает документы указанных рецептов (удалённые — убирает)."""
+    recipe_ids = sorted(set(recipe_ids))
+    db = connection if using is None else using
+    if not recipe_ids or not is_supported(db.vendor):
+        return
+    with db.cursor() as cursor:
+        for start in range(0, len(recipe_ids), REINDEX_BATCH_SIZE):
+            batch = recipe_ids[start:start + REINDEX_BATCH_SIZE]
+            _write(cursor, db.vendor, batch, _documents(cursor, batch))
+
+
+def rebuild_index(using=None):
+    """Полностью пересобирает индекс. Возвращает число документов."""
+    db = connection if using is None else using
+    if not is_supported(db.vendor):
+        return 0
+    with db.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        documents = _documents(cursor)
+        _write(cursor, db.vendor, None, documents)
+    return len(documents)
+
+
+def _terms(query):
+    return TOKEN_RE.findall(query.lower())[:MAX_TERMS]
+
+
+def search_recipes(queryset, query):
+    """Оставляет рецепты, подходящие под запрос, и добавляет search_rank.
+
+    Все слова запроса должны встретиться в документе, последнее
+    (недописанное) слово ищется как префикс. Чем меньше search_rank,
+    тем выше рецепт в выдаче.
+    """
+    terms = _terms(query)
+    if not terms:
+        return queryset
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        match = ' '.join(f'"{term}"' for term in terms) + '*'
+        weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+        matched = RawSQL(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+            (match,),
+        )
+        rank = RawSQL(
+            f'SELECT bm25({SEARCH_TABLE}, {weights}) FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH %s '
+            f'AND {SEARCH_TABLE}.rowid = food_recipe.id',
+            (match,),
+            output_field=FloatField(),
+        )
+    elif vendor == 'postgresql':
+        tsquery = ' & '.join(f"'{term}'" for term in terms) + ':*'
+        matched = RawSQL(
+            f'SELECT recipe_id FROM {SEARCH_TABLE} '
+            f'WHERE document @@ to_tsquery(%s, %s)',
+            (PG_CONFIG, tsquery),
+        )
+        # ts_rank_cd растёт с релевантностью, а сортируем по возрастанию.
+        rank = RawSQL(
+            f'SELECT -ts_rank_cd(document, to_tsquery(%s, %s)) '
+            f'FROM {SEARCH_TABLE} s WHERE s.recipe_id = food_recipe.id',
+            (PG_CONFIG, tsquery),
+            output_field=FloatField(),
+        )
+    else:
+        condition = Q()
+        for term in terms:
+            condition &= Q(name__icontains=term)
+        return queryset.filter(condition)
+    return queryset.filter(pk__in=matched).annotate(search_rank=rank)
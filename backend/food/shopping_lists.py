@@ -0,0 +1,177 @@
+"""Материализованные списки покупок (ShoppingListItem).
+
+Добавление рецепта в корзину и удаление из неё меняют итоги пользователя
+на количества из рецепта. Когда меняются ингредиенты рецепта, который уже
+лежит в чьих-то корзинах, старые количества неизвестны, поэтому затронутые
+строки пересчитываются заново, но только для этих пользователей
+и ингредиентов.
+"""
+from django.db import connection
+from django.db.models import BigIntegerField, Case, F, Sum, Value, When
+
+from .models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+
+def _recipe_amounts(recipe_id):
+    return dict(
+        RecipeIngredient.objects.filter(recipe_id=recipe_id)
+        .values_list('ingredient_id', 'amount')
+    )
+
+
+def _delta(amounts, sign):
+    return Case(
+        *[
+            When(ingredient_id=ingredient_id, then=Value(sign * amount))
+            for ingredient_id, amount in amounts.items()
+        ],
+        default=Value(0),
+        output_field=BigIntegerField(),
+    )
+
+
+def _upsert(cursor, select, params, amount):
+    """INSERT ... SELECT в итоги; при конфликте строка получает amount."""
+    cursor.execute(
+        f'INSERT INTO {ShoppingListItem._meta.db_table} '
+        f'(user_id, ingredient_id, amount) {select} '
+        'ON CONFLICT (user_id, ingredient_id) '
+        f'DO UPDATE SET amount = {amount}',
+        params,
+    )
+
+
+def add_recipe(user_id, recipe_id):
+    """Рецепт добавлен в корзину: прибавляем его количества.
+
+    Одним INSERT ... ON CONFLICT DO UPDATE: при проверке «есть ли строка»
+    и отдельной вставке два одновременных добавления рецептов с общим
+    ингредиентом упирались бы в unique_shopping_list_item.
+    """
+    with connection.cursor() as cursor:
+        _upsert(
+            cursor,
+            'SELECT %s, ingredient_id, amount '
+            f'FROM {RecipeIngredient._meta.db_table} WHERE recipe_id = %s',
+            [user_id, recipe_id],
+            f'{ShoppingListItem._meta.db_table}.amount + excluded.amount',
+        )
+
+
+def remove_recipe(user_id, recipe_id):
+    """Рецепт убран из корзины: вычитаем его количества."""
+    amounts = _recipe_amounts(recipe_id)
+    if not amounts:
+        return
+    items = ShoppingListItem.objects.filter(
+        user_id=user_id, ingredient_id__in=amounts
+    )
+    items.update(amount=F('amount') - _delta(amounts, 1))
+    items.filter(amount__lte=0).delete()
+
+
+def _batches(values, lists=1):
+    # Части списка id для IN (...): lists таких списков в одном запросе
+    # должны уложиться в лимит параметров (у SQLite — 999).
+    limit = connection.features.max_query_params
+    if values is None or limit is None:
+        return [values]
+    size = max(limit // lists, 1)
+    return [
+        values[start:start + size] for start in range(0, len(values), size)
+    ]
+
+
+def _in_clause(column, values):
+    if values is None:
+        return '', []
+    placeholders = ', '.join(['%s'] * len(values))
+    return f' AND {column} IN ({placeholders})', list(values)
+
+
+def rebuild(user_ids=None, ingredient_ids=None):
+    """Пересчитывает итоги заново: всех или только указанных строк."""
+    if user_ids is not None:
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return
+    if ingredient_ids is not None:
+        ingredient_ids = sorted(set(ingredient_ids))
+        if not ingredient_ids:
+            return
+    # У популярного рецепта корзин больше, чем параметров в одном запросе.
+    lists = 2 if user_ids is not None and ingredient_ids is not None else 1
+    for users in _batches(user_ids, lists):
+        for ingredients in _batches(ingredient_ids, lists):
+            _rebuild_rows(users, ingredients)
+
+
+def _rebuild_rows(user_ids, ingredient_ids):
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    if ingredient_ids is not None:
+        items = items.filter(ingredient_id__in=ingredient_ids)
+    items.delete()
+
+    users_sql, users_params = _in_clause('sc.author_id', user_ids)
+    ingredients_sql, ingredients_params = _in_clause(
+        'ri.ingredient_id', ingredient_ids
+    )
+    # Строку могло успеть вставить параллельное add_recipe: итог
+    # пересчитан с нуля, поэтому он и записывается.
+    with connection.cursor() as cursor:
+        _upsert(
+            cursor,
+            'SELECT sc.author_id, ri.ingredient_id, SUM(ri.amount) '
+            f'FROM {ShoppingCart._meta.db_table} sc '
+            f'JOIN {RecipeIngredient._meta.db_table} ri '
+            'ON ri.recipe_id = sc.recipe_id '
+            f'WHERE 1 = 1{users_sql}{ingredients_sql} '
+            'GROUP BY sc.author_id, ri.ingredient_id',
+            users_params + ingredients_params,
+            'excluded.amount',
+        )
+
+
+def refresh_for_recipes(recipe_ids, ingredient_ids):
+    """Ингредиенты рецептов изменились: пересчёт у владельцев корзин."""
+    ingredient_ids = set(ingredient_ids)
+    if not ingredient_ids:
+        return
+    user_ids = set()
+    for recipes in _batches(sorted(set(recipe_ids))):
+        user_ids.update(
+            ShoppingCart.objects.filter(recipe_id__in=recipes)
+            .values_list('author_id', flat=True)
+        )
+    rebuild(user_ids, ingredient_ids)
+
+
+def expected_totals():
+    """Итоги с нуля по корзинам: {(user_id, ingredient_id): amount}."""
+    # Фильтр до values(): иначе он добавляет второй JOIN корзин, и у рецепта
+    # из нескольких корзин итоги группируются по корзинам других пользователей.
+    rows = (
+        RecipeIngredient.objects
+        .filter(recipe__in_shopping_cart__isnull=False)
+        .values('recipe__in_shopping_cart__author', 'ingredient_id')
+        .annotate(total=Sum('amount'))
+        .values_list(
+            'recipe__in_shopping_cart__author', 'ingredient_id', 'total'
+        )
+    )
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in rows
+    }
+
+
+def stored_totals():
+    rows = ShoppingListItem.objects.values_list(
+        'user_id', 'ingredient_id', 'amount'
+    )
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in rows
+    }
@@ -0,0 +1,286 @@
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import User
+from .models import (
+    AuthorStats, Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    Subscription, Tag
+)
+from . import author_stats, feeds, shopping_lists, similarity
+from .images import schedule_renditions
+from .search import reindex_recipes
+from .tag_masks import recompute_tags_masks
+
+# Поля пользователя, которые попадают в блок author у рецепта.
+USER_PUBLIC_FIELDS = {'email', 'username', 'first_name', 'last_name', 'avatar'}
+
+
+def touch_recipes(**filters):
+    """Обновляет Recipe.updated_at одним UPDATE без вызова save()."""
+    Recipe.objects.filter(**filters).update(updated_at=timezone.now())
+
+
+_deferred = threading.local()
+
+
+def recipe_ingredients_changed(recipe_ids, ingredient_ids=()):
+    """updated_at, поисковый индекс, списки покупок и корзины похожих
+    рецептов после смены ингредиентов.
+
+    Вызывается сигналами RecipeIngredient и явно после bulk_create,
+    bulk_update и queryset.update, которые сигналов не отправляют.
+    ingredient_ids — какие ингредиенты добавлены, изменены или удалены;
+    их итоги пересчитываются у всех, у кого рецепты в корзине.
+    Внутри deferred_recipe_refresh() только запоминает изменения.
+    """
+    pending = getattr(_deferred, 'pending', None)
+    if pending is not None:
+        pending[0].update(recipe_ids)
+        pending[1].update(ingredient_ids)
+        return
+    recipe_ids = set(recipe_ids)
+    touch_recipes(pk__in=recipe_ids)
+    reindex_recipes(recipe_ids)
+    shopping_lists.refresh_for_recipes(recipe_ids, ingredient_ids)
+    similarity.update_recipes(recipe_ids)
+
+
+@contextmanager
+def deferred_recipe_refresh():
+    """Обновляет затронутые в блоке рецепты один раз, на выходе.
+
+    Без этого queryset.delete() строк RecipeIngredient обновлял бы рецепт
+    и его поисковый документ отдельно для каждой удалённой строки.
+    """
+    if getattr(_deferred, 'pending', None) is not None:
+        # Вложенный блок: обновит внешний.
+        yield
+        return
+    _deferred.pending = (set(), set())
+    try:
+        yield
+        recipe_ids, ingredient_ids = _deferred.pending
+    finally:
+        _deferred.pending = None
+    if recipe_ids:
+        recipe_ingredients_changed(recipe_ids, ingredient_ids)
+
+
+def deleted_through(origin, model):
+    """Идёт ли удаление от model (экземпляра или queryset)."""
+    if isinstance(origin, QuerySet):
+        return origin.model is model
+    return isinstance(origin, model)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(sender, instance, **kwargs):
+    recipe_ingredients_changed([instance.recipe_id], [instance.ingredient_id])
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(sender, instance, origin=None, **kwargs):
+    if deleted_through(origin, Ingredient):
+        # Рецепты обновит ingredient_deleted, один раз на ингредиент.
+        return
+    if origin is not None and not deleted_through(origin, RecipeIngredient):
+        # Каскад от рецепта (или его автора): рецепт удаляется целиком,
+        # его корзины похожих рецептов уходят каскадом, поисковый документ
+        # убирает recipe_changed, списки покупок пересобирает recipe_deleted.
+        return
+    recipe_ingredients_changed([instance.recipe_id], [instance.ingredient_id])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    # Полнотекстовый индекс; удалённый рецепт из него просто пропадёт.
+    reindex_recipes([instance.pk])
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    # Каскадное удаление строк корзины и ингредиентов идёт в неизвестном
+    # порядке, поэтому после него затронутые итоги пересчитываются заново.
+    instance._shopping_list_scope = (
+        list(ShoppingCart.objects.filter(recipe=instance)
+             .values_list('author_id', flat=True)),
+        list(RecipeIngredient.objects.filter(recipe=instance)
+             .values_list('ingredient_id', flat=True)),
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    # Итоги удаляемых вместе с рецептом строк корзины пересчитываются
+    # здесь, а не по одной в cart_item_deleted.
+    user_ids, ingredient_ids = getattr(
+        instance, '_shopping_list_scope', ((), ())
+    )
+    shopping_lists.rebuild(user_ids, ingredient_ids)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    source = instance.image.name
+    if source and instance.image_renditions.get('source') != source:
+        # Файл фотографии уже записан; копии строятся после коммита в пуле.
+        transaction.on_commit(
+            partial(schedule_renditions, instance.pk, source)
+        )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            touch_recipes(pk=instance.pk)
+            recompute_tags_masks([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        touch_recipes(pk__in=pk_set)
+        recompute_tags_masks(pk_set)
+    elif action == 'pre_clear':
+        # После очистки связи уже не найти, поэтому обновляем заранее.
+        touch_recipes(tags=instance)
+        clear_tag_bit(instance)
+
+
+def clear_tag_bit(tag):
+    if tag.bit is not None:
+        Recipe.objects.filter(tags=tag).update(
+            tags_mask=F('tags_mask').bitand(~(1 << tag.bit))
+        )
+
+
+@receiver(post_save, sender=Tag)
+def tag_changed(sender, instance, created, **kwargs):
+    if not created:
+        touch_recipes(tags=instance)
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    touch_recipes(tags=instance)
+    clear_tag_bit(instance)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, created, **kwargs):
+    if not created:
+        touch_recipes(recipe_ingredients__ingredient=instance)
+        reindex_recipes(
+            RecipeIngredient.objects.filter(ingredient=instance)
+            .values_list('recipe_id', flat=True)
+        )
+
+
+@receiver(pre_delete, sender=Ingredient)
+def ingredient_deleting(sender, instance, **kwargs):
+    # После каскада строки RecipeIngredient уже не найти.
+    instance._recipe_ids = list(
+        RecipeIngredient.objects.filter(ingredient=instance)
+        .values_list('recipe_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    # Каскад удалил строки рецептов; рецепты обновляются один раз,
+    # а не на каждую строку. Итоги списков покупок по ингредиенту
+    # (ShoppingListItem) удалены тем же каскадом.
+    recipe_ingredients_changed(getattr(instance, '_recipe_ids', ()))
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.create(author=instance)
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return
+    if (
+        update_fields is not None
+        and not USER_PUBLIC_FIELDS & set(update_fields)
+    ):
+        return
+    touch_recipes(author=instance)
+
+
+def change_counter(recipe_id, field, delta):
+    # Атомарное изменение F-выражением; уход в минус (при рассинхроне)
+    # отсекается условием, рассинхрон исправляет rebuild_recipe_counters.
+    queryset = Recipe.objects.filter(pk=recipe_id)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, origin=None, **kwargs):
+    if not deleted_through(origin, Recipe):
+        change_counter(instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def cart_item_created(sender, instance, created, **kwargs):
+    if created:
+        change_counter(instance.recipe_id, 'in_carts_count', 1)
+        shopping_lists.add_recipe(instance.author_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def cart_item_deleted(sender, instance, origin=None, **kwargs):
+    if deleted_through(origin, Recipe):
+        # Счётчики удалённого рецепта не нужны,
+        # итоги пересчитает recipe_deleted.
+        return
+    change_counter(instance.recipe_id, 'in_carts_count', -1)
+    shopping_lists.remove_recipe(instance.author_id, instance.recipe_id)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        author_stats.change(instance.author_id, 'recipes_count', 1)
+        feeds.fan_out(instance)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_removed(sender, instance, **kwargs):
+    author_stats.change(instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_created(sender, instance, created, **kwargs):
+    if created:
+        author_stats.change(instance.author_id, 'subscribers_count', 1)
+        feeds.backfill(
+            instance.user_id, instance.author_id, settings.FEED_BACKFILL_SIZE
+        )
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, **kwargs):
+    author_stats.change(instance.author_id, 'subscribers_count', -1)
+    feeds.unfollow(instance.user_id, instance.author_id)
@@ -0,0 +1,68 @@
+"""Хранилище загруженных картинок с именами по содержимому.
+
+Файл называется SHA-256 своего содержимого: ``recipes/images/ab/ab12….png``.
+Повторная загрузка той же картинки (в том числе пересохранение рецепта
+и одинаковые фото у разных рецептов) не пишет на диск ничего нового.
+Поскольку один файл может принадлежать нескольким записям, ``delete``
+файлы не удаляет; неиспользуемые убирает команда collect_unused_images.
+Повторная загрузка обновляет время изменения файла, поэтому команда
+не удалит файл, на который запись ссылается заново.
+"""
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def content_name(self, name, content):
+        """Имя файла по его содержимому, в каталоге исходного имени."""
+        digest = hashlib.sha256()
+        # Считаем хэш кусками: второй копии картинки в памяти не появляется.
+        content.seek(0)
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        if self.exists(name):
+            # Такая картинка уже есть — запись не нужна. Время изменения
+            # обновляем: collect_unused_images не удаляет свежие файлы,
+            # а ссылка на этот файл появится в базе только после save().
+            try:
+                os.utime(self.path(name))
+                return name
+            except FileNotFoundError:
+                # Файл только что удалили как неиспользуемый — пишем заново.
+                pass
+        return super().save(name, content, max_length)
+
+    def delete(self, name):
+        # Файл может использоваться другими записями.
+        pass
+
+    def delete_unused(self, name):
+        """Удаляет файл, на который уже никто не ссылается."""
+        super().delete(name)
+
+
+image_storage = ContentAddressedStorage()
+
+
+def get_image_storage():
+    return image_storage
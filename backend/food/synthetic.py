@@ -0,0 +1,224 @@
+"""Синтетические данные для нагрузочных замеров.
+
+Пользователи, рецепты с тегами и ингредиентами, избранное, корзины
+и подписки создаются через bulk_create пачками, с фиксированным seed:
+одинаковые параметры дают одинаковые данные. Популярность неравномерна,
+как в жизни: небольшая часть авторов, рецептов и ингредиентов собирает
+большую часть подписок, избранного и упоминаний.
+
+Сигналы при bulk_create не срабатывают, поэтому производные данные
+(счётчики, ленты, списки покупок, поисковый индекс, корзины похожих
+рецептов) в конце пересобираются их же функциями rebuild.
+"""
+import random
+import time
+from io import StringIO
+from itertools import count
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+
+from users.models import User
+from . import author_stats, feeds, shopping_lists, similarity
+from .models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, ShoppingCart,
+    Subscription, Tag,
+)
+from .search import rebuild_index
+from .tag_masks import mask_of
+
+BATCH_SIZE = 5000
+PASSWORD = 'synthetic-password'
+IMAGE = 'recipes/images/synthetic.png'
+# Доля пользователей, которые публикуют рецепты.
+AUTHOR_SHARE = 0.1
+# Сколько ингредиентов завести, если справочник пуст.
+DEFAULT_INGREDIENTS = 2000
+
+
+def skewed(rng, items):
+    """Элемент из начала списка выбирается чаще: вероятность ~ 1/sqrt(i)."""
+    return items[int(len(items) * rng.random() ** 2)]
+
+
+def pick(rng, items, size):
+    """size разных элементов с перекосом к началу списка."""
+    if size * 2 > len(items):
+        # Почти все элементы: перекос не важен, а повторы выбора дороги.
+        return set(rng.sample(items, min(size, len(items))))
+    chosen = set()
+    while len(chosen) < size:
+        chosen.add(skewed(rng, items))
+    return chosen
+
+
+class Generator:
+
+    def __init__(self, users, recipes, favorites=20, carts=3, subscriptions=10,
+                 ingredients_per_recipe=8, tags=6, prefix='synthetic', seed=42,
+                 batch_size=BATCH_SIZE, log=None):
+        self.users = users
+        self.recipes = recipes
+        self.favorites = favorites
+        self.carts = carts
+        self.subscriptions = subscriptions
+        self.ingredients_per_recipe = ingredients_per_recipe
+        self.tags = tags
+        self.prefix = prefix
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+
+    def stage(self, name, function, *args, **kwargs):
+        started = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.log(f'{name}: {time.perf_counter() - started:.1f} с')
+        return result
+
+    def run(self):
+        user_ids = self.stage('пользователи', self.create_users)
+        authors = user_ids[:max(1, int(len(user_ids) * AUTHOR_SHARE))]
+        tags = self.stage('теги', self.create_tags)
+        ingredients = self.stage('ингредиенты', self.ingredient_ids)
+        recipe_ids = self.stage(
+            'рецепты', self.create_recipes, authors, tags, ingredients
+        )
+        self.stage(
+            'избранное', self.link, Favorite, user_ids, recipe_ids,
+            self.favorites,
+        )
+        self.stage(
+            'корзины', self.link, ShoppingCart, user_ids, recipe_ids,
+            self.carts,
+        )
+        self.stage('подписки', self.create_subscriptions, user_ids, authors)
+        self.rebuild_derived()
+        return {
+            'users': len(user_ids),
+            'recipes': len(recipe_ids),
+            'favorites': Favorite.objects.count(),
+            'carts': ShoppingCart.objects.count(),
+            'subscriptions': Subscription.objects.count(),
+        }
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield range(start, min(start + self.batch_size, total))
+
+    def create_users(self):
+        # Один хэш на всех: хэширование пароля — самое дорогое в создании.
+        password = make_password(PASSWORD)
+        ids = []
+        for batch in self.batches(self.users):
+            users = User.objects.bulk_create(
+                User(
+                    email=f'{self.prefix}-{i}@example.org',
+                    username=f'{self.prefix}-{i}',
+                    first_name='Имя',
+                    last_name=f'Фамилия {i}',
+                    password=password,
+                )
+                for i in batch
+            )
+            ids.extend(user.pk for user in users)
+        return ids
+
+    def create_tags(self):
+        tags = []
+        for i in range(self.tags):
+            # Через save(): тегу выдаётся бит маски.
+            tag, _ = Tag.objects.get_or_create(
+                slug=f'{self.prefix}-{i}',
+                defaults={'name': f'{self.prefix} {i}'},
+            )
+            tags.append(tag)
+        return tags
+
+    def ingredient_ids(self):
+        ids = Ingredient.objects.order_by('id').values_list('id', flat=True)
+        if ids:
+            return list(ids)
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'{self.prefix} {i}', measurement_unit='г')
+            for i in range(DEFAULT_INGREDIENTS)
+        )
+        return list(ids.all())
+
+    def create_recipes(self, authors, tags, ingredients):
+        through = Recipe.tags.through
+        numbers = count()
+        ids = []
+        for batch in self.batches(self.recipes):
+            chosen = [
+                pick(self.rng, tags, self.rng.randint(1, min(3, len(tags))))
+                for _ in batch
+            ]
+            recipes = Recipe.objects.bulk_create(
+                Recipe(
+                    author_id=skewed(self.rng, authors),
+                    name=f'Рецепт {next(numbers)}',
+                    text='Описание синтетического рецепта. ' * 10,
+                    cooking_time=self.rng.randint(5, 180),
+                    image=IMAGE,
+                    tags_mask=mask_of(
+                        tag.bit for tag in recipe_tags if tag.bit is not None
+                    ),
+                )
+                for recipe_tags in chosen
+            )
+            through.objects.bulk_create(
+                through(recipe_id=recipe.pk, tag_id=tag.pk)
+                for recipe, recipe_tags in zip(recipes, chosen)
+                for tag in recipe_tags
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe_id=recipe.pk,
+                    ingredient_id=ingredient_id,
+                    amount=self.rng.randint(1, 500),
+                )
+                for recipe in recipes
+                for ingredient_id in pick(
+                    self.rng, ingredients, self.ingredients_per_recipe
+                )
+            )
+            ids.extend(recipe.pk for recipe in recipes)
+        return ids
+
+    def link(self, model, user_ids, recipe_ids, per_user):
+        """Строки избранного или корзины: в среднем per_user у каждого."""
+        rows = []
+        for user_id in user_ids:
+            size = self.rng.randint(0, 2 * per_user)
+            rows.extend(
+                model(author_id=user_id, recipe_id=recipe_id)
+                for recipe_id in pick(self.rng, recipe_ids, size)
+            )
+            if len(rows) >= self.batch_size:
+                model.objects.bulk_create(rows)
+                rows = []
+        model.objects.bulk_create(rows)
+
+    def create_subscriptions(self, user_ids, authors):
+        rows = []
+        for user_id in user_ids:
+            size = self.rng.randint(0, 2 * self.subscriptions)
+            rows.extend(
+                Subscription(user_id=user_id, author_id=author_id)
+                for author_id in pick(self.rng, authors, size) - {user_id}
+            )
+            if len(rows) >= self.batch_size:
+                Subscription.objects.bulk_create(rows)
+                rows = []
+        Subscription.objects.bulk_create(rows)
+
+    def rebuild_derived(self):
+        self.stage(
+            'счётчики рецептов', call_command, 'rebuild_recipe_counters',
+            stdout=StringIO(),
+        )
+        self.stage('счётчики авторов', author_stats.rebuild)
+        self.stage('ленты', feeds.rebuild)
+        self.stage('списки покупок', shopping_lists.rebuild)
+        self.stage('поисковый индекс', rebuild_index)
+        self.stage('похожие рецепты', similarity.rebuild)
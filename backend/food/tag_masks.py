@@ -0,0 +1,91 @@
+"""Битовые маски тегов рецептов.
+
+Каждому тегу выдаётся бит (``Tag.bit``), у рецепта хранится их объединение
+(``Recipe.tags_mask``). Фильтр по тегам превращается в условие на одну
+колонку без JOIN через recipe_tags и без DISTINCT.
+"""
+from itertools import combinations
+
+from django.db.models import F, Q
+
+from .models import Recipe, Tag
+
+# До такого числа тегов подходящие маски перечисляются явно и фильтр
+# становится ``tags_mask IN (...)`` по индексу; дальше — побитовое И.
+ENUMERATE_TAGS_LIMIT = 8
+# Ограничение на число параметров в одном UPDATE ... WHERE id IN (...).
+UPDATE_BATCH_SIZE = 500
+
+
+def mask_of(bits):
+    mask = 0
+    for bit in bits:
+        mask |= 1 << bit
+    return mask
+
+
+def matching_masks(mask, universe, match_all):
+    """Все маски из битов universe, подходящие под фильтр mask."""
+    bits = [bit for bit in range(universe.bit_length()) if universe >> bit & 1]
+    masks = []
+    for size in range(len(bits) + 1):
+        for chosen in combinations(bits, size):
+            candidate = mask_of(chosen)
+            if match_all and candidate & mask == mask:
+                masks.append(candidate)
+            elif not match_all and candidate & mask:
+                masks.append(candidate)
+    return masks
+
+
+def get_tag_bits():
+    """Словарь slug -> бит для всех тегов (тегов единицы)."""
+    return dict(Tag.objects.values_list('slug', 'bit'))
+
+
+def filter_by_tags(queryset, slugs, tag_bits, match_all=False):
+    """Фильтрует рецепты по slug тегов: любой из них или все сразу.
+
+    Возвращает None, если у какого-то тега нет бита и маской не обойтись.
+    """
+    slugs = set(slugs)
+    requested = [tag_bits[slug] for slug in slugs if slug in tag_bits]
+    if None in requested:
+        return None
+    if not requested or (match_all and len(requested) < len(slugs)):
+        # Несуществующие теги: как и раньше, ничего не найдено.
+        return queryset.none()
+
+    mask = mask_of(requested)
+    universe = [bit for bit in tag_bits.values() if bit is not None]
+    if len(universe) <= ENUMERATE_TAGS_LIMIT:
+        masks = matching_masks(mask, mask_of(universe), match_all)
+        return queryset.filter(tags_mask__in=masks)
+
+    queryset = queryset.alias(matched_tags=F('tags_mask').bitand(mask))
+    if match_all:
+        return queryset.filter(matched_tags=mask)
+    return queryset.filter(~Q(matched_tags=0))
+
+
+def recompute_tags_masks(recipe_ids):
+    """Пересчитывает tags_mask для рецептов по их текущим тегам."""
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return
+    masks = dict.fromkeys(recipe_ids, 0)
+    rows = Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids, tag__bit__isnull=False
+    ).values_list('recipe_id', 'tag__bit')
+    for recipe_id, bit in rows:
+        masks[recipe_id] |= 1 << bit
+
+    # Один UPDATE на каждое значение маски (пачками по UPDATE_BATCH_SIZE).
+    groups = {}
+    for recipe_id, mask in masks.items():
+        groups.setdefault(mask, []).append(recipe_id)
+    for mask, ids in groups.items():
+        for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+            Recipe.objects.filter(
+                pk__in=ids[start:start + UPDATE_BATCH_SIZE]
+            ).update(tags_mask=mask)
@@ -1,3 +1,957 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from food import author_stats, feeds, shopping_lists, similarity
+from food.models import (
+    AuthorStats, FeedEntry, Ingredient, Tag, Recipe, RecipeIngredient,
+    RecipeSimilarityBucket, Favorite, ShoppingCart, ShoppingListItem,
+    Subscription,
+)
+from food.images import (
+    FORMATS, RENDITIONS, build_renditions, save_renditions, schedule_renditions
+)
+from food.search import search_recipes
+from food.synthetic import Generator
+from food.storage import image_storage
+from tests.helpers import create_recipe, create_user, create_users
+from users.models import User
+
+
+class RecipeUpdatedAtTests(TestCase):
+    """Recipe.updated_at следит за всем, что попадает в ответ о рецепте."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+
+    def setUp(self):
+        self.recipe = create_recipe(self.author)
+
+    def assertTouched(self, action):
+        before = Recipe.objects.get(pk=self.recipe.pk).updated_at
+        action()
+        after = Recipe.objects.get(pk=self.recipe.pk).updated_at
+        self.assertGreater(after, before)
+
+    def test_ingredients(self):
+        self.assertTouched(lambda: RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=1
+        ))
+        self.assertTouched(
+            lambda: self.recipe.recipe_ingredients.all().delete()
+        )
+
+    def test_tags(self):
+        self.assertTouched(lambda: self.recipe.tags.add(self.tag))
+        self.assertTouched(lambda: self.tag.recipe_set.clear())
+
+    def test_referenced_rows(self):
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.ingredient, amount=1
+        )
+        self.recipe.tags.add(self.tag)
+        self.ingredient.name = 'Сахар'
+        self.assertTouched(self.ingredient.save)
+        self.tag.name = 'Ужин'
+        self.assertTouched(self.tag.save)
+        self.author.last_name = 'Петров'
+        self.assertTouched(self.author.save)
+
+
+class RecipeCountersTests(TestCase):
+    """Денормализованные счётчики избранного и списков покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = create_users('user', 3)
+        cls.recipe = create_recipe(cls.users[0])
+
+    def counters(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        return recipe.favorites_count, recipe.in_carts_count
+
+    def test_counters_follow_rows(self):
+        for user in self.users:
+            Favorite.objects.create(author=user, recipe=self.recipe)
+        ShoppingCart.objects.create(author=self.users[0], recipe=self.recipe)
+        self.assertEqual(self.counters(), (3, 1))
+
+        Favorite.objects.filter(author=self.users[0]).delete()
+        ShoppingCart.objects.all().delete()
+        self.assertEqual(self.counters(), (2, 0))
+
+    def test_rebuild_command(self):
+        Favorite.objects.create(author=self.users[0], recipe=self.recipe)
+        Recipe.objects.update(favorites_count=10, in_carts_count=5)
+        out = StringIO()
+        call_command('rebuild_recipe_counters', stdout=out)
+        self.assertEqual(self.counters(), (1, 0))
+        self.assertIn('1', out.getvalue())
+
+
+class AuthorStatsTests(TestCase):
+    """Счётчики рецептов и подписчиков автора."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = create_users('user', 3)
+        cls.author = cls.users[0]
+
+    def stats(self, user=None):
+        stats = AuthorStats.objects.get(author=user or self.author)
+        return stats.recipes_count, stats.subscribers_count
+
+    def test_counters_follow_rows(self):
+        self.assertEqual(self.stats(), (0, 0))
+        recipes = [create_recipe(self.author) for _ in range(3)]
+        for user in self.users[1:]:
+            Subscription.objects.create(user=user, author=self.author)
+        self.assertEqual(self.stats(), (3, 2))
+
+        recipes[0].delete()
+        Subscription.objects.filter(user=self.users[1]).delete()
+        self.assertEqual(self.stats(), (2, 1))
+
+    def test_deleting_user(self):
+        create_recipe(self.author)
+        Subscription.objects.create(user=self.users[1], author=self.author)
+        Subscription.objects.create(user=self.author, author=self.users[2])
+        self.author.delete()
+        self.assertFalse(
+            AuthorStats.objects.filter(author_id=self.author.pk).exists()
+        )
+        self.assertEqual(self.stats(self.users[2]), (0, 0))
+
+    def test_user_created_without_signals(self):
+        user, = User.objects.bulk_create([User(
+            email='bulk@example.org', username='bulk',
+            first_name='Имя', last_name='Фамилия',
+        )])
+        Subscription.objects.create(user=self.author, author=user)
+        create_recipe(user)
+        self.assertEqual(self.stats(user), (1, 1))
+
+    def test_rebuild_command(self):
+        create_recipe(self.author)
+        Subscription.objects.create(user=self.users[1], author=self.author)
+        AuthorStats.objects.update(recipes_count=10, subscribers_count=5)
+        AuthorStats.objects.filter(author=self.users[2]).delete()
+        out = StringIO()
+        call_command('rebuild_author_stats', stdout=out)
+        self.assertEqual(self.stats(), (1, 1))
+        self.assertEqual(self.stats(self.users[1]), (0, 0))
+        self.assertEqual(self.stats(self.users[2]), (0, 0))
+        self.assertIn('3', out.getvalue())
+
+    def test_rebuild_writes_in_batches(self):
+        create_recipe(self.users[2])
+        Subscription.objects.create(user=self.users[1], author=self.author)
+        AuthorStats.objects.all().delete()
+        with mock.patch.object(author_stats, 'BATCH_SIZE', 2):
+            self.assertEqual(author_stats.rebuild(), 3)
+        self.assertEqual(self.stats(), (0, 1))
+        self.assertEqual(self.stats(self.users[1]), (0, 0))
+        self.assertEqual(self.stats(self.users[2]), (1, 0))
+
+
+class FeedRebuildTests(TestCase):
+    """Пересборка лент подписок командой rebuild_feeds."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.author = create_users('user', 2)
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def publish_popular(self):
+        # Пока у автора слишком много подписчиков, раскладки нет.
+        return create_recipe(self.author)
+
+    def test_rebuild_adds_missed_recipes(self):
+        Subscription.objects.create(user=self.reader, author=self.author)
+        recipe = self.publish_popular()
+        self.assertFalse(FeedEntry.objects.exists())
+        out = StringIO()
+        call_command(
+            'rebuild_feeds', '--user', str(self.reader.pk), stdout=out
+        )
+        self.assertEqual(
+            list(FeedEntry.objects.values_list(
+                'user_id', 'recipe_id', 'author_id'
+            )),
+            [(self.reader.pk, recipe.pk, self.author.pk)],
+        )
+        self.assertIn('1', out.getvalue())
+
+    def test_rebuild_query_count_does_not_depend_on_subscriptions(self):
+        readers = create_users('reader', 5)
+        Subscription.objects.create(user=self.reader, author=self.author)
+        recipe = self.publish_popular()
+        with CaptureQueriesContext(connection) as one:
+            feeds.rebuild()
+        for reader in readers:
+            Subscription.objects.create(user=reader, author=self.author)
+        with self.assertNumQueries(len(one)):
+            self.assertEqual(feeds.rebuild(), 6)
+        self.assertEqual(
+            set(FeedEntry.objects.values_list('user_id', 'recipe_id')),
+            {(user.pk, recipe.pk) for user in [self.reader, *readers]},
+        )
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_rebuild_skips_pulled_authors(self):
+        Subscription.objects.create(user=self.reader, author=self.author)
+        self.publish_popular()
+        self.assertEqual(feeds.rebuild(), 0)
+
+
+class SimilarityIndexTests(TestCase):
+    """MinHash-подписи и LSH-корзины похожих рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(40)
+        ]
+
+    def buckets(self):
+        return sorted(RecipeSimilarityBucket.objects.values_list(
+            'recipe_id', 'band', 'bucket'
+        ))
+
+    def test_signature_estimates_jaccard(self):
+        first = [ingredient.pk for ingredient in self.ingredients[:30]]
+        second = [ingredient.pk for ingredient in self.ingredients[10:40]]
+        equal = sum(
+            a == b for a, b in zip(
+                similarity.signature(first), similarity.signature(second)
+            )
+        )
+        # Точный коэффициент 20 / 40 = 0.5.
+        self.assertAlmostEqual(equal / similarity.NUM_HASHES, 0.5, delta=0.2)
+        self.assertEqual(
+            similarity.signature(first),
+            similarity.signature(list(reversed(first))),
+        )
+
+    def test_incremental_buckets_match_rebuild(self):
+        for size in (1, 3, 7):
+            recipe = create_recipe(self.author)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+                for ingredient in self.ingredients[:size]
+            )
+            similarity.update_recipes([recipe.pk])
+        incremental = self.buckets()
+        self.assertEqual(len(incremental), 3 * similarity.BANDS)
+        out = StringIO()
+        call_command('build_similarity_index', stdout=out)
+        self.assertEqual(self.buckets(), incremental)
+        self.assertIn('3', out.getvalue())
+
+
+class RecipeTagsMaskTests(TestCase):
+    """Recipe.tags_mask повторяет Recipe.tags."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', slug=f'tag{i}')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.recipe = create_recipe(self.author)
+
+    def mask(self):
+        return Recipe.objects.get(pk=self.recipe.pk).tags_mask
+
+    def test_bits_are_unique(self):
+        self.assertEqual(
+            sorted(tag.bit for tag in self.tags), list(range(len(self.tags)))
+        )
+
+    def test_bit_taken_concurrently_is_chosen_again(self):
+        # Параллельный запрос успел занять бит, выбранный для тега.
+        with mock.patch.object(
+            Tag, 'free_bit', side_effect=[self.tags[0].bit, 3]
+        ):
+            tag = Tag.objects.create(name='Ужин', slug='dinner')
+        self.assertEqual(Tag.objects.get(pk=tag.pk).bit, 3)
+
+    def test_duplicate_tag_is_still_rejected(self):
+        with self.assertRaises(IntegrityError):
+            Tag.objects.create(name='Тег 0', slug='tag0')
+
+    def test_mask_follows_tags(self):
+        first, second, third = self.tags
+        self.recipe.tags.set([first, third])
+        self.assertEqual(self.mask(), 1 << first.bit | 1 << third.bit)
+        second.recipe_set.add(self.recipe)
+        self.assertEqual(self.mask(), 0b111)
+        third.recipe_set.clear()
+        self.assertEqual(self.mask(), 1 << first.bit | 1 << second.bit)
+        first.delete()
+        self.assertEqual(self.mask(), 1 << second.bit)
+        self.recipe.tags.clear()
+        self.assertEqual(self.mask(), 0)
+
+
+@override_settings(IMAGE_RENDITION_WORKERS=0)
+class RecipeImageRenditionsTests(TestCase):
+    """Копии фотографий рецептов строятся после коммита."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def image_file(self, size=(2000, 1000), mode='RGB'):
+        buffer = BytesIO()
+        Image.new(mode, size, 'red').save(buffer, 'PNG')
+        return ContentFile(buffer.getvalue(), name='photo.png')
+
+    def create_recipe(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return create_recipe(self.author, image=self.image_file())
+
+    def test_renditions_are_built_after_commit(self):
+        recipe = self.create_recipe()
+        renditions = Recipe.objects.get(pk=recipe.pk).image_renditions
+        self.assertEqual(renditions['source'], recipe.image.name)
+        for name, (width, height) in RENDITIONS.items():
+            entry = renditions[name]
+            # Пропорции сохраняются, картинка вписана в рамку.
+            self.assertEqual(
+                (entry['width'], entry['height']), (width, width // 2)
+            )
+            for fmt in FORMATS:
+                with default_storage.open(entry[fmt]) as file:
+                    self.assertEqual(
+                        Image.open(file).size,
+                        (entry['width'], entry['height']),
+                    )
+        self.assertTrue(
+            renditions['lqip'].startswith('data:image/webp;base64,')
+        )
+        self.assertLess(len(renditions['lqip']), 1000)
+
+    def test_transparent_image_gets_jpeg_rendition(self):
+        source = default_storage.save(
+            'recipes/images/alpha.png', self.image_file((50, 50), 'RGBA')
+        )
+        renditions = build_renditions(source)
+        with default_storage.open(renditions['card']['jpeg']) as file:
+            self.assertEqual(Image.open(file).mode, 'RGB')
+        # Маленькая картинка не увеличивается.
+        self.assertEqual(renditions['detail']['width'], 50)
+
+    def test_stale_renditions_are_not_saved(self):
+        recipe = self.create_recipe()
+        renditions = build_renditions(recipe.image.name)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            image='recipes/images/new.png'
+        )
+        self.assertFalse(save_renditions(recipe.pk, renditions))
+
+    def test_saving_without_new_image_does_not_rebuild(self):
+        recipe = self.create_recipe()
+        with self.captureOnCommitCallbacks() as callbacks:
+            recipe.name = 'Новое название'
+            recipe.save(update_fields=['name', 'updated_at'])
+        self.assertFalse([
+            callback for callback in callbacks
+            if getattr(callback, 'func', None) is schedule_renditions
+        ])
+
+    def test_command_builds_missing_renditions(self):
+        recipe = self.create_recipe()
+        Recipe.objects.filter(pk=recipe.pk).update(image_renditions={})
+        call_command('build_image_renditions', stdout=StringIO())
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe.pk).image_renditions['source'],
+            recipe.image.name,
+        )
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Картинки с одинаковым содержимым хранятся одним файлом."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def png(self, color='red'):
+        buffer = BytesIO()
+        Image.new('RGB', (10, 10), color).save(buffer, 'PNG')
+        return ContentFile(buffer.getvalue(), name='temp.png')
+
+    def test_same_content_is_written_once(self):
+        first = create_recipe(self.author, image=self.png())
+        second = create_recipe(self.author, image=self.png())
+        other = create_recipe(self.author, image=self.png('blue'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, other.image.name)
+        digest = hashlib.sha256(self.png().read()).hexdigest()
+        self.assertEqual(
+            first.image.name, f'recipes/images/{digest[:2]}/{digest}.png'
+        )
+        _, files = image_storage.listdir(f'recipes/images/{digest[:2]}')
+        self.assertEqual(files, [f'{digest}.png'])
+
+    def test_existing_blob_is_not_rewritten(self):
+        name = image_storage.save('recipes/images/temp.png', self.png())
+        with mock.patch.object(
+            FileSystemStorage, '_save', side_effect=AssertionError
+        ):
+            self.assertEqual(
+                image_storage.save('recipes/images/other.png', self.png()),
+                name,
+            )
+
+    def test_reupload_refreshes_modified_time(self):
+        name = image_storage.save('recipes/images/temp.png', self.png())
+        path = image_storage.path(name)
+        os.utime(path, (0, 0))
+        image_storage.save('recipes/images/other.png', self.png())
+        self.assertGreater(os.path.getmtime(path), 0)
+
+    def test_reupload_after_snapshot_is_not_collected(self):
+        first = create_recipe(self.author, image=self.png())
+        name = first.image.name
+        first.delete()
+        os.utime(image_storage.path(name), (0, 0))
+        # Снимок используемых файлов взят до повторной загрузки.
+        values_list = Recipe.objects.values_list
+
+        def snapshot_then_upload(*args, **kwargs):
+            used = values_list(*args, **kwargs)
+            list(used)
+            create_recipe(self.author, image=self.png())
+            return used
+
+        with mock.patch.object(
+            Recipe.objects, 'values_list', side_effect=snapshot_then_upload
+        ):
+            call_command(
+                'collect_unused_images', '--min-age=60', stdout=StringIO()
+            )
+        self.assertTrue(image_storage.exists(name))
+
+    def test_shared_file_survives_delete_until_unused(self):
+        first = create_recipe(self.author, image=self.png())
+        second = create_recipe(self.author, image=self.png())
+        name = first.image.name
+        first.image.delete(save=False)
+        first.delete()
+        self.assertTrue(image_storage.exists(name))
+
+        call_command('collect_unused_images', '--min-age=0', stdout=StringIO())
+        self.assertTrue(image_storage.exists(name))
+        second.delete()
+        call_command('collect_unused_images', '--min-age=0', stdout=StringIO())
+        self.assertFalse(image_storage.exists(name))
+
+
+class ShoppingListTests(TestCase):
+    """Итоги списка покупок поддерживаются по изменениям корзины и рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+        cls.salt = Ingredient.objects.create(name='Соль', measurement_unit='г')
+        cls.eggs = Ingredient.objects.create(
+            name='Яйца', measurement_unit='шт'
+        )
+        cls.milk = Ingredient.objects.create(
+            name='Молоко', measurement_unit='мл'
+        )
+
+    def setUp(self):
+        self.omelette = create_recipe(
+            self.user,
+            ingredients={self.eggs: 3, self.milk: 100, self.salt: 2},
+        )
+        self.pancakes = create_recipe(
+            self.user, ingredients={self.eggs: 2, self.milk: 500}
+        )
+
+    def totals(self):
+        return dict(
+            ShoppingListItem.objects.filter(user=self.user)
+            .values_list('ingredient__name', 'amount')
+        )
+
+    def assertConsistent(self):
+        self.assertEqual(
+            shopping_lists.stored_totals(), shopping_lists.expected_totals()
+        )
+
+    def test_cart_changes_apply_deltas(self):
+        ShoppingCart.objects.create(author=self.user, recipe=self.omelette)
+        ShoppingCart.objects.create(author=self.user, recipe=self.pancakes)
+        self.assertEqual(self.totals(), {'Яйца': 5, 'Молоко': 600, 'Соль': 2})
+
+        ShoppingCart.objects.get(
+            author=self.user, recipe=self.omelette
+        ).delete()
+        # Строки с нулём удаляются.
+        self.assertEqual(self.totals(), {'Яйца': 2, 'Молоко': 500})
+        self.assertConsistent()
+
+    def test_add_recipe_increments_rows_created_concurrently(self):
+        # Строку успел вставить параллельный запрос: конфликт по
+        # unique_shopping_list_item превращается в прибавление.
+        ShoppingListItem.objects.create(
+            user=self.user, ingredient=self.eggs, amount=1
+        )
+        shopping_lists.add_recipe(self.user.id, self.omelette.id)
+        self.assertEqual(self.totals(), {'Яйца': 4, 'Молоко': 100, 'Соль': 2})
+
+    def test_recipe_edit_updates_lists_of_carts_holding_it(self):
+        ShoppingCart.objects.create(author=self.user, recipe=self.omelette)
+        ShoppingCart.objects.create(author=self.user, recipe=self.pancakes)
+        row = RecipeIngredient.objects.get(
+            recipe=self.pancakes, ingredient=self.milk
+        )
+        row.amount = 250
+        row.save()
+        RecipeIngredient.objects.get(
+            recipe=self.omelette, ingredient=self.salt
+        ).delete()
+        RecipeIngredient.objects.create(
+            recipe=self.pancakes, ingredient=self.salt, amount=1
+        )
+        self.assertEqual(self.totals(), {'Яйца': 5, 'Молоко': 350, 'Соль': 1})
+        self.assertConsistent()
+
+    def test_recipe_edit_splits_carts_over_parameter_limit(self):
+        for reader in create_users('reader', 5):
+            ShoppingCart.objects.create(author=reader, recipe=self.omelette)
+        row = RecipeIngredient.objects.get(
+            recipe=self.omelette, ingredient=self.milk
+        )
+        row.amount = 250
+        # По два id пользователей и ингредиентов на запрос: три пачки.
+        with mock.patch.object(connection.features, 'max_query_params', 4), \
+                CaptureQueriesContext(connection) as context:
+            row.save()
+        inserts = [
+            query for query in context.captured_queries
+            if query['sql'].startswith(
+                f'INSERT INTO {ShoppingListItem._meta.db_table}'
+            )
+        ]
+        self.assertEqual(len(inserts), 3)
+        self.assertConsistent()
+
+    def test_rebuild_overwrites_rows_inserted_concurrently(self):
+        ShoppingCart.objects.create(author=self.user, recipe=self.omelette)
+        ShoppingListItem.objects.filter(ingredient=self.eggs).update(amount=99)
+        # Строку после очистки успел вставить параллельный запрос.
+        with mock.patch('django.db.models.QuerySet.delete'):
+            shopping_lists.rebuild([self.user.id], [self.eggs.id])
+        self.assertEqual(self.totals(), {'Яйца': 3, 'Молоко': 100, 'Соль': 2})
+
+    def test_recipe_deletion(self):
+        ShoppingCart.objects.create(author=self.user, recipe=self.omelette)
+        ShoppingCart.objects.create(author=self.user, recipe=self.pancakes)
+        self.omelette.delete()
+        self.assertEqual(self.totals(), {'Яйца': 2, 'Молоко': 500})
+        self.assertConsistent()
+
+    def test_expected_totals_with_recipe_in_several_carts(self):
+        other = create_user('other')
+        ShoppingCart.objects.create(author=self.user, recipe=self.omelette)
+        ShoppingCart.objects.create(author=self.user, recipe=self.pancakes)
+        ShoppingCart.objects.create(author=other, recipe=self.omelette)
+        self.assertEqual(shopping_lists.expected_totals(), {
+            (self.user.id, self.eggs.id): 5,
+            (self.user.id, self.milk.id): 600,
+            (self.user.id, self.salt.id): 2,
+            (other.id, self.eggs.id): 3,
+            (other.id, self.milk.id): 100,
+            (other.id, self.salt.id): 2,
+        })
+        self.assertConsistent()
+
+    def test_recipe_deletion_query_count_does_not_depend_on_ingredients(self):
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(20)
+        ]
+        small = create_recipe(
+            self.user, ingredients=dict.fromkeys(ingredients[:2], 1)
+        )
+        large = create_recipe(
+            self.user, ingredients=dict.fromkeys(ingredients, 1)
+        )
+        for recipe in (small, large):
+            ShoppingCart.objects.create(author=self.user, recipe=recipe)
+            Favorite.objects.create(author=self.user, recipe=recipe)
+        with CaptureQueriesContext(connection) as queries:
+            small.delete()
+        with self.assertNumQueries(len(queries)):
+            large.delete()
+        self.assertConsistent()
+
+    def test_recipe_delete_through_api(self):
+        ShoppingCart.objects.create(author=self.user, recipe=self.omelette)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        # Сбор каскада, удаление, поисковый индекс и один пересчёт итогов;
+        # от числа ингредиентов и строк корзины не зависит.
+        with self.assertNumQueries(22):
+            response = client.delete(f'/api/recipes/{self.omelette.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.totals(), {})
+        self.assertFalse(
+            RecipeSimilarityBucket.objects.filter(
+                recipe_id=self.omelette.id
+            ).exists()
+        )
+        self.assertEqual(
+            search_recipes(Recipe.objects.all(), 'Рецепт').count(), 1
+        )
+
+    def test_ingredient_deletion_refreshes_recipes_once(self):
+        ShoppingCart.objects.create(author=self.user, recipe=self.omelette)
+        ShoppingCart.objects.create(author=self.user, recipe=self.pancakes)
+        with mock.patch(
+            'food.signals.similarity.update_recipes',
+            wraps=similarity.update_recipes,
+        ) as update_recipes:
+            self.eggs.delete()
+        update_recipes.assert_called_once()
+        self.assertEqual(
+            set(update_recipes.call_args.args[0]),
+            {self.omelette.id, self.pancakes.id},
+        )
+        self.assertEqual(self.totals(), {'Молоко': 600, 'Соль': 2})
+        self.assertConsistent()
+
+    def test_check_command_finds_and_fixes_drift(self):
+        ShoppingCart.objects.create(author=self.user, recipe=self.omelette)
+        ShoppingListItem.objects.filter(ingredient=self.eggs).update(amount=42)
+        out = StringIO()
+        call_command('check_shopping_lists', stdout=out)
+        self.assertIn('Расходится строк: 1', out.getvalue())
+        call_command('check_shopping_lists', '--fix', stdout=StringIO())
+        self.assertConsistent()
+        ShoppingListItem.objects.all().delete()
+        call_command('check_shopping_lists', '--rebuild', stdout=StringIO())
+        self.assertEqual(self.totals(), {'Яйца': 3, 'Молоко': 100, 'Соль': 2})
+
+
+class LoadIngredientsTests(TestCase):
+    """Команда load_ingredients: потоковая загрузка без дублей."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, name, content):
+        path = f'{self.directory}/{name}'
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def load(self, *args):
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                'load_ingredients', *args, '--batch-size', '2', stdout=out
+            )
+        return out.getvalue()
+
+    def catalog(self):
+        return sorted(
+            Ingredient.objects.values_list('name', 'measurement_unit')
+        )
+
+    def test_csv_is_idempotent(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        path = self.write(
+            'ingredients.csv',
+            'соль,г\nсахар,г\nмолоко,мл\nсахар,г\n,г\nбез единицы\n'
+            + 'x' * 65 + ',г\n',
+        )
+        output = self.load(path)
+        self.assertIn('добавлено 2', output)
+        self.assertIn('пропущено некорректных 3', output)
+        self.assertEqual(
+            self.catalog(), [('молоко', 'мл'), ('сахар', 'г'), ('соль', 'г')]
+        )
+        self.assertIn('добавлено 0', self.load(path))
+        self.assertEqual(Ingredient.objects.count(), 3)
+
+    def test_json_array_and_lines(self):
+        path = self.write(
+            'ingredients.json',
+            '[{"name": "мука", "measurement_unit": "г"},\n'
+            ' {"name": "яйца", "measurement_unit": "шт."}, 1]',
+        )
+        self.assertIn('добавлено 2', self.load(path))
+        path = self.write(
+            'ingredients.jsonl',
+            '{"name": "мука", "measurement_unit": "г"}\n'
+            '{"name": "мука", "measurement_unit": "кг"}\n',
+        )
+        self.assertIn('добавлено 1', self.load(path))
+        self.assertEqual(
+            self.catalog(), [('мука', 'г'), ('мука', 'кг'), ('яйца', 'шт.')]
+        )
+
+    def test_duplicates_are_rejected(self):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        with self.assertRaises(IntegrityError):
+            Ingredient.objects.create(name='соль', measurement_unit='г')
+
+
+class RecipeTransferTests(TestCase):
+    """Выгрузка export_recipes и загрузка import_recipes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.reader = create_users('user', 2)
+        Subscription.objects.create(user=cls.reader, author=cls.author)
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.flour = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        cls.eggs = Ingredient.objects.create(
+            name='яйца', measurement_unit='шт.'
+        )
+        cls.recipe = create_recipe(
+            cls.author,
+            name='Блины',
+            text='Жарить',
+            cooking_time=20,
+            image='recipes/images/pancakes.png',
+            tags=[cls.tag],
+            ingredients={cls.flour: 200, cls.eggs: 2},
+        )
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = f'{self.directory}/recipes.jsonl'
+        call_command('export_recipes', self.path, stdout=StringIO())
+
+    def test_export_record(self):
+        with open(self.path, encoding='utf-8') as file:
+            records = [json.loads(line) for line in file]
+        self.assertEqual(records, [{
+            'id': self.recipe.pk,
+            'name': 'Блины',
+            'text': 'Жарить',
+            'cooking_time': 20,
+            'image': 'recipes/images/pancakes.png',
+            'image_renditions': {},
+            'author': {
+                'email': 'user0@example.org',
+                'username': 'user0',
+                'first_name': 'Иван',
+                'last_name': 'Иванов',
+            },
+            'tags': [{'name': 'Завтрак', 'slug': 'breakfast'}],
+            'ingredients': [
+                {'name': 'мука', 'measurement_unit': 'г', 'amount': 200},
+                {'name': 'яйца', 'measurement_unit': 'шт.', 'amount': 2},
+            ],
+        }])
+
+    def test_import_restores_recipe_and_derived_data(self):
+        id_map = f'{self.directory}/ids.csv'
+        out = StringIO()
+        call_command(
+            'import_recipes', self.path, '--id-map', id_map, stdout=out
+        )
+        self.assertIn('Загружено 1 рецептов', out.getvalue())
+        copy = Recipe.objects.exclude(pk=self.recipe.pk).get()
+        with open(id_map, encoding='utf-8') as file:
+            self.assertEqual(file.read(), f'{self.recipe.pk},{copy.pk}\n')
+
+        self.assertEqual(copy.author, self.author)
+        self.assertEqual(copy.image.name, 'recipes/images/pancakes.png')
+        self.assertEqual(list(copy.tags.all()), [self.tag])
+        self.assertEqual(copy.tags_mask, 1 << self.tag.bit)
+        self.assertEqual(
+            sorted(copy.recipe_ingredients.values_list(
+                'ingredient_id', 'amount'
+            )),
+            [(self.flour.pk, 200), (self.eggs.pk, 2)],
+        )
+        self.assertEqual(Ingredient.objects.count(), 2)
+        self.assertEqual(
+            search_recipes(Recipe.objects.all(), 'блины').count(), 2
+        )
+        self.assertEqual(
+            AuthorStats.objects.get(pk=self.author.pk).recipes_count, 2
+        )
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.reader, recipe=copy).exists()
+        )
+        similar = similarity.similar_recipes(self.recipe.pk, 5)
+        self.assertEqual([recipe_id for recipe_id, _ in similar], [copy.pk])
+
+    def test_unknown_authors(self):
+        Recipe.objects.all().delete()
+        self.author.delete()
+        out = StringIO()
+        call_command('import_recipes', self.path, stdout=out)
+        self.assertIn('Загружено 0 рецептов', out.getvalue())
+        self.assertIn('неизвестных авторов: 1', out.getvalue())
+
+        call_command(
+            'import_recipes', self.path, '--create-authors', stdout=out
+        )
+        author = User.objects.get(email='user0@example.org')
+        self.assertFalse(author.has_usable_password())
+        self.assertEqual(Recipe.objects.get().author, author)
+        self.assertEqual(author.stats.recipes_count, 1)
+
+
+class SyntheticDataTests(TestCase):
+    """Генератор generate_synthetic_data и прогон benchmark_endpoints."""
+
+    options = {
+        'users': 12, 'recipes': 40, 'favorites': 3, 'carts': 2,
+        'subscriptions': 2, 'ingredients_per_recipe': 3, 'tags': 3,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(20):
+            Ingredient.objects.create(
+                name=f'ингредиент {i}', measurement_unit='г'
+            )
+
+    def generate(self, prefix):
+        return Generator(
+            prefix=prefix, seed=7, batch_size=10, **self.options
+        ).run()
+
+    def recipes(self, prefix):
+        return [
+            (
+                recipe.name,
+                recipe.cooking_time,
+                sorted(recipe.recipe_ingredients.values_list(
+                    'ingredient_id', 'amount'
+                )),
+            )
+            for recipe in Recipe.objects.filter(
+                author__username__startswith=f'{prefix}-'
+            ).order_by('id')
+        ]
+
+    def test_same_seed_same_data(self):
+        first = self.generate('first')
+        second = self.generate('second')
+        self.assertEqual(first, {
+            'users': 12, 'recipes': 40, 'favorites': first['favorites'],
+            'carts': first['carts'], 'subscriptions': first['subscriptions'],
+        })
+        linked = ('favorites', 'carts', 'subscriptions')
+        self.assertEqual(
+            [second[name] - first[name] for name in linked],
+            [first[name] for name in linked],
+        )
+        self.assertEqual(self.recipes('first'), self.recipes('second'))
+
+    def test_derived_data_is_consistent(self):
+        self.generate('synthetic')
+        self.assertEqual(author_stats.rebuild(only_wrong=True), 0)
+        self.maxDiff = None
+        self.assertEqual(
+            shopping_lists.expected_totals(), shopping_lists.stored_totals()
+        )
+        for recipe in Recipe.objects.all():
+            self.assertEqual(
+                recipe.favorites_count,
+                Favorite.objects.filter(recipe=recipe).count(),
+            )
+            self.assertEqual(
+                bool(recipe.tags_mask), recipe.tags.exists()
+            )
+        expected = {
+            (subscription.user_id, recipe_id)
+            for subscription in Subscription.objects.all()
+            for recipe_id in Recipe.objects.filter(
+                author_id=subscription.author_id
+            ).values_list('id', flat=True)
+        }
+        self.assertEqual(
+            set(FeedEntry.objects.values_list('user_id', 'recipe_id')),
+            expected,
+        )
+
+    def test_benchmark_endpoints(self):
+        self.generate('synthetic')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        output = f'{directory}/run.json'
+        call_command(
+            'benchmark_endpoints', '--requests', '2', '--warmup', '0',
+            '--output', output, stdout=StringIO(), stderr=StringIO(),
+        )
+        with open(output, encoding='utf-8') as file:
+            run = json.load(file)
+        self.assertEqual(run['meta']['data']['recipes'], 40)
+        self.assertEqual(set(run['endpoints']), {
+            'recipes_list', 'recipes_list_tags', 'recipes_list_favorited',
+            'recipes_list_in_cart', 'recipe_detail', 'subscriptions',
+            'download_shopping_cart', 'ingredient_search', 'short_link',
+        })
+        for name, result in run['endpoints'].items():
+            self.assertTrue(
+                all(int(status) < 400 for status in result['statuses']), name
+            )
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+        out = StringIO()
+        call_command(
+            'benchmark_endpoints', '--requests', '2', '--warmup', '0',
+            '--only', 'short_link', '--compare', output, stdout=out,
+        )
+        self.assertIn('short_link', out.getvalue().split('Сравнение')[1])
@@ -0,0 +1,39 @@
+"""Общие заготовки данных для тестов приложений api и food."""
+from food.models import Recipe, RecipeIngredient
+from users.models import User
+
+PASSWORD = 'password'
+IMAGE = 'recipes/images/test.png'
+
+
+def create_user(username, **fields):
+    """Пользователь username с адресом username@example.org."""
+    fields = {'first_name': 'Иван', 'last_name': 'Иванов', **fields}
+    return User.objects.create_user(
+        email=f'{username}@example.org',
+        username=username,
+        password=PASSWORD,
+        **fields,
+    )
+
+
+def create_users(prefix, count):
+    """Пользователи prefix0, prefix1, … в порядке id."""
+    return [create_user(f'{prefix}{i}') for i in range(count)]
+
+
+def create_recipe(author, name='Рецепт', tags=(), ingredients=None, **fields):
+    """Рецепт через save(), чтобы отработали сигналы.
+
+    ingredients — {ингредиент: количество}; строки создаются по одной,
+    как при обычном сохранении.
+    """
+    fields = {'text': 'Описание', 'cooking_time': 10, 'image': IMAGE, **fields}
+    recipe = Recipe.objects.create(author=author, name=name, **fields)
+    if tags:
+        recipe.tags.set(tags)
+    for ingredient, amount in (ingredients or {}).items():
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=amount
+        )
+    return recipe
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.16 on 2026-10-16 22:47
+
+from django.db import migrations, models
+import food.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_alter_user_username'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=food.storage.get_image_storage, upload_to='users/', verbose_name='Аватар'),
+        ),
+    ]
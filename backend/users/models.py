@@ -2,6 +2,8 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
 
+from food.storage import get_image_storage
+
 class User(AbstractUser):
 
     USERNAME_FIELD = 'email'
@@ -48,7 +50,11 @@ class User(AbstractUser):
         default=False,
         verbose_name='Подписка'
     )
-    avatar = models.ImageField(verbose_name='Аватар', upload_to='users/', blank=True, null=True)
+    # Имя файла — хэш содержимого, одинаковые картинки хранятся один раз.
+    avatar = models.ImageField(
+        verbose_name='Аватар', upload_to='users/', blank=True, null=True,
+        storage=get_image_storage,
+    )
 
     class Meta:
         verbose_name = 'Пользователь'